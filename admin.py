@@ -4,6 +4,10 @@ import sys
 import time
 import datetime
 import csv
+import gzip
+import json
+import argparse
+from contextlib import closing
 
 # Ensure database migrations are run
 try:
@@ -13,6 +17,7 @@ except ImportError:
 
 # Configuration
 DB_FILE = 'ai_database.db'
+DB_SHARDS = int(os.getenv("VYOM_DB_SHARDS", "1")) # Must match the app's setting
 
 # ANSI Colors for CLI
 class Colors:
@@ -29,41 +34,64 @@ class Colors:
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
-def get_db_connection():
-    if not os.path.exists(DB_FILE):
-        print(f"{Colors.FAIL}Error: Database file '{DB_FILE}' not found.{Colors.ENDC}")
+def shard_paths():
+    """Every database file in the current layout (just DB_FILE unless sharded)."""
+    try:
+        from vyom.core import storage
+    except ImportError:
+        return [DB_FILE]
+    return storage.shard_files(DB_FILE, DB_SHARDS)
+
+def get_db_connection(path=None):
+    path = path or shard_paths()[0]
+    if not os.path.exists(path):
+        print(f"{Colors.FAIL}Error: Database file '{path}' not found.{Colors.ENDC}")
         sys.exit(1)
-    conn = sqlite3.connect(DB_FILE)
+    conn = sqlite3.connect(path)
     conn.row_factory = sqlite3.Row
     return conn
 
+def iter_connections():
+    """One connection per shard, in shard order. `with conn:` only ends the transaction: close them too."""
+    for path in shard_paths():
+        yield get_db_connection(path)
+
+def _shard_for(key):
+    from vyom.core import storage
+    return storage.shard_index(key, len(shard_paths()))
+
 def format_time(timestamp):
     return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
 
 # --- ACTIONS ---
 
 def view_dashboard():
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Total Users
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        
-        # Total Chats
-        cursor.execute("SELECT COUNT(*) FROM chats")
-        total_chats = cursor.fetchone()[0]
-        
-        # Total Messages
-        cursor.execute("SELECT COUNT(*) FROM messages")
-        total_msgs = cursor.fetchone()[0]
-        
-        # Gender Distribution
-        try:
-            cursor.execute("SELECT gender, COUNT(*) FROM users GROUP BY gender")
-            gender_stats = cursor.fetchall()
-        except:
-            gender_stats = []
+    total_users = total_chats = total_msgs = 0
+    genders = {}
+    for conn in iter_connections():
+        with closing(conn), conn:
+            cursor = conn.cursor()
+
+            # Total Users
+            cursor.execute("SELECT COUNT(*) FROM users")
+            total_users += cursor.fetchone()[0]
+
+            # Total Chats
+            cursor.execute("SELECT COUNT(*) FROM chats")
+            total_chats += cursor.fetchone()[0]
+
+            # Total Messages
+            cursor.execute("SELECT COUNT(*) FROM messages")
+            total_msgs += cursor.fetchone()[0]
+
+            # Gender Distribution
+            try:
+                cursor.execute("SELECT gender, COUNT(*) FROM users GROUP BY gender")
+                for g, count in cursor.fetchall():
+                    genders[g] = genders.get(g, 0) + count
+            except:
+                pass
+    gender_stats = sorted(genders.items(), key=lambda item: str(item[0]))
 
     print(f"\n{Colors.HEADER}--- SYSTEM DASHBOARD ---{Colors.ENDC}")
     print(f"Total Users:    {Colors.GREEN}{total_users}{Colors.ENDC}")
@@ -78,14 +106,17 @@ def view_dashboard():
     print("-" * 30)
 
 def list_users():
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT name, email, gender, created, device_id FROM users ORDER BY created DESC")
-            users = cursor.fetchall()
-        except sqlite3.OperationalError as e:
-            print(f"{Colors.FAIL}Error reading users: {e}{Colors.ENDC}")
-            return
+    users = []
+    for conn in iter_connections():
+        with closing(conn), conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT name, email, gender, created, device_id FROM users ORDER BY created DESC")
+                users.extend(cursor.fetchall())
+            except sqlite3.OperationalError as e:
+                print(f"{Colors.FAIL}Error reading users: {e}{Colors.ENDC}")
+                return
+    users.sort(key=lambda u: u['created'], reverse=True)
 
     if not users:
         print(f"{Colors.WARNING}No users found.{Colors.ENDC}")
@@ -108,11 +139,13 @@ def find_user():
     search = input(f"{Colors.BLUE}Enter Name or Email to search: {Colors.ENDC}").strip()
     if not search: return
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        query = f"%{search}%"
-        cursor.execute("SELECT * FROM users WHERE name LIKE ? OR email LIKE ?", (query, query))
-        results = cursor.fetchall()
+    results = []
+    query = f"%{search}%"
+    for conn in iter_connections():
+        with closing(conn), conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM users WHERE name LIKE ? OR email LIKE ?", (query, query))
+            results.extend(cursor.fetchall())
 
     if not results:
         print(f"{Colors.WARNING}No matching users found.{Colors.ENDC}")
@@ -130,7 +163,8 @@ def delete_user():
     user_id = input(f"{Colors.WARNING}Enter DEVICE ID to delete (or 'c' to cancel): {Colors.ENDC}").strip()
     if user_id.lower() == 'c' or not user_id: return
 
-    with get_db_connection() as conn:
+    path = shard_paths()[_shard_for(user_id)] if DB_SHARDS > 1 else None
+    with closing(get_db_connection(path)) as conn, conn:
         # Check if exists
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM users WHERE device_id = ?", (user_id,))
@@ -148,29 +182,231 @@ def delete_user():
             # Delete
             cursor.execute("DELETE FROM users WHERE device_id = ?", (user_id,))
             conn.commit()
+            # Log out every device linked to the account (they may sit in other shards)
+            for other in iter_connections():
+                with closing(other), other:
+                    other.execute("DELETE FROM devices WHERE account_id = ?", (user_id,))
             print(f"{Colors.GREEN}User deleted successfully.{Colors.ENDC}")
         else:
             print("Deletion cancelled.")
 
 def export_csv():
-    filename = f"users_export_{int(time.time())}.csv"
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users")
-        rows = cursor.fetchall()
-        
+    # Streams through export_table instead of loading the whole table
+    export_table("users", "csv", path=f"users_export_{int(time.time())}.csv")
+
+# --- BULK EXPORT / IMPORT ---
+# Streams rows in fixed-size chunks, so memory stays flat however big the database is.
+
+EXPORT_TABLES = ("users", "devices", "chats", "messages")
+CHUNK_SIZE = 1000
+
+def _open_file(path, mode, use_gzip=None):
+    if use_gzip is None:
+        use_gzip = path.endswith('.gz')
+    if use_gzip:
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+def _detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+def _iter_table(conn, table):
+    """Yields (columns, chunk) pairs using a fetchmany cursor."""
+    cursor = conn.execute(f"SELECT * FROM {table}")
+    columns = [d[0] for d in cursor.description]
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
         if not rows:
-            print("No data to export.")
+            break
+        yield columns, [tuple(r) for r in rows]
+
+    # Messages of archived chats live in compressed blobs; export them as plain rows
+    if table == "messages":
+        try:
+            from vyom.core import archive
+            archives = conn.execute("SELECT chat_id, codec, data FROM chat_archives")
+        except (ImportError, sqlite3.OperationalError):
             return
+        while True:
+            blobs = archives.fetchmany(50)
+            if not blobs:
+                break
+            for chat_id, codec, data in blobs:
+                # Same columns as the live rows (a CSV has one header); archives don't keep
+                # token counts, which are recounted when the messages are read
+                rows = [
+                    tuple(dict(id=m[0], chat_id=chat_id, role=m[1], content=m[2], timestamp=m[3]).get(c) for c in columns)
+                    for m in archive.unpack(data, codec)
+                ]
+                yield columns, rows
 
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            # Write headers
-            writer.writerow([description[0] for description in cursor.description])
-            # Write data
-            writer.writerows(rows)
-    
-    print(f"{Colors.GREEN}Successfully exported to {filename}{Colors.ENDC}")
+def export_table(table, fmt='ndjson', use_gzip=False, path=None):
+    """Streams one table to NDJSON or CSV (optionally gzipped). Returns (rows, seconds)."""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}'. Choose from: {', '.join(EXPORT_TABLES)}")
+    ext = 'csv' if fmt == 'csv' else 'ndjson'
+    path = path or f"{table}_export_{int(time.time())}.{ext}" + (".gz" if use_gzip else "")
+
+    start = time.perf_counter()
+    count = 0
+    with _open_file(path, 'w', use_gzip) as f:
+        writer = csv.writer(f) if fmt == 'csv' else None
+        header_written = False
+        for conn in iter_connections():
+            with closing(conn), conn:
+                for columns, rows in _iter_table(conn, table):
+                    if writer:
+                        if not header_written:
+                            writer.writerow(columns)
+                            header_written = True
+                        writer.writerows(rows)
+                    else:
+                        f.write("".join(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in rows))
+                    count += len(rows)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else count
+    print(f"{Colors.GREEN}Exported {count:,} {table} rows to {path} in {elapsed:.2f}s ({rate:,.0f} rows/s){Colors.ENDC}")
+    return count, elapsed
+
+def _read_chunks(f, fmt, nullable):
+    """Yields (columns, chunk) pairs from an NDJSON or CSV stream."""
+    chunk, columns = [], None
+    if fmt == 'csv':
+        reader = csv.reader(f)
+        columns = next(reader, None)
+        if not columns:
+            return
+        for record in reader:
+            # CSV has no NULL: empty strings go back to NULL where the column allows it
+            chunk.append(tuple(None if (v == '' and c in nullable) else v for c, v in zip(columns, record)))
+            if len(chunk) >= CHUNK_SIZE:
+                yield columns, chunk
+                chunk = []
+    else:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if columns is None:
+                columns = list(record.keys())
+            chunk.append(tuple(record.get(c) for c in columns))
+            if len(chunk) >= CHUNK_SIZE:
+                yield columns, chunk
+                chunk = []
+    if chunk:
+        yield columns, chunk
+
+def _route_rows(conns, table, columns, rows):
+    """Groups a chunk by owning shard: users/devices by device_id, chats by user_id, messages by their chat's shard."""
+    if len(conns) == 1:
+        return {0: rows}
+    routed = {}
+    if table == "messages":
+        # Messages carry no user id; find which shard holds each chat
+        chat_col = columns.index("chat_id")
+        chat_ids = list({r[chat_col] for r in rows})
+        owner = {}
+        for index, conn in enumerate(conns):
+            for start in range(0, len(chat_ids), 500):
+                batch = chat_ids[start:start + 500]
+                marks = ", ".join("?" * len(batch))
+                for row in conn.execute(f"SELECT id FROM chats WHERE id IN ({marks})", batch):
+                    owner[row[0]] = index
+        for r in rows:
+            # Messages for unknown chats would be rejected by the foreign key anyway
+            if r[chat_col] in owner:
+                routed.setdefault(owner[r[chat_col]], []).append(r)
+        return routed
+    key_col = columns.index("user_id" if table == "chats" else "device_id")
+    for r in rows:
+        routed.setdefault(_shard_for(r[key_col]), []).append(r)
+    return routed
+
+def import_table(table, path, fmt=None):
+    """Streams NDJSON/CSV rows into `table` with one executemany transaction per chunk. Returns (rows, seconds)."""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}'. Choose from: {', '.join(EXPORT_TABLES)}")
+    fmt = fmt or _detect_format(path)
+
+    start = time.perf_counter()
+    count = 0
+    conns = list(iter_connections())
+    try:
+        with _open_file(path, 'r') as f:
+            for conn in conns:
+                conn.execute("PRAGMA foreign_keys = ON")
+            table_info = conns[0].execute(f"PRAGMA table_info({table})").fetchall()
+            known = {col['name'] for col in table_info}
+            nullable = {col['name'] for col in table_info if not col['notnull']}
+            for columns, rows in _read_chunks(f, fmt, nullable):
+                unknown = set(columns) - known
+                if unknown:
+                    raise ValueError(f"Columns not in '{table}': {', '.join(sorted(unknown))}")
+                placeholders = ", ".join("?" * len(columns))
+                for index, shard_rows in _route_rows(conns, table, columns, rows).items():
+                    conns[index].executemany(
+                        f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                        shard_rows
+                    )
+                    conns[index].commit()
+                count += len(rows)
+    finally:
+        for conn in conns:
+            conn.close()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else count
+    print(f"{Colors.GREEN}Imported {count:,} {table} rows from {path} in {elapsed:.2f}s ({rate:,.0f} rows/s){Colors.ENDC}")
+    return count, elapsed
+
+def export_data():
+    table = input(f"{Colors.BLUE}Table to export ({'/'.join(EXPORT_TABLES)}) [messages]: {Colors.ENDC}").strip() or "messages"
+    fmt = input(f"{Colors.BLUE}Format (ndjson/csv) [ndjson]: {Colors.ENDC}").strip().lower() or "ndjson"
+    use_gzip = input(f"{Colors.BLUE}Gzip? (y/n) [y]: {Colors.ENDC}").strip().lower() != 'n'
+    try:
+        export_table(table, fmt, use_gzip)
+    except ValueError as e:
+        print(f"{Colors.FAIL}{e}{Colors.ENDC}")
+
+def import_data():
+    table = input(f"{Colors.BLUE}Table to import into ({'/'.join(EXPORT_TABLES)}): {Colors.ENDC}").strip()
+    path = input(f"{Colors.BLUE}File (.ndjson/.csv, optionally .gz): {Colors.ENDC}").strip()
+    if not os.path.exists(path):
+        print(f"{Colors.FAIL}File not found.{Colors.ENDC}")
+        return
+    try:
+        import_table(table, path)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"{Colors.FAIL}Import failed: {e}{Colors.ENDC}")
+
+def run_cli(argv):
+    """Non-interactive entry point: `python admin.py export|import ...`."""
+    parser = argparse.ArgumentParser(prog="admin.py", description="Vyom AI admin tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="Stream a table to NDJSON/CSV")
+    exp.add_argument("table", choices=EXPORT_TABLES)
+    exp.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    exp.add_argument("--gzip", action="store_true")
+    exp.add_argument("-o", "--output")
+
+    imp = sub.add_parser("import", help="Stream NDJSON/CSV rows into a table (import users, devices, chats, then messages)")
+    imp.add_argument("table", choices=EXPORT_TABLES)
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=("ndjson", "csv"))
+
+    rs = sub.add_parser("reshard", help="Copy the database into a new shard count (set VYOM_DB_SHARDS afterwards)")
+    rs.add_argument("old_shards", type=int)
+    rs.add_argument("new_shards", type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        export_table(args.table, args.format, args.gzip, args.output)
+    elif args.command == "import":
+        import_table(args.table, args.path, args.format)
+    else:
+        from vyom.core import storage
+        storage.reshard(DB_FILE, args.old_shards, args.new_shards)
 
 # --- MAIN LOOP ---
 
@@ -192,6 +428,8 @@ def main():
         print("3. Find User (by Name/Email)")
         print("4. Delete User")
         print("5. Export Users to CSV")
+        print("6. Export Data (Users/Chats/Messages, NDJSON/CSV)")
+        print("7. Import Data")
         print("q. Exit")
         
         choice = input(f"\n{Colors.BLUE}vyom-admin> {Colors.ENDC}").strip().lower()
@@ -206,6 +444,10 @@ def main():
             delete_user()
         elif choice == '5':
             export_csv()
+        elif choice == '6':
+            export_data()
+        elif choice == '7':
+            import_data()
         elif choice == 'q' or choice == 'exit':
             print("Goodbye.")
             break
@@ -213,6 +455,9 @@ def main():
             print("Invalid choice.")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_cli(sys.argv[1:])
+        sys.exit(0)
     try:
         main()
     except KeyboardInterrupt:
@@ -1,8 +1,13 @@
 import os
 import sys
 import re
+import json
 import datetime
-from flask import Flask, request, jsonify, send_from_directory, Response, render_template
+import functools
+import hmac
+import time
+from contextlib import contextmanager
+from flask import Flask, request, jsonify, send_from_directory, Response, render_template, g, stream_with_context
 from werkzeug.utils import secure_filename
 
 # --- 1. CONFIGURATION & SELECTION ---
@@ -47,11 +52,75 @@ from vyom.core import internet
 from vyom.core import file_reader
 from vyom.core.optimizer import performance
 from vyom.core import device_manager # 📱 New Device Manager
+from vyom.core.query_cache import classify_freshness
+from vyom.core import metrics # 📊 Prometheus-style metrics
+from vyom.core import tracing # 🔍 Per-request spans
+from vyom.core.context_builder import context_builder # 🧠 Token-budgeted chat memory
+
+# 🗄️ Move long-idle chats into compressed cold storage (runs every few hours)
+history_manager.start_archiver()
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+
+# Routes not worth a trace of their own
+UNTRACED_ENDPOINTS = ('static', 'prometheus_metrics', 'debug_trace')
+
+
+# 📊 Latency of every route, and how each /ask got answered
+# 🔍 Each request is also a trace (server-generated id, sent back in X-Trace-Id)
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    if request.endpoint not in UNTRACED_ENDPOINTS:
+        # A client's own X-Trace-Id is kept as an attribute only, never as the id other requests are filed under
+        client_id = request.headers.get('X-Trace-Id')
+        attrs = {'client_trace_id': client_id} if tracing.is_trace_id(client_id) else {}
+        g.trace = tracing.start_trace(f"{request.method} {request.path}", **attrs)
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUESTS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method, status=response.status_code)
+    if 'ask_outcome' in g:
+        metrics.ASK_REQUESTS.inc(engine=_engine_label(g.get('ask_engine', 'none')), outcome=g.ask_outcome)
+    trace = g.get('trace')
+    if trace is not None:
+        trace.set(status=response.status_code, outcome=g.get('ask_outcome'), engine=g.get('ask_engine'))
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+
+@app.teardown_request
+def _finish_request_trace(error=None):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        trace.finish(error=error)
+
+
+@contextmanager
+def _ask_stage(name, engine):
+    """One /ask stage: a trace span plus the vyom_ask_stage_seconds histogram."""
+    with tracing.span(name), metrics.ASK_STAGE.time(stage=name, engine=_engine_label(engine)):
+        yield
+
+
+@contextmanager
+def _engine_call(engine, model):
+    """One engine call: a trace span plus the vyom_engine_seconds histogram."""
+    with tracing.span(f"engine.{engine}", model=model), \
+            metrics.ENGINE_CALLS.time(engine=_engine_label(engine), model=metrics.bounded(model, METRIC_MODELS)):
+        yield
+
+
+def _engine_label(engine):
+    return metrics.bounded(engine, METRIC_ENGINES)
+
 # Available engines and models (served to frontend)
 AVAILABLE_ENGINES = {
     "general": {"display": "Default", "models": ["gemini-2.5-flash", "gemini-2.0-flash", "gemini-2.5-pro"]},
@@ -62,6 +131,208 @@ AVAILABLE_ENGINES = {
     "image": {"display": "Image", "models": ["realistic", "anime", "digital", "painting", "3d-model"]}
 }
 
+# Engines answered by the Trinity System
+TRINITY_ENGINES = ('general', 'coding', 'math', 'reasoning', 'trinity')
+
+# 📊 Label values the metrics accept; engine/model names sent by clients are "other" otherwise
+METRIC_ENGINES = frozenset(AVAILABLE_ENGINES) | {'web', 'visual_studio', 'none'}
+METRIC_MODELS = frozenset(m for e in AVAILABLE_ENGINES.values() for m in e['models']) | {
+    'auto', 'thinking', 'duckduckgo', 'generative', 'blur', 'sharpen', 'grayscale', 'contour'
+}
+
+
+def _engine_api_key(settings, user_profile):
+    """The user's BYOK or saved API key for the engines, if any."""
+    api_override = settings.get('api_key') or (user_profile and user_profile.get('api_key'))
+    if not api_override and user_profile and user_profile.get('api_keys'):
+        try:
+            api_override = next(iter(user_profile.get('api_keys').values()))
+        except StopIteration:
+            api_override = None
+    return api_override
+
+
+def _live_answer(msg):
+    """A 🌐 Live Intelligence answer straight from web search (None if the search found nothing)."""
+    with _engine_call(engine='web', model='duckduckgo'):
+        search_res = internet.search_google(msg)
+    if not search_res:
+        return None
+    return f"### 🌐 Live Intelligence\n*Browsing the real-time web to provide you the most accurate and latest data.*\n\n{search_res}\n\n---\n*Note: This information was fetched directly from live sources for maximum reliability.*"
+
+
+def _answer_refresher(msg, engine, model):
+    """
+    Background refresh for a stale cached answer, or None if it can't be regenerated safely.
+    Shared cache entries are regenerated with the system keys, never with the asking user's own key,
+    and without chat history: answers that depended on a chat's history are never cached.
+    """
+    if engine == 'general' and classify_freshness(msg) == 'live':
+        return lambda: performance.coalesce(msg, lambda: _live_answer(msg), engine='web')
+    if engine in TRINITY_ENGINES:
+        def _regenerate():
+            from vyom.engines import trinity as trinity_engine
+            def _call():
+                with _engine_call(engine=engine, model=model or 'auto'):
+                    return trinity_engine.generate_response(msg, engine_type=engine, history=[], model=model)
+            answer = performance.coalesce(msg, _call, engine=engine, model=model)
+            # Answers that trigger [[ACTIONS]] are never re-run behind the user's back
+            return None if re.search(r"\[\[(.*?)\]\]", answer or "") else answer
+        return _regenerate
+    return None
+
+
+def _queue_exchange(device_id, chat_id, msg, answer, engine):
+    """⚡ Background save of one question/answer pair (no-op without a chat)."""
+    if not (chat_id and device_id):
+        return
+    with _ask_stage('history', engine):
+        history_manager.queue_chat_message(device_id, chat_id, msg, role="user")
+        history_manager.queue_chat_message(device_id, chat_id, answer, role="assistant")
+
+
+def _finish_llm_answer(msg, raw_answer, engine, input_mode, user_profile, device_id, chat_id, cacheable=True):
+    """
+    A fresh LLM answer's post-processing: [[ACTION]] tags, cache fill, voice and history save. Returns the final answer.
+    `cacheable=False` (answers made with the user's own API key or from the chat's history) skips the shared cache.
+    """
+    # 2.5 AI-Driven Automation Check
+    # Look for [[ACTION:PARAM]] tags in the AI's response
+    cmd_match = re.search(r"\[\[(.*?)\]\]", raw_answer)
+    if cmd_match:
+        command_tag = cmd_match.group(0) # The full [[...]]
+        command_content = cmd_match.group(1) # The inside part
+    
+        # Execute the command found by the AI
+        print(f"🤖 AI Requested Command: {command_content}")
+        with _ask_stage('actions', engine):
+            exec_result = automation.execute(command_content)
+    
+        # Clean the answer for the user (remove the tag)
+        raw_answer = raw_answer.replace(command_tag, "").strip()
+    
+        # Optionally append the execution result if it's meaningful info
+        if exec_result and "Opening" not in raw_answer: 
+             # If the AI didn't say "Opening...", we append the system status
+             raw_answer += f"\n\n_{exec_result}_"
+
+    # 3. Finalize & Cache
+    # ⚡ Cache it for 9999x speed on next hit
+    if cacheable:
+        with _ask_stage('cache_write', engine):
+            performance.cache_response(msg, raw_answer, engine=engine)
+
+    # Clean answer for voice
+    voice_text = raw_answer
+    if "<answer>" in raw_answer:
+        try:
+            voice_text = raw_answer.split("<answer>")[1].split("</answer>")[0].strip()
+        except:
+            voice_text = raw_answer # Fallback
+
+    # Voice (Smart Mode)
+    # Only speak automatically if input was Voice
+    if input_mode == 'voice':
+        gender = user_profile.get('gender') if user_profile else None
+        with _ask_stage('tts', engine):
+            voice_engine.speak_text(voice_text, gender=gender)
+
+    # ⚡ Background History Save
+    _queue_exchange(device_id, chat_id, msg, raw_answer, engine)
+
+    # ⚡ Memory Cleanup
+    performance.submit("maintenance", performance.optimize_memory)
+    return raw_answer
+
+
+def _sse(event, payload):
+    """One server-sent event; data is JSON so newlines in the answer can't break the framing."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _stream_llm_answer(chunks, engine, model, finish, mood):
+    """
+    ⚡ /ask/stream response: a `chunk` event per piece of text as the model produces it, then
+    `done` with the post-processed answer ([[ACTION]] tags removed), which replaces the chunks.
+    If the model fails mid-answer the stream ends with an `error` event instead, and the partial
+    answer is neither cached nor saved to the chat.
+    """
+    from vyom.engines.trinity import StreamInterrupted
+    requested_at = g.get('request_started', time.perf_counter())
+    # Teardown runs before the body is sent, so the stream finishes the trace itself
+    trace = g.pop('trace', None)
+
+    def generate():
+        parts = []
+        error = None
+        outcome = 'llm_stream'
+        try:
+            with tracing.linked(trace.context if trace else None, 'stream'):
+                with _ask_stage('llm', engine), _engine_call(engine=engine, model=model or 'auto'):
+                    for text in chunks:
+                        if not parts:
+                            metrics.ASK_TTFB.observe(time.perf_counter() - requested_at, engine=_engine_label(engine))
+                        parts.append(text)
+                        yield _sse('chunk', {"text": text})
+                answer = finish("".join(parts))
+            # after_request has already run by now, so the outcome is recorded here
+            metrics.ASK_REQUESTS.inc(engine=_engine_label(engine), outcome=outcome)
+            yield _sse('done', {"answer": answer, "mood": mood.lower()})
+        except StreamInterrupted as e:
+            error, outcome = e, 'llm_stream_error'
+            metrics.ASK_REQUESTS.inc(engine=_engine_label(engine), outcome=outcome)
+            yield _sse('error', {"error": "The answer was cut off. Please try again."})
+        except BaseException as e: # Includes the client going away (GeneratorExit)
+            error = e
+            raise
+        finally:
+            if trace is not None:
+                trace.set(status=200, engine=engine, outcome=outcome)
+                trace.finish(error=error)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if trace is not None:
+        headers['X-Trace-Id'] = trace.trace_id
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+def _admin_only(view):
+    """
+    🔒 Operator routes (metrics, traces): need `Authorization: Bearer <VYOM_ADMIN_TOKEN>`.
+    Without a token configured, only direct requests from this machine get in (not proxied ones).
+    """
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        token = os.getenv('VYOM_ADMIN_TOKEN')
+        if token:
+            sent = request.headers.get('Authorization', '')
+            allowed = hmac.compare_digest(sent.encode(), f"Bearer {token}".encode())
+        else:
+            allowed = request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+        if not allowed:
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return guarded
+
+
+@app.route('/metrics')
+@_admin_only
+def prometheus_metrics():
+    """📊 Counters, gauges and latency histograms in Prometheus text format."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/debug/trace/<trace_id>')
+@_admin_only
+def debug_trace(trace_id):
+    """🔍 Waterfall of one request's spans (?format=json for the raw spans)."""
+    spans = tracing.get_trace(trace_id) # [] for malformed ids, without touching the files
+    if not spans:
+        return jsonify({"error": "Trace not found"}), 404
+    if request.args.get('format') == 'json':
+        return jsonify({"trace_id": trace_id, "spans": spans})
+    return render_template('trace.html', trace_id=trace_id, rows=tracing.waterfall(spans))
+
 
 @app.route('/models', methods=['GET'])
 def get_models():
@@ -137,14 +408,12 @@ def user_login():
     email = data.get('email')
     device_id = data.get('device_id')
     
-    # Simple search by email in all users
-    all_users = history_manager.get_all_users() # Assuming this exists or we use device_id
-    # For this system, we link device_id to user. 
-    # Let's find user by email and then link the new device_id to them.
+    # For this system, we link device_id to user.
+    # Find the user by email (indexed lookup) and then link the new device_id to them.
     user = history_manager.find_user_by_email(email)
     if user:
     
-        # Link current device to this user if it's different
+        # Log this device in to the account (one insert into `devices`)
         history_manager.link_device_to_user(user['device_id'], device_id)
         return jsonify({"success": True, "user": user})
     return jsonify({"success": False, "error": "User not found"})
@@ -192,34 +461,52 @@ def new_chat():
         return jsonify(chat)
     return jsonify({"error": "User not found"}), 404
 
+def _format_history_entry(msg):
+    # The frontend (loadChatHistory in chat.js) parses "User: ..." / "Vyom AI: ..." strings
+    prefix = "User: " if msg['role'] == 'user' else "Vyom AI: "
+    return f"{prefix}{msg['content']}"
+
 @app.route('/user/history', methods=['GET'])
 def get_history():
     device_id = request.args.get('device_id')
     chat_id = request.args.get('chat_id')
-    history = history_manager.get_chat_history(device_id, chat_id)
-    if history is None:
+    limit = request.args.get('limit', type=int)
+    before = request.args.get('before', type=int)
+
+    # ⚡ Paginated: newest `limit` messages, older pages via the `before` cursor
+    if limit:
+        page = history_manager.get_chat_history_page(device_id, chat_id, limit=min(limit, 500), before=before)
+        if page is None:
+            return jsonify({"history": [], "next_before": None, "has_more": False})
+        return jsonify({
+            "history": [_format_history_entry(msg) for msg in page['messages']],
+            "next_before": page['next_before'],
+            "has_more": page['has_more']
+        })
+
+    # Full history: stream it so long chats don't get built up in memory first
+    messages = history_manager.iter_chat_history(device_id, chat_id)
+    if messages is None:
         return jsonify({"history": []})
-    
-    # Format for frontend
-    formatted_history = []
-    for msg in history:
-        # Convert timestamp to human readable if needed, but frontend handles raw mostly
-        # The frontend code in chat.js expects strings like "User: ..." or "Vyom AI: ..."
-        # OR it handles structured objects if we update it.
-        # Looking at chat.js:
-        # if (h.startsWith('User:')) ...
-        # But also: if (messages.length === 0) ... messages.forEach(msg => ... msg.role ... msg.content) in loadChat
-        # The frontend has TWO implementations. 
-        # 1. `loadChatHistory` uses `user/history` and expects strings.
-        # 2. `loadChat` (at bottom) uses `/chat/${chatId}` and expects JSON objects.
-        
-        # We will support the structured format for `user/history` but return a list of strings 
-        # to match the `loadChatHistory` implementation in chat.js which parses "User: "
-        
-        prefix = "User: " if msg['role'] == 'user' else "Vyom AI: "
-        formatted_history.append(f"{prefix}{msg['content']}")
 
-    return jsonify({"history": formatted_history})
+    def generate():
+        yield '{"history": ['
+        for i, msg in enumerate(messages):
+            yield ("," if i else "") + json.dumps(_format_history_entry(msg))
+        yield ']}'
+
+    return Response(generate(), mimetype='application/json')
+
+@app.route('/user/search', methods=['GET'])
+def search_history():
+    """Full-text search over the user's own conversations."""
+    device_id = request.args.get('device_id')
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 20, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if not device_id or not query:
+        return jsonify({"results": [], "has_more": False})
+    return jsonify(history_manager.search_messages(device_id, query, limit=limit, offset=offset))
 
 @app.route('/user/rename_chat', methods=['POST'])
 def rename_chat():
@@ -308,7 +595,8 @@ def update_location():
     city = "your area"
     try:
         import requests
-        res = requests.get(f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lon}&format=json", headers={'User-Agent': 'VyomAI/1.0'})
+        with metrics.UPSTREAM_CALLS.time(service='nominatim'):
+            res = requests.get(f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lon}&format=json", headers={'User-Agent': 'VyomAI/1.0'})
         if res.ok:
             address = res.json().get('address', {})
             city = address.get('city') or address.get('town') or address.get('village') or address.get('state') or "your area"
@@ -322,7 +610,7 @@ def update_location():
 
 # --- MAIN ASK ROUTE ---
 @app.route('/ask', methods=['POST'])
-def ask():
+def ask(stream=False):
     # ⚡ Lazy Load Engines to speed up Server Boot
     from vyom.engines import image as image_engine
     from vyom.engines import thinking as thinking_engine
@@ -353,6 +641,11 @@ def ask():
 
     # Engine selection early for routing
     selected_engine = settings.get('engine') or user_default_engine or 'general'
+    selected_model = settings.get('model') or user_default_model
+    g.ask_engine = selected_engine
+
+    def stage(name):
+        return _ask_stage(name, selected_engine)
 
     # 🛑 0. STOP PREVIOUS AUDIO (Interruption Logic)
     voice_engine.stop()
@@ -360,6 +653,7 @@ def ask():
     # --- Guest Restriction ---
     is_guest = not user_profile or user_profile.get('name') == 'Guest'
     if is_guest and selected_engine != 'general':
+        g.ask_outcome = 'restricted'
         return jsonify({"answer": "⚠️ **Access Restricted.** Special engines like **Coding, Math, and Image** require a free account. Please **Register** in settings to unlock these features."})
 
     lower_msg = msg.lower()
@@ -382,26 +676,28 @@ def ask():
                 applied_filter = next((f for f in filters if f in lower_msg), None) if len(image_paths) == 1 else None
                 
                 if applied_filter:
-                    result_url = visual_studio.editor.apply_filter(image_paths[0], applied_filter)
+                    with _engine_call(engine='visual_studio', model=applied_filter):
+                        result_url = visual_studio.editor.apply_filter(image_paths[0], applied_filter)
                     answer = f"I've applied the {applied_filter} filter. \n\n![Edited Image]({result_url})"
                 else:
                     # Advanced Multi-Image Composition
                     user_key = settings.get('api_key') or user_api_key
-                    result_url = visual_studio.editor.generative_edit(image_paths, msg, user_api_key=user_key)
+                    with _engine_call(engine='visual_studio', model='generative'):
+                        result_url = visual_studio.editor.generative_edit(image_paths, msg, user_api_key=user_key)
                     
                     if isinstance(result_url, str) and (result_url.startswith("http") or result_url.startswith("/")):
                         answer = f"Here is your advanced composition: \n\n![Result]({result_url})"
                     else:
                         answer = result_url
 
-                    if chat_id and device_id:
-                        performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, msg, role="user")
-                        performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, answer, role="assistant")
+                    _queue_exchange(device_id, chat_id, msg, answer, selected_engine)
+                    g.ask_outcome = 'visual_studio'
                     return jsonify({"answer": answer})
 
     # ❤️ HEART: Update Emotional State
     from vyom.core.emotional_core import emotional_core
-    current_mood = emotional_core.update_mood(msg, "ok")
+    with stage('mood'):
+        current_mood = emotional_core.update_mood(msg, "ok")
     print(f"❤️ AI Mood: {current_mood} | Energy: {emotional_core.energy_level}%")
     
     # Inject Emotion into Context (Subtly)
@@ -409,9 +705,22 @@ def ask():
     # msg = f"[System Note: Respond with a {current_mood} tone.] {msg}" 
     # (Actually, better to rely on system prompts, but for now this is a quick patch)
 
+    # 🧠 Recent turns that fit the engine's token budget, plus a rolling summary of older ones.
+    # Built before the cache: an answer shaped by this chat's history belongs to this chat only.
+    context = {"summary": None, "turns": [], "tokens": 0}
+    if selected_engine in TRINITY_ENGINES:
+        with stage('context'):
+            context = context_builder.build(device_id, chat_id, selected_engine, summarize=trinity_engine.summarize_turns)
+    contextual = bool(context['turns'] or context['summary'])
+
     # ⚡ 1. CHECK CACHE (Instant Reply)
-    # Cache is now engine-aware
-    cached_ans = performance.get_cached_response(msg, engine=selected_engine)
+    # Cache is now engine-aware; stale live/daily answers are served and refreshed in the background.
+    # Shared by everyone, so follow-ups in a chat with history never read (or refresh) it.
+    with stage('cache'):
+        cached_ans = None if contextual else performance.get_cached_response(
+            msg, engine=selected_engine,
+            refresh=_answer_refresher(msg, selected_engine, selected_model)
+        )
     if cached_ans:
         # Voice (Speak only Answer part)
         voice_text = cached_ans
@@ -421,13 +730,13 @@ def ask():
         
         # Gender-aware voice
         gender = user_profile.get('gender') if user_profile else None
-        voice_engine.speak_text(voice_text, gender=gender)
+        with stage('tts'):
+            voice_engine.speak_text(voice_text, gender=gender)
         
         # Background History Save
-        if chat_id and device_id:
-            performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, msg, role="user")
-            performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, cached_ans, role="assistant")
+        _queue_exchange(device_id, chat_id, msg, cached_ans, selected_engine)
             
+        g.ask_outcome = 'cache'
         return jsonify({"answer": cached_ans})
 
     # 0. Image Generation
@@ -471,114 +780,94 @@ def ask():
         except Exception:
             style_to_use = detected_style
 
-        img_response = image_engine.generate(msg, style=style_to_use, negative_prompt=neg)
+        with _engine_call(engine='image', model=style_to_use):
+            img_response = image_engine.generate(msg, style=style_to_use, negative_prompt=neg)
         
-        if chat_id and device_id:
-             # ⚡ Background Save
-             performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, msg, role="user")
-             performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, img_response, role="assistant")
+        # ⚡ Background Save
+        _queue_exchange(device_id, chat_id, msg, img_response, selected_engine)
+        g.ask_outcome = 'image'
         return jsonify({"answer": img_response})
 
     # 1. Automation (System control) - DIRECT/FAST MATCH
-    auto_res = automation.simple_match(msg)
+    with stage('automation'):
+        auto_res = automation.simple_match(msg)
     if auto_res:
         gender = user_profile.get('gender') if user_profile else None
-        voice_engine.speak_text(auto_res, gender=gender)
-        if chat_id and device_id:
-             performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, msg, role="user")
-             performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, auto_res, role="assistant")
+        with stage('tts'):
+            voice_engine.speak_text(auto_res, gender=gender)
+        _queue_exchange(device_id, chat_id, msg, auto_res, selected_engine)
+        g.ask_outcome = 'automation'
         return jsonify({"answer": auto_res})
 
     # 2. Thinking (AI)
     # Check for live data needs (Cricket, Weather, News) - Save API Quota!
-    live_keywords = ['score', 'cricket', 'weather', 'stock', 'price', 'news', 'headlines', 'who won']
-    if any(k in lower_msg for k in live_keywords) and selected_engine == 'general':
-        search_res = internet.search_google(msg)
-        if search_res:
-             # Fast format and return to avoid LLM call entirely
-             raw_answer = f"### 🌐 Live Intelligence\n*Browsing the real-time web to provide you the most accurate and latest data.*\n\n{search_res}\n\n---\n*Note: This information was fetched directly from live sources for maximum reliability.*"
-             
-             # ⚡ Cache it for 9999x speed on next hit
-             performance.cache_response(msg, raw_answer, engine=selected_engine)
+    if classify_freshness(msg) == 'live' and selected_engine == 'general':
+        # Fast format and return to avoid LLM call entirely (concurrent identical searches share one)
+        with stage('search'):
+            raw_answer = performance.coalesce(msg, lambda: _live_answer(msg), engine='web')
+        if raw_answer:
+             # ⚡ Cached as 'live': fresh for a minute, then refreshed in the background
+             performance.cache_response(msg, raw_answer, engine=selected_engine, freshness='live')
              
-             if chat_id and device_id:
-                performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, msg, role="user")
-                performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, raw_answer, role="assistant")
+             _queue_exchange(device_id, chat_id, msg, raw_answer, selected_engine)
+             g.ask_outcome = 'live_search'
              return jsonify({"answer": raw_answer})
 
     # Use the Trinity System for supported engines (General, Coding, Math, Reasoning, Trinity)
-    trinity_supported = ('general', 'coding', 'math', 'reasoning', 'trinity')
-    
-    if selected_engine in trinity_supported:
-        # We need history for context
-        history = history_manager.get_chat_history(device_id, chat_id) or []
-        history = history[-15:] # ⚡ Optimize Context Window (Speed & Cost)
-        
+    if selected_engine in TRINITY_ENGINES:
         # Provide the user's BYOK or saved API keys to the engine if available
-        api_override = settings.get('api_key') or (user_profile and user_profile.get('api_key'))
-        if not api_override and user_profile and user_profile.get('api_keys'):
-            try:
-                api_override = next(iter(user_profile.get('api_keys').values()))
-            except StopIteration:
-                api_override = None
-
-        raw_answer = trinity_engine.generate_response(msg, engine_type=selected_engine, history=history, user_api_key=api_override, attachments=attachments, model=selected_model)
+        api_override = _engine_api_key(settings, user_profile)
+
+        if stream and not attachments:
+            # ⚡ Streamed straight from the model (not coalesced: a stream can't be shared)
+            chunks = trinity_engine.stream_response(msg, engine_type=selected_engine, history=context['turns'], user_api_key=api_override, model=selected_model, summary=context['summary'])
+            input_mode = data.get('input_mode', 'text')
+            return _stream_llm_answer(
+                chunks, selected_engine, selected_model,
+                lambda raw: _finish_llm_answer(msg, raw, selected_engine, input_mode, user_profile, device_id, chat_id, cacheable=not (api_override or contextual)),
+                current_mood
+            )
+
+        def _ask_trinity():
+            with _engine_call(engine=selected_engine, model=selected_model or 'auto'):
+                return trinity_engine.generate_response(msg, engine_type=selected_engine, history=context['turns'], user_api_key=api_override, attachments=attachments, model=selected_model, summary=context['summary'])
+
+        with stage('llm'):
+            if attachments:
+                raw_answer = _ask_trinity()
+            else:
+                # ⚡ Identical questions already in flight (double submits, popular queries) share one call
+                # (only within the chat once its history shapes the answer)
+                scope = chat_id if contextual else None
+                raw_answer = performance.coalesce(msg, _ask_trinity, engine=selected_engine, model=selected_model, scope=scope, api_key=api_override)
+        # The user's own key or this chat's history made it: not for the shared cache
+        cacheable = not (api_override or contextual)
     else:
         # Default legacy behavior or other engines
-        raw_answer = thinking_engine.solve_with_reasoning(msg, user_api_key=user_api_key)
+        with stage('llm'), _engine_call(engine=selected_engine, model='thinking'):
+            raw_answer = thinking_engine.solve_with_reasoning(msg, user_api_key=user_api_key)
+        cacheable = not user_api_key
     
-    # 2.5 AI-Driven Automation Check
-    # Look for [[ACTION:PARAM]] tags in the AI's response
-    cmd_match = re.search(r"\[\[(.*?)\]\]", raw_answer)
-    if cmd_match:
-        command_tag = cmd_match.group(0) # The full [[...]]
-        command_content = cmd_match.group(1) # The inside part
-        
-        # Execute the command found by the AI
-        print(f"🤖 AI Requested Command: {command_content}")
-        exec_result = automation.execute(command_content)
-        
-        # Clean the answer for the user (remove the tag)
-        raw_answer = raw_answer.replace(command_tag, "").strip()
-        
-        # Optionally append the execution result if it's meaningful info
-        if exec_result and "Opening" not in raw_answer: 
-             # If the AI didn't say "Opening...", we append the system status
-             raw_answer += f"\n\n_{exec_result}_"
-
-    # 3. Finalize & Cache
-    # ⚡ Cache it for 9999x speed on next hit
-    performance.cache_response(msg, raw_answer, engine=selected_engine)
-    
-    # Clean answer for voice
-    voice_text = raw_answer
-    if "<answer>" in raw_answer:
-        try:
-            voice_text = raw_answer.split("<answer>")[1].split("</answer>")[0].strip()
-        except:
-            voice_text = raw_answer # Fallback
-
-    # Voice (Smart Mode)
-    # Only speak automatically if input was Voice
-    input_mode = data.get('input_mode', 'text')
-    if input_mode == 'voice':
-        gender = user_profile.get('gender') if user_profile else None
-        voice_engine.speak_text(voice_text, gender=gender)
-    
-    # ⚡ Background History Save
-    if chat_id and device_id:
-        performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, msg, role="user")
-        performance.run_in_background(history_manager.add_to_chat_history, device_id, chat_id, raw_answer, role="assistant")
-    
-    # ⚡ Memory Cleanup
-    performance.run_in_background(performance.optimize_memory)
+    raw_answer = _finish_llm_answer(msg, raw_answer, selected_engine, data.get('input_mode', 'text'), user_profile, device_id, chat_id, cacheable=cacheable)
     
     # Return Answer + Mood
+    g.ask_outcome = 'llm'
     return jsonify({
         "answer": raw_answer,
         "mood": current_mood.lower() # 'happy', 'neutral', 'concerned'
     })
 
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    """
+    ⚡ /ask as server-sent events. Trinity answers stream chunk by chunk; everything else
+    (cache hits, automation, images, live search...) arrives as a single `done` event.
+    """
+    response = ask(stream=True)
+    if response.mimetype == 'text/event-stream':
+        return response
+    return Response(_sse('done', response.get_json()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
 @app.route('/voice/speak_manual', methods=['POST'])
 def speak_manual():
     data = request.json
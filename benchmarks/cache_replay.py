@@ -0,0 +1,142 @@
+"""
+VYOM CACHE REPLAY
+Hit rate of the /ask answer cache when a query log is replayed against it.
+
+Compares three lookups over the same log:
+  raw        - the old f"{engine}:{query}" key
+  normalized - canonical keys (case, spacing, punctuation, Hinglish spellings)
+  semantic   - canonical keys plus the embedding nearest-neighbour layer
+
+The log is one query per line, or NDJSON with "query" and optional "engine".
+Without --log a synthetic log of paraphrased questions is generated; since it knows
+which question each line paraphrases, it also counts hits that served the wrong answer.
+
+Usage:
+    python benchmarks/cache_replay.py [--log queries.ndjson] [--threshold 0.9]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vyom.core.query_cache import HashingEmbedder, QueryCache, SemanticIndex
+from vyom.core.response_cache import ResponseCache
+
+BASE_QUESTIONS = [
+    "what is python", "how does photosynthesis work", "python kya hai", "who is the prime minister of india",
+    "explain recursion with an example", "what is the capital of france", "kaise ho", "what is 2 + 2",
+    "what is 2 + 3", "write a poem about rain", "how to reverse a list in python", "mujhe ek joke sunao",
+    "what is machine learning", "is coffee bad for health", "is coffee not bad for health",
+    "how far is the moon", "tell me about black holes", "difference between list and tuple",
+]
+HINGLISH = {"kya": ["kyaa", "kyah"], "hai": ["hae"], "kaise": ["kese", "kaisey"], "mujhe": ["muje"]}
+
+
+def _variant(rng, text):
+    words = [rng.choice(HINGLISH[w] + [w]) if w in HINGLISH else w for w in text.split()]
+    if rng.random() < 0.2 and len(words) > 3:
+        i = rng.randrange(len(words) - 1)
+        w = words[i]
+        if len(w) > 4:  # a typo
+            j = rng.randrange(1, len(w) - 1)
+            words[i] = w[:j] + w[j + 1] + w[j] + w[j + 2:]
+    text = " ".join(words)
+    if rng.random() < 0.5:
+        text = text.capitalize()
+    if rng.random() < 0.5:
+        text += rng.choice(["?", " ?", "??", ".", "!"])
+    if rng.random() < 0.2:
+        text = text.replace(" ", "  ", 1)
+    return text
+
+
+def synthetic_log(n=2000, seed=7):
+    rng = random.Random(seed)
+    # Zipf-ish popularity, like real traffic
+    weights = [1 / (i + 1) for i in range(len(BASE_QUESTIONS))]
+    log = []
+    for _ in range(n):
+        base = rng.choices(BASE_QUESTIONS, weights)[0]
+        log.append(("general", _variant(rng, base), base))
+    return log
+
+
+def load_log(path):
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                entries.append((record.get("engine", "general"), record["query"], None))
+            else:
+                entries.append(("general", line, None))
+    return entries
+
+
+class RawCache:
+    """The pre-normalization behaviour, for comparison."""
+
+    def __init__(self):
+        self.store = ResponseCache()
+        self.hits = self.lookups = 0
+
+    def get(self, query, engine):
+        self.lookups += 1
+        value = self.store.get(f"{engine}:{query}")
+        self.hits += value is not None
+        return value
+
+    def set(self, query, response, engine):
+        self.store.set(f"{engine}:{query}", response)
+
+
+def replay(log, cache):
+    """Returns (seconds, wrong answers served)."""
+    wrong = 0
+    start = time.perf_counter()
+    for engine, query, label in log:
+        answer = cache.get(query, engine=engine)
+        if answer is None:
+            # Miss: pretend we paid for an answer and cache it
+            cache.set(query, label or query, engine=engine)
+        elif label is not None and answer != label:
+            wrong += 1
+    return time.perf_counter() - start, wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    args = parser.parse_args()
+
+    log = load_log(args.log) if args.log else synthetic_log()
+    print(f"Replaying {len(log):,} queries ({len({q for _, q, _ in log}):,} distinct strings)\n")
+    print(f"{'LOOKUP':<11} | {'HIT RATE':>8} | {'LLM CALLS':>9} | {'WRONG':>5} | {'µs/QUERY':>8}")
+    print("-" * 54)
+
+    raw = RawCache()
+    elapsed, wrong = replay(log, raw)
+    print(f"{'raw':<11} | {raw.hits / len(log):>8.1%} | {len(log) - raw.hits:>9,} | {wrong:>5} | {elapsed / len(log) * 1e6:>8.1f}")
+
+    for name, semantic in (
+        ("normalized", None),
+        ("semantic", SemanticIndex(HashingEmbedder(), threshold=args.threshold)),
+    ):
+        cache = QueryCache(ResponseCache(), semantic=semantic)
+        elapsed, wrong = replay(log, cache)
+        stats = cache.stats()
+        calls = stats["misses"]
+        print(f"{name:<11} | {stats['hit_rate']:>8.1%} | {calls:>9,} | {wrong:>5} | {elapsed / len(log) * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+VYOM CLIENT POOL BENCHMARK
+Gemini calls against a local stub server: a new genai.Client per call (the old
+pattern) vs. the shared pool from vyom.core.client_pool.
+
+The stub counts accepted TCP connections, so the output shows how many calls
+reused a keep-alive connection. It speaks plain HTTP: against the real API each
+avoided connection also saves a TLS handshake, which this doesn't measure.
+
+Usage:
+    python benchmarks/client_pool_bench.py [--calls 300] [--threads 8] [--keys 3]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google import genai
+from google.genai import types
+
+REPLY = json.dumps({
+    "candidates": [{"content": {"role": "model", "parts": [{"text": "stub answer"}]}, "finishReason": "STOP"}],
+}).encode()
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    connections = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubGemini.lock:
+            StubGemini.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with StubGemini.lock:
+            StubGemini.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(REPLY)))
+        self.end_headers()
+        self.wfile.write(REPLY)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label, get_client, calls, threads, keys):
+    StubGemini.connections = StubGemini.requests = 0
+    latencies = []
+
+    def call(i):
+        started = time.perf_counter()
+        client = get_client(keys[i % len(keys)])
+        client.models.generate_content(model="gemini-2.5-flash", contents="hi")
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(call, range(calls)))
+    elapsed = time.perf_counter() - started
+    reused = 1 - StubGemini.connections / max(StubGemini.requests, 1)
+    print(f"{label:<22} {calls / elapsed:>8.0f} calls/s   p50 {statistics.median(latencies):6.2f} ms   "
+          f"p95 {sorted(latencies)[int(len(latencies) * 0.95)]:6.2f} ms   "
+          f"{StubGemini.connections:>4} connections for {StubGemini.requests} calls ({reused:.0%} reused)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--keys", type=int, default=3)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["VYOM_GEMINI_BASE_URL"] = base_url
+    from vyom.core import client_pool # reads the base URL when clients are built
+
+    keys = [f"stub-key-{i}" for i in range(args.keys)]
+    print(f"{args.calls} calls, {args.threads} threads, {args.keys} keys\n")
+
+    def fresh_client(key):
+        return genai.Client(api_key=key, http_options=types.HttpOptions(base_url=base_url))
+
+    run("new client per call", fresh_client, args.calls, args.threads, keys)
+    run("pooled clients", client_pool.gemini_client, args.calls, args.threads, keys)
+    print(f"\npool: {client_pool.gemini_pool().stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
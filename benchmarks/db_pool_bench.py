@@ -0,0 +1,115 @@
+"""
+VYOM DB BENCHMARK
+Reads/writes per second for the chat store at 1, 8 and 32 threads.
+
+Compares the old pattern (fresh sqlite3.connect per call, rollback journal)
+against the pooled WAL connections from vyom.core.database.
+
+Usage:
+    python benchmarks/db_pool_bench.py [--seconds 2]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vyom.core import database
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "chat_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, timestamp REAL NOT NULL)"
+)
+THREAD_COUNTS = (1, 8, 32)
+
+
+class FreshConnections:
+    """The pre-pool behaviour: connect, run, close."""
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+
+    def connection(self):
+        return _Fresh(self.db_file)
+
+
+class _Fresh:
+    def __init__(self, db_file):
+        self.db_file = db_file
+
+    def __enter__(self):
+        self.conn = sqlite3.connect(self.db_file, timeout=30.0)
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+
+def _prepare(db_file, wal):
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = %s" % ("WAL" if wal else "DELETE"))
+    conn.execute(SCHEMA)
+    conn.executemany(
+        "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+        [(f"chat-{i % 50}", "user", "hello " * 20, time.time()) for i in range(5000)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def _worker(pool, kind, deadline, counts, idx):
+    done = 0
+    while time.perf_counter() < deadline:
+        with pool.connection() as conn:
+            if kind == "read":
+                conn.execute(
+                    "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY timestamp DESC LIMIT 15",
+                    (f"chat-{done % 50}",)
+                ).fetchall()
+            else:
+                conn.execute(
+                    "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                    (f"chat-{idx}", "assistant", "answer " * 40, time.time())
+                )
+                conn.commit()
+        done += 1
+    counts[idx] = done
+
+
+def run(pool, kind, threads, seconds):
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+    workers = [threading.Thread(target=_worker, args=(pool, kind, deadline, counts, i)) for i in range(threads)]
+    for w in workers: w.start()
+    for w in workers: w.join()
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'MODE':<8} | {'THREADS':>7} | {'READS/s':>10} | {'WRITES/s':>10}")
+        print("-" * 45)
+        for name in ("fresh", "pooled"):
+            for threads in THREAD_COUNTS:
+                # Fresh file per row so earlier write rounds don't inflate later reads
+                db_file = os.path.join(tmp, f"{name}-{threads}.db")
+                _prepare(db_file, wal=(name == "pooled"))
+                pool = FreshConnections(db_file) if name == "fresh" else database.ConnectionPool(db_file)
+                reads = run(pool, "read", threads, args.seconds)
+                writes = run(pool, "write", threads, args.seconds)
+                print(f"{name:<8} | {threads:>7} | {reads:>10.0f} | {writes:>10.0f}")
+                if hasattr(pool, "close_all"):
+                    pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
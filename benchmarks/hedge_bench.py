@@ -0,0 +1,112 @@
+"""
+VYOM HEDGING BENCHMARK
+Trinity's Gemini call path against a local stub server that answers most calls
+quickly but stalls a few of them, with hedging off vs. on (vyom.core.hedging).
+
+Prints p50/p95/p99 latency per mode and how many extra upstream calls hedging
+cost. The first --warmup calls of each mode fill the hedger's latency window
+and aren't counted.
+
+Usage:
+    python benchmarks/hedge_bench.py [--calls 400] [--threads 8] [--slow-rate 0.05] [--slow-ms 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPLY = json.dumps({
+    "candidates": [{"content": {"role": "model", "parts": [{"text": "stub answer"}]}, "finishReason": "STOP"}],
+}).encode()
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    fast_ms = 40
+    slow_ms = 2000
+    slow_rate = 0.05
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with StubGemini.lock:
+            StubGemini.requests += 1
+        slow = random.random() < self.slow_rate
+        time.sleep((self.slow_ms if slow else self.fast_ms * random.uniform(0.8, 1.5)) / 1000)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(REPLY)))
+        self.end_headers()
+        self.wfile.write(REPLY)
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(label, call, calls, threads, warmup):
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda _: call(), range(warmup)))
+    StubGemini.requests = 0
+    latencies = []
+
+    def timed(_):
+        started = time.perf_counter()
+        assert call() == "stub answer"
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(timed, range(calls)))
+    print(f"{label:<12} p50 {percentile(latencies, 0.50):7.1f} ms   p95 {percentile(latencies, 0.95):7.1f} ms   "
+          f"p99 {percentile(latencies, 0.99):7.1f} ms   max {max(latencies):7.1f} ms   "
+          f"{StubGemini.requests} upstream calls for {calls} answers (+{StubGemini.requests / calls - 1:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=int, default=2000)
+    args = parser.parse_args()
+
+    StubGemini.slow_rate = args.slow_rate
+    StubGemini.slow_ms = args.slow_ms
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["VYOM_GEMINI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    from vyom.core.hedging import llm_hedger
+    from vyom.engines import trinity
+
+    keys = [f"stub-key-{i}" for i in range(3)]
+
+    def call():
+        return trinity._generate_scheduled(keys, trinity.FALLBACK_MODELS, ["hi"], trinity.get_system_instruction("general"), "system")
+
+    print(f"{args.calls} calls, {args.threads} threads, {args.slow_rate:.0%} of responses stall {args.slow_ms} ms\n")
+    llm_hedger.enabled = False
+    run("no hedging", call, args.calls, args.threads, args.warmup)
+    llm_hedger.enabled = True
+    run("hedged", call, args.calls, args.threads, args.warmup)
+    print(f"\nhedger: {llm_hedger.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
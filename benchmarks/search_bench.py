@@ -0,0 +1,100 @@
+"""
+VYOM SEARCH BENCHMARK
+Latency of history.search_messages() on a large synthetic chat database.
+
+Builds a throwaway database with --messages messages spread over --users users
+(through the real migrations and FTS triggers), then times per-user searches.
+
+Usage:
+    python benchmarks/search_bench.py [--messages 1000000] [--users 2000] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vyom.core import database
+from vyom.core import history as history_manager
+
+VOCAB = (
+    "python java rust code list array loop function class error bug deploy server cloud "
+    "cricket score match weather rain stock price market news india delhi mumbai physics "
+    "gravity energy atom chemistry biology cell health diet sleep exercise career job resume "
+    "startup money budget travel visa train flight recipe paneer curry chai love friend "
+    "history empire war music movie song guitar photo camera garden plant dog cat"
+).split()
+CHATS_PER_USER = 10
+
+
+def populate(n_messages, users):
+    rng = random.Random(42)
+    per_chat = max(1, n_messages // (len(users) * CHATS_PER_USER))
+    now = time.time()
+    start = time.perf_counter()
+    with history_manager.get_db_connection() as conn:
+        for device_id in users:
+            conn.execute("INSERT INTO users (device_id, name, email, created) VALUES (?, ?, ?, ?)",
+                         (device_id, "Bench", f"{device_id[:8]}@example.com", now))
+            for c in range(CHATS_PER_USER):
+                chat_id = f"{device_id}-chat-{c}"
+                conn.execute("INSERT INTO chats (id, user_id, title, created) VALUES (?, ?, ?, ?)",
+                             (chat_id, device_id, "Bench", now))
+                conn.executemany(
+                    "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                    [(chat_id, "user" if i % 2 == 0 else "assistant",
+                      " ".join(rng.choices(VOCAB, k=rng.randint(8, 60))), now + i)
+                     for i in range(per_chat)]
+                )
+            conn.commit()
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    print(f"Populated {total:,} messages in {time.perf_counter() - start:.1f}s")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history_manager.DB_FILE = os.path.join(tmp, "search_bench.db")
+        history_manager._initialize_database()
+        # Real device ids are browser-generated UUIDs
+        users = [str(uuid.UUID(int=random.Random(u).getrandbits(128))) for u in range(args.users)]
+        populate(args.messages, users)
+
+        rng = random.Random(7)
+        cases = {
+            "one word": lambda: rng.choice(VOCAB),
+            "two words": lambda: " ".join(rng.sample(VOCAB, 2)),
+            "prefix": lambda: rng.choice(VOCAB)[:3],
+        }
+        print(f"\n{'QUERY':<10} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7}")
+        print("-" * 42)
+        for name, make_query in cases.items():
+            samples = []
+            for _ in range(args.queries):
+                device_id = rng.choice(users)
+                q = make_query()
+                start = time.perf_counter()
+                history_manager.search_messages(device_id, q, limit=20)
+                samples.append((time.perf_counter() - start) * 1000)
+            print(f"{name:<10} | {percentile(samples, 50):>7.2f} | {percentile(samples, 95):>7.2f} | {percentile(samples, 99):>7.2f}")
+        database.close_all_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+VYOM SHARD BENCHMARK
+Committed message writes per second with concurrent writer processes at 1, 2, 4 and 8 shards.
+
+Each process plays a gunicorn worker: it picks a random user and commits one
+message through vyom.core.history, the way the history writer does. With one
+shard every process queues on the same SQLite write lock; with N shards only
+writers for users in the same shard do.
+
+Usage:
+    python benchmarks/shard_bench.py [--writers 8] [--seconds 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SHARD_COUNTS = (1, 2, 4, 8)
+USERS = 400
+
+
+def _setup(db_file, shards):
+    from vyom.core import database, history
+    history.DB_FILE, history.DB_SHARDS = db_file, shards
+    history._initialize_database()
+    chats = []
+    for i in range(USERS):
+        device_id = f"bench-user-{i}"
+        history.register_user(device_id, "Bench", f"{device_id}@example.com")
+        chats.append((device_id, history.get_chat_sessions(device_id)[0]['id']))
+    # SQLite connections must not cross a fork
+    database.close_all_pools()
+    return chats
+
+
+def _writer(db_file, shards, chats, deadline, counts, idx):
+    from vyom.core import history
+    history.DB_FILE, history.DB_SHARDS = db_file, shards
+    rng = random.Random(idx)
+    done = 0
+    while time.time() < deadline:
+        device_id, chat_id = rng.choice(chats)
+        history.add_to_chat_history(device_id, chat_id, "assistant: " + "answer " * 40)
+        done += 1
+    counts[idx] = done
+
+
+def run(db_file, shards, writers, seconds):
+    chats = _setup(db_file, shards)
+    counts = multiprocessing.Array('i', writers)
+    deadline = time.time() + 0.5 + seconds  # Let every process start before the clock matters
+    procs = [
+        multiprocessing.Process(target=_writer, args=(db_file, shards, chats, deadline, counts, i))
+        for i in range(writers)
+    ]
+    for p in procs: p.start()
+    for p in procs: p.join()
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'SHARDS':>6} | {'WRITERS':>7} | {'WRITES/s':>10} | {'SPEEDUP':>7}")
+        print("-" * 41)
+        baseline = None
+        for shards in SHARD_COUNTS:
+            db_file = os.path.join(tmp, f"bench-{shards}.db")
+            rate = run(db_file, shards, args.writers, args.seconds)
+            baseline = baseline or rate
+            print(f"{shards:>6} | {args.writers:>7} | {rate:>10.0f} | {rate / baseline:>6.2f}x")
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("fork")
+    main()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# The optimizer opens its disk cache (and tracing its log) at import: keep both out of the checkout
+_scratch = tempfile.mkdtemp(prefix="vyom-tests-")
+os.environ.setdefault("VYOM_CACHE_DB", os.path.join(_scratch, "response_cache.db"))
+os.environ.setdefault("VYOM_TRACE_FILE", os.path.join(_scratch, "traces.jsonl"))
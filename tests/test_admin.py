@@ -0,0 +1,42 @@
+import admin
+from vyom.core import database
+from vyom.core import history as history_manager
+
+
+def _use_db(monkeypatch, path):
+    monkeypatch.setattr(history_manager, 'DB_FILE', path)
+    monkeypatch.setattr(admin, 'DB_FILE', path)
+    history_manager._invalidate_user()
+    history_manager._initialize_database()
+
+
+def test_csv_export_import_round_trip_includes_archived_chats(tmp_path, monkeypatch):
+    source = str(tmp_path / 'source.db')
+    _use_db(monkeypatch, source)
+    history_manager.register_user('d1', 'Tester', 'd1@example.com')
+    live, old = (history_manager.start_new_chat('d1')['id'] for _ in range(2))
+    for chat_id in (live, old):
+        for i in range(3):
+            history_manager.add_to_chat_history('d1', chat_id, f'message {i} in {chat_id}', role='user')
+    with history_manager.get_db_connection() as conn:
+        conn.execute("UPDATE chats SET last_message_at = last_message_at - 90 * 86400 WHERE id = ?", (old,))
+        conn.commit()
+    assert history_manager.archive_idle_chats(idle_days=30)['chats'] == 1
+
+    exports = {}
+    for table in ("users", "chats", "messages"):
+        exports[table] = str(tmp_path / f'{table}.csv')
+        admin.export_table(table, 'csv', path=exports[table])
+    database.get_pool(source).close_all()
+
+    target = str(tmp_path / 'target.db')
+    _use_db(monkeypatch, target)
+    for table in ("users", "chats", "messages"):
+        admin.import_table(table, exports[table])
+
+    with history_manager.get_db_connection() as conn:
+        rows = conn.execute("SELECT chat_id, content, tokens FROM messages ORDER BY id").fetchall()
+    assert len(rows) == 6
+    assert {r['chat_id'] for r in rows} == {live, old}
+    assert [m['content'] for m in history_manager.get_chat_history('d1', old)] == [f'message {i} in {old}' for i in range(3)]
+    database.get_pool(target).close_all()
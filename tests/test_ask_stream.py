@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import app
+from vyom.core import client_pool, metrics
+from vyom.core.key_scheduler import gemini_scheduler
+from vyom.core.optimizer import performance
+from vyom.engines import trinity
+
+CHUNKS = ["Namaste! ", "The time is ", "shown below. [[TIME]]"]
+
+
+class StreamingStub(BaseHTTPRequestHandler):
+    """Answers streamGenerateContent with one SSE event per chunk, pausing between them."""
+    protocol_version = "HTTP/1.1"
+    paths = []
+    fail_after = None # Chunks sent before an error event
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StreamingStub.paths.append(self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, text in enumerate(CHUNKS):
+            if i == StreamingStub.fail_after:
+                error = {"error": {"code": 500, "message": "backend went away", "status": "INTERNAL"}}
+                self.wfile.write(f"data: {json.dumps(error)}\r\n\r\n".encode())
+                return
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode())
+            self.wfile.flush()
+            time.sleep(0.05)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StreamingStub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("VYOM_GEMINI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(trinity, "api_keys", ["stream-test-key"])
+    client_pool.gemini_pool().clear()
+    gemini_scheduler.reset()
+    StreamingStub.paths = []
+    StreamingStub.fail_after = None
+    yield
+    server.shutdown()
+    client_pool.gemini_pool().clear()
+    gemini_scheduler.reset()
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_trinity_streams_chunks_from_generate_content_stream(stub):
+    assert list(trinity.stream_response("hello")) == CHUNKS
+    assert gemini_scheduler.stats()["successes"] == 1
+
+
+def test_ask_stream_sends_chunks_then_the_post_processed_answer(stub):
+    pytest.importorskip("sympy") # /ask imports every engine
+    msg = f"stream test {uuid.uuid4().hex}"
+    ttfb_before = metrics.ASK_TTFB.count(engine="general")
+
+    res = app.test_client().post("/ask/stream", json={"message": msg, "settings": {}})
+    assert res.mimetype == "text/event-stream"
+    events = parse_sse(res.get_data(as_text=True))
+
+    assert [e for e, _ in events] == ["chunk"] * len(CHUNKS) + ["done"]
+    assert [data["text"] for _, data in events[:-1]] == CHUNKS
+    assert any("streamGenerateContent" in path for path in StreamingStub.paths)
+
+    # [[ACTION]] tags are executed and stripped from the final answer, which is cached
+    answer = events[-1][1]["answer"]
+    assert "[[TIME]]" not in answer and answer.startswith("Namaste! The time is shown below.")
+    assert performance.get_cached_response(msg) == answer
+    assert metrics.ASK_TTFB.count(engine="general") == ttfb_before + 1
+
+
+def test_a_failure_mid_answer_raises_after_the_chunks_already_sent(stub):
+    StreamingStub.fail_after = 1
+    received = []
+    with pytest.raises(trinity.StreamInterrupted):
+        for text in trinity.stream_response("hello"):
+            received.append(text)
+    assert received == CHUNKS[:1]
+
+
+def test_ask_stream_ends_a_cut_off_answer_with_an_error_event(stub):
+    pytest.importorskip("sympy")
+    StreamingStub.fail_after = 2
+    msg = f"stream failure test {uuid.uuid4().hex}"
+
+    res = app.test_client().post("/ask/stream", json={"message": msg, "settings": {}})
+    events = parse_sse(res.get_data(as_text=True))
+    assert [e for e, _ in events] == ["chunk", "chunk", "error"]
+    assert "cut off" in events[-1][1]["error"]
+    # The partial answer is never served to the next asker
+    assert performance.get_cached_response(msg) is None
+
+
+def test_ask_stream_sends_non_llm_answers_as_one_event():
+    pytest.importorskip("sympy")
+    res = app.test_client().post("/ask/stream", json={"message": "", "settings": {}})
+    assert parse_sse(res.get_data(as_text=True)) == [("done", {"answer": "Empty message"})]
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from vyom.core.client_pool import ClientPool
+
+
+class FakeClient:
+    def __init__(self, key):
+        self.key = key
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_same_key_reuses_one_client_across_threads():
+    pool = ClientPool(FakeClient)
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(pool.get("k"))) for _ in range(10)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert len({id(c) for c in clients}) == 1
+    assert pool.get("other") is not clients[0]
+    assert len(pool) == 2
+
+
+def test_idle_byok_clients_are_evicted_and_closed_but_pinned_ones_stay():
+    pool = ClientPool(FakeClient, idle_ttl=0.05)
+    system = pool.get("system", pinned=True)
+    byok = pool.get("byok")
+    time.sleep(0.1)
+
+    fresh = pool.get("byok")
+    assert fresh is not byok and byok.closed
+    assert pool.get("system", pinned=True) is system and not system.closed
+    assert pool.stats()["evicted"] == 1
+
+
+def test_least_recently_used_byok_key_goes_past_the_cap():
+    pool = ClientPool(FakeClient, max_unpinned=2)
+    a, b = pool.get("a"), pool.get("b")
+    pool.get("a")            # b is now the least recently used
+    pool.get("c")
+
+    assert b.closed and not a.closed
+    stats = pool.stats()
+    assert stats["byok"] == 2 and stats["created"] == 3 and stats["reused"] == 1
+
+
+def test_a_client_evicted_during_a_call_is_closed_when_the_call_returns():
+    pool = ClientPool(FakeClient, max_unpinned=1)
+    in_call, finish = threading.Event(), threading.Event()
+    seen = []
+
+    def request():
+        with pool.checkout("byok") as client:
+            in_call.set()
+            finish.wait(5)
+            seen.append(client.closed) # Still usable at the end of the call
+        seen.append(client.closed)
+
+    t = threading.Thread(target=request)
+    t.start()
+    assert in_call.wait(5)
+    pool.get("another-byok") # Over the cap: "byok" is evicted mid-call
+    stats = pool.stats()
+    assert stats["evicted"] == 1 and stats["deferred_closes"] == 1 and stats["closing"] == 1
+
+    finish.set()
+    t.join()
+    assert seen == [False, True]
+    assert pool.stats()["in_use"] == 0 and pool.stats()["closing"] == 0
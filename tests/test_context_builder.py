@@ -0,0 +1,124 @@
+import pytest
+
+from vyom.core import database
+from vyom.core import history as history_manager
+from vyom.core.context_builder import ContextBuilder, count_tokens
+
+
+@pytest.fixture
+def chat(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'test_context.db')
+    monkeypatch.setattr(history_manager, 'DB_FILE', db_file)
+    history_manager._invalidate_user()
+    history_manager._initialize_database()
+    history_manager.register_user('ctx-device', 'Tester', 'ctx@example.com')
+    yield history_manager.start_new_chat('ctx-device')['id']
+    database.get_pool(db_file).close_all()
+
+
+def add_turns(chat_id, n, words=20):
+    for i in range(n):
+        role = 'user' if i % 2 == 0 else 'assistant'
+        history_manager.add_to_chat_history('ctx-device', chat_id, f"turn{i} " + "word " * words, role=role)
+
+
+def test_token_counts_are_stored_when_messages_are_written(chat):
+    assert count_tokens("a" * 400) == 100
+    assert count_tokens("नमस्ते दुनिया") > count_tokens("hello world")
+    history_manager.add_to_chat_history('ctx-device', chat, "What is the capital of France?", role='user')
+    with history_manager.get_db_connection('ctx-device') as conn:
+        stored = conn.execute("SELECT tokens FROM messages WHERE chat_id = ?", (chat,)).fetchone()[0]
+    assert stored == count_tokens("What is the capital of France?")
+
+
+def test_budget_keeps_the_newest_turns_and_folds_the_rest_into_a_summary(chat, monkeypatch):
+    monkeypatch.setenv("VYOM_CONTEXT_TOKENS", "100")
+    add_turns(chat, 10) # ~27 tokens each
+    folded = []
+
+    def summarize(previous, turns):
+        folded.append([t['content'].split()[0] for t in turns])
+        return f"{previous or ''} folded {len(turns)}".strip()
+
+    builder = ContextBuilder(submit=lambda fn: fn())
+    context = builder.build('ctx-device', chat, summarize=summarize)
+    assert [t['content'].split()[0] for t in context['turns']] == ['turn7', 'turn8', 'turn9']
+    assert context['turns'][0]['role'] == 'assistant' and context['tokens'] <= 100
+    assert folded == [[f'turn{i}' for i in range(7)]]
+
+    # Next question: the summary takes part of the budget and folded turns are never resent
+    add_turns(chat, 2)
+    context = builder.build('ctx-device', chat, summarize=summarize)
+    assert context['summary'] == "folded 7"
+    sent = [t['content'].split()[0] for t in context['turns']]
+    assert sent[-1] == 'turn1' and not {'turn2', 'turn3', 'turn4', 'turn5', 'turn6'} & set(sent)
+    # Only the newly dropped turns were folded in
+    assert folded[1] and 'turn0' not in folded[1]
+    assert history_manager.get_chat_summary('ctx-device', chat)[0].startswith("folded 7 folded")
+
+
+def test_long_messages_are_clipped_and_a_failing_summarizer_falls_back(chat, monkeypatch):
+    monkeypatch.setenv("VYOM_CONTEXT_TOKENS", "1000")
+    history_manager.add_to_chat_history('ctx-device', chat, "Write me a long essay", role='user')
+    history_manager.add_to_chat_history('ctx-device', chat, "essay " * 2000, role='assistant')
+
+    context = ContextBuilder(submit=lambda fn: fn()).build('ctx-device', chat)
+    assert len(context['turns']) == 2
+    assert count_tokens(context['turns'][1]['content']) <= 610
+
+    monkeypatch.setenv("VYOM_CONTEXT_TOKENS", "50")
+    add_turns(chat, 6)
+    def broken(previous, turns):
+        raise RuntimeError("429 RESOURCE_EXHAUSTED")
+    builder = ContextBuilder(submit=lambda fn: fn())
+    builder.build('ctx-device', chat, summarize=broken)
+    summary, until = history_manager.get_chat_summary('ctx-device', chat)
+    assert summary.startswith("User: Write me a long essay") and until is not None
+    assert builder.stats()["summary_fallbacks"] == 1
+
+
+def test_no_chat_or_zero_budget_means_no_context(chat, monkeypatch):
+    add_turns(chat, 4)
+    builder = ContextBuilder(submit=lambda fn: pytest.fail("nothing to fold"))
+    assert builder.build('ctx-device', None)['turns'] == []
+    monkeypatch.setenv("VYOM_CONTEXT_TOKENS", "0")
+    assert builder.build('ctx-device', chat) == {"summary": None, "turns": [], "tokens": 0}
+
+
+def test_trinity_sends_turns_as_alternating_contents():
+    from vyom.engines import trinity
+    contents = trinity._conversation(
+        [{"role": "user", "content": "My name is Asha"}, {"role": "user", "content": "I like chess"},
+         {"role": "assistant", "content": "Noted!"}, {"role": "assistant", "content": ""}],
+        ["What's my name?"]
+    )
+    assert [c.role for c in contents[:2]] == ["user", "model"]
+    assert [p.text for p in contents[0].parts] == ["My name is Asha", "I like chess"]
+    assert contents[2] == "What's my name?"
+    assert "Asha likes chess" in trinity._instruction("general", summary="Asha likes chess")
+
+
+def test_follow_ups_that_depend_on_the_chat_are_not_shared_through_the_cache(chat, monkeypatch):
+    pytest.importorskip("sympy") # /ask imports every engine
+    from app import app
+    from vyom.engines import trinity
+
+    history_manager.register_user('other-device', 'Ravi', 'ravi@example.com')
+    other_chat = history_manager.start_new_chat('other-device')['id']
+    history_manager.add_to_chat_history('ctx-device', chat, "My bank PIN is 4321", role='user')
+    history_manager.add_to_chat_history('other-device', other_chat, "My cat is called Miso", role='user')
+
+    def answer(prompt, history=(), summary=None, **kwargs):
+        told = history[0]['content'] if history else "nothing yet"
+        return f"Based on our chat: {told}"
+    monkeypatch.setattr(trinity, "generate_response", answer)
+
+    client = app.test_client()
+    def ask(device_id, chat_id):
+        res = client.post("/ask", json={"message": "what did I tell you?", "device_id": device_id,
+                                        "chat_id": chat_id, "settings": {}})
+        return res.get_json()["answer"]
+
+    assert "4321" in ask('ctx-device', chat)
+    assert "Miso" in ask('other-device', other_chat) # Not the first chat's cached answer
+    assert "4321" not in ask('guest-device', None)
@@ -0,0 +1,63 @@
+import time
+
+from vyom.core import database
+from vyom.core.disk_cache import DiskCache, TieredCache
+from vyom.core.query_cache import QueryCache
+from vyom.core.response_cache import ResponseCache
+
+
+def test_answers_survive_a_restart_and_are_shared(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    worker_a = QueryCache(TieredCache(ResponseCache(), DiskCache(path)))
+    worker_a.set("What is Python?", "A language.")
+
+    # Another worker (or the same one after a deploy) starts with an empty L1
+    worker_b = QueryCache(TieredCache(ResponseCache(), DiskCache(path)))
+    assert worker_b.get("what is python") == "A language."
+    stats = worker_b.store.stats()
+    assert stats["disk"]["hits"] == 1
+    # ...and the answer is now promoted into its L1
+    assert worker_b.get("what is python") == "A language."
+    assert worker_b.store.stats()["disk"]["hits"] == 1
+    database.get_pool(path).close_all()
+
+
+def test_expiry_and_size_cap(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = DiskCache(path, max_bytes=5_000)
+    cache.set("live", "IND 250/3", ttl=0.05)
+    for i in range(10):
+        cache.set(f"k{i}", "x" * 900)
+        time.sleep(0.002)
+    time.sleep(0.06)
+
+    cache.prune()
+    assert cache.get("live") is None
+    stats = cache.stats()
+    assert stats["bytes"] <= 5_000
+    assert stats["expirations"] >= 1 and stats["evictions"] >= 1
+    # Oldest go first
+    assert cache.get("k9") is not None and cache.get("k0") is None
+    database.get_pool(path).close_all()
+
+
+def test_tiered_stats_have_the_flat_response_cache_shape(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = TieredCache(ResponseCache(), DiskCache(path))
+    cache.set("ok", "A language.")
+    # Flat like a plain ResponseCache, with the disk tier alongside
+    assert set(ResponseCache().stats()) < set(cache.stats()) and cache.stats()["disk"]["sets"] == 1
+    database.get_pool(path).close_all()
+
+
+def test_error_answers_never_reach_either_tier(tmp_path, monkeypatch):
+    from vyom.core.optimizer import performance
+    path = str(tmp_path / 'cache.db')
+    store = TieredCache(ResponseCache(), DiskCache(path))
+    monkeypatch.setattr(performance, 'query_cache', QueryCache(store))
+
+    performance.cache_response("busy", "⚠️ System is temporarily overloaded. Please try again in a moment.")
+    performance.cache_response("what is python", "A language.")
+    assert len(store.l1) == 1 and len(store.l2) == 1
+    assert performance.get_cached_response("busy") is None
+    database.get_pool(path).close_all()
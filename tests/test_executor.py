@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from vyom.core.executor import BLOCK, DROP_OLDEST, RUN_INLINE, BackgroundExecutor, QueueFull
+
+
+def _hold_worker(executor, queue):
+    """Occupies the executor's only worker until the returned event is set."""
+    release, started = threading.Event(), threading.Event()
+    def hold():
+        started.set()
+        release.wait(5)
+    executor.submit(queue, hold)
+    assert started.wait(5)
+    return release
+
+
+def test_higher_priority_queue_runs_first():
+    executor = BackgroundExecutor(workers=1)
+    executor.add_queue("urgent", priority=1)
+    executor.add_queue("later", priority=9)
+    release = _hold_worker(executor, "later")
+
+    order = []
+    executor.submit("later", order.append, "later")
+    executor.submit("urgent", order.append, "urgent")
+    release.set()
+    assert executor.drain(5)
+    assert order == ["urgent", "later"]
+
+
+def test_drop_oldest_cancels_the_oldest_queued_task():
+    executor = BackgroundExecutor(workers=1)
+    executor.add_queue("q", max_depth=2, overflow=DROP_OLDEST)
+    release = _hold_worker(executor, "q")
+
+    ran = []
+    futures = [executor.submit("q", ran.append, i) for i in range(3)]
+    release.set()
+    assert executor.drain(5)
+    assert futures[0].cancelled()
+    assert ran == [1, 2]
+    assert executor.stats()["queues"]["q"]["dropped"] == 1
+
+
+def test_run_inline_uses_the_callers_thread_when_full():
+    executor = BackgroundExecutor(workers=1)
+    executor.add_queue("q", max_depth=1, overflow=RUN_INLINE)
+    release = _hold_worker(executor, "q")
+
+    executor.submit("q", lambda: None)  # fills the queue
+    future = executor.submit("q", threading.current_thread)
+    assert future.result(0) is threading.current_thread()
+    release.set()
+    assert executor.drain(5)
+    assert executor.stats()["queues"]["q"]["inline"] == 1
+
+
+def test_block_raises_queue_full_after_timeout():
+    executor = BackgroundExecutor(workers=1)
+    executor.add_queue("q", max_depth=1, overflow=BLOCK)
+    release = _hold_worker(executor, "q")
+
+    executor.submit("q", lambda: None)
+    started = time.perf_counter()
+    with pytest.raises(QueueFull):
+        executor.submit("q", lambda: None, timeout=0.1)
+    assert time.perf_counter() - started >= 0.1
+    release.set()
+    assert executor.drain(5)
+
+
+def test_failures_are_logged_counted_and_kept_on_the_future(capsys):
+    executor = BackgroundExecutor(workers=2)
+    executor.add_queue("q")
+    def boom():
+        raise RuntimeError("db is locked")
+
+    future = executor.submit("q", boom)
+    with pytest.raises(RuntimeError):
+        future.result(5)
+    assert executor.drain(5)
+    assert "db is locked" in capsys.readouterr().out
+    stats = executor.stats()["queues"]["q"]
+    assert stats["failed"] == 1 and stats["completed"] == 0
+
+
+def test_shutdown_drains_queued_work_then_runs_inline():
+    executor = BackgroundExecutor(workers=1)
+    executor.add_queue("q")
+    ran = []
+    for i in range(5):
+        executor.submit("q", ran.append, i)
+    assert executor.shutdown(5)
+    assert sorted(ran) == [0, 1, 2, 3, 4]
+
+    executor.submit("q", ran.append, "late")
+    assert ran[-1] == "late"
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from vyom.core import query_cache
+from vyom.core.executor import RUN_INLINE, BackgroundExecutor
+from vyom.core.optimizer import performance
+from vyom.core.query_cache import QueryCache, classify_freshness
+from vyom.core.response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    qc = QueryCache(ResponseCache())
+    monkeypatch.setattr(performance, 'query_cache', qc)
+    monkeypatch.setattr(performance, '_refreshing', set())
+    # Run refreshes inline so the test can see their effect
+    inline = BackgroundExecutor(workers=1)
+    inline.add_queue("refresh", max_depth=0, overflow=RUN_INLINE)
+    monkeypatch.setattr(performance, 'executor', inline)
+    monkeypatch.setitem(query_cache.FRESHNESS, 'live', (0.05, 60))
+    return qc
+
+
+def test_classification():
+    assert classify_freshness("IND vs AUS live score") == "live"
+    assert classify_freshness("petrol prices in delhi") == "live"
+    assert classify_freshness("latest iphone launch") == "daily"
+    assert classify_freshness("Stockholm is the capital of?") == "static"
+    assert classify_freshness("what is recursion") == "static"
+
+
+def test_stale_live_answer_is_served_then_refreshed(cache):
+    performance.cache_response("cricket score", "IND 100/1", engine='general')
+    assert performance.get_cached_response("cricket score", refresh=lambda: "IND 120/1") == "IND 100/1"
+
+    time.sleep(0.06)
+    calls = []
+    def refresh():
+        calls.append(1)
+        return "IND 180/2"
+    # Past the soft TTL: the old answer comes back immediately, the refresh replaces it
+    assert performance.get_cached_response("cricket score", refresh=refresh) == "IND 100/1"
+    assert calls == [1]
+    assert performance.get_cached_response("cricket score", refresh=refresh) == "IND 180/2"
+    assert performance.get_cache_stats()['revalidation']['refreshes'] >= 1
+
+
+def test_static_answers_never_go_stale(cache):
+    performance.cache_response("what is python", "A language.")
+    time.sleep(0.06)
+    assert cache.lookup("what is python") == ("A language.", False)
+
+
+def test_failed_refresh_keeps_serving_stale(cache):
+    performance.cache_response("weather in delhi", "32°C")
+    time.sleep(0.06)
+    def broken():
+        raise RuntimeError("search down")
+    assert performance.get_cached_response("weather in delhi", refresh=broken) == "32°C"
+    assert performance.get_cached_response("weather in delhi", refresh=broken) == "32°C"
+    assert not performance._refreshing
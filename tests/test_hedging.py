@@ -0,0 +1,81 @@
+import threading
+import time
+
+from vyom.core.hedging import Hedger
+
+
+def attempt(answer, seconds=0.0, calls=None, name=None):
+    def fn():
+        if calls is not None:
+            calls.append(name or answer)
+        time.sleep(seconds)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    return fn
+
+
+def hedger(**kwargs):
+    kwargs.setdefault("min_delay", 0.05)
+    kwargs.setdefault("max_delay", 0.05)
+    return Hedger(enabled=True, **kwargs)
+
+
+def test_a_slow_primary_is_raced_and_the_hedge_wins():
+    h = hedger()
+    started = time.perf_counter()
+    result = h.run([("flash", attempt("slow", 1.0)), ("pro", attempt("fast"))])
+    assert result == "fast"
+    assert time.perf_counter() - started < 0.5
+    stats = h.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1 and stats["discarded"] == 1
+
+
+def test_a_fast_primary_sends_no_hedge():
+    h = hedger()
+    calls = []
+    assert h.run([("flash", attempt("a", calls=calls)), ("pro", attempt("b", calls=calls))]) == "a"
+    assert calls == ["a"]
+    assert h.stats()["hedges"] == 0
+
+
+def test_hedge_budget_bounds_extra_requests():
+    h = hedger(budget=1)
+    calls = []
+    result = h.run([("m", attempt("first", 0.3, calls)), ("m", attempt("second", 0.3, calls)),
+                    ("m", attempt("third", 0.0, calls))])
+    # Only one hedge may go out, so "third" is never started while the first two are in flight
+    assert result in ("first", "second")
+    assert calls == ["first", "second"]
+    assert h.stats()["hedges"] == 1
+
+
+def test_failures_fall_through_to_the_next_attempt():
+    h = hedger()
+    result = h.run([("flash", attempt(RuntimeError("429"))), ("flash", attempt(None)), ("pro", attempt("ok"))])
+    assert result == "ok"
+    assert h.stats()["fallbacks"] == 2
+    assert h.run([("flash", attempt(RuntimeError("boom")))]) is None
+    assert h.stats()["failed"] == 1
+
+
+def test_disabled_runs_attempts_one_by_one_in_the_calling_thread():
+    h = Hedger(enabled=False)
+    threads = []
+
+    def fn(answer):
+        def call():
+            threads.append(threading.current_thread())
+            return answer
+        return call
+
+    assert h.run([("flash", fn(None)), ("pro", fn("ok")), ("pro", fn("unused"))]) == "ok"
+    assert threads == [threading.current_thread()] * 2
+
+
+def test_delay_follows_the_models_latency_percentile():
+    h = Hedger(enabled=True, percentile=0.9, min_delay=0.0, max_delay=10.0)
+    for i in range(1, 101):
+        h.observe("flash", i / 100)
+    assert abs(h.delay("flash") - 0.91) < 1e-9
+    assert h.delay("unseen") == 2.0
@@ -0,0 +1,405 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from vyom.core import database
+from vyom.core import history as history_manager
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'test_history.db')
+    monkeypatch.setattr(history_manager, 'DB_FILE', db_file)
+    history_manager._invalidate_user()
+    history_manager._initialize_database()
+    yield db_file
+    database.get_pool(db_file).close_all()
+
+
+def test_connection_pragmas(fresh_db):
+    with history_manager.get_db_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+
+def test_connection_reused_per_thread(fresh_db):
+    with history_manager.get_db_connection() as first:
+        pass
+    with history_manager.get_db_connection() as second:
+        assert first is second
+
+    other = []
+    def grab():
+        with history_manager.get_db_connection() as conn:
+            other.append(conn)
+    t = threading.Thread(target=grab)
+    t.start(); t.join()
+    assert other[0] is not first
+
+
+def test_uncommitted_work_is_rolled_back(fresh_db):
+    with history_manager.get_db_connection() as conn:
+        conn.execute("INSERT INTO users (device_id, name, email, created) VALUES ('d1', 'A', 'a@b.co', 0)")
+    assert history_manager.get_user('d1') is None
+
+
+HOT_QUERIES = {
+    'sessions': ("SELECT id, title FROM chats WHERE user_id = ? ORDER BY created DESC", ('d1',)),
+    'history': ("SELECT role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY timestamp ASC", ('c1',)),
+    'login': ("SELECT * FROM users WHERE email = ?", ('a@b.co',)),
+    'delete': ("DELETE FROM messages WHERE chat_id = ?", ('c1',)),
+}
+
+
+def _plan(conn, sql, params):
+    return " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_migrations_add_hot_path_indexes(tmp_path):
+    from vyom.core import migrations
+    pool = database.ConnectionPool(str(tmp_path / 'plans.db'))
+    with pool.connection() as conn:
+        migrations.apply_migrations(conn, target=1)
+        before = {name: _plan(conn, *q) for name, q in HOT_QUERIES.items()}
+        assert all('SCAN' in plan for plan in before.values()), before
+
+        assert migrations.apply_migrations(conn) == migrations.LATEST_VERSION - 1
+        after = {name: _plan(conn, *q) for name, q in HOT_QUERIES.items()}
+        for name, plan in after.items():
+            assert 'USING' in plan and 'INDEX' in plan, (name, plan)
+        assert 'TEMP B-TREE' not in after['sessions'] + after['history']
+
+        # Already current: nothing to do
+        assert migrations.apply_migrations(conn) == 0
+        assert migrations.get_version(conn) == migrations.LATEST_VERSION
+    pool.close_all()
+
+
+def test_migrations_upgrade_pre_versioning_database(tmp_path):
+    import sqlite3
+    from vyom.core import migrations
+    db_file = str(tmp_path / 'legacy.db')
+    legacy = sqlite3.connect(db_file)
+    legacy.execute("CREATE TABLE users (device_id TEXT PRIMARY KEY, name TEXT NOT NULL, email TEXT NOT NULL, created REAL NOT NULL, api_key TEXT, gender TEXT)")
+    legacy.execute("INSERT INTO users (device_id, name, email, created, gender) VALUES ('d1', 'A', 'a@b.co', 0, 'F')")
+    legacy.commit()
+    legacy.close()
+
+    pool = database.ConnectionPool(db_file)
+    with pool.connection() as conn:
+        migrations.apply_migrations(conn)
+        row = conn.execute("SELECT gender, api_keys, last_location FROM users WHERE device_id = 'd1'").fetchone()
+        assert tuple(row) == ('F', None, None)
+    pool.close_all()
+
+
+def _new_user_chat(device_id='d1'):
+    history_manager.register_user(device_id, 'Tester', f'{device_id}@example.com')
+    return history_manager.start_new_chat(device_id)['id']
+
+
+def test_queued_messages_visible_before_flush_and_ordered(fresh_db):
+    chat_id = _new_user_chat()
+    writer = history_manager._writer
+    for i in range(20):
+        history_manager.queue_chat_message('d1', chat_id, f'question {i}', role='user')
+        history_manager.queue_chat_message('d1', chat_id, f'answer {i}', role='assistant')
+
+    # Readers see every message immediately, no duplicates, in queue order
+    seen = history_manager.get_chat_history('d1', chat_id)
+    assert [m['content'] for m in seen][:2] == ['question 0', 'answer 0']
+    assert len(seen) == 40
+
+    batches_before = writer.batches_written
+    assert history_manager.flush_pending_writes()
+    assert writer.pending_for(chat_id) == []
+    assert writer.batches_written - batches_before < 40  # coalesced
+
+    stored = history_manager.get_chat_history('d1', chat_id)
+    assert [m['content'] for m in stored] == [m['content'] for m in seen]
+    assert history_manager.get_chat_sessions('d1')[0]['title'] == 'question 0'
+
+
+def test_queued_message_for_foreign_chat_is_ignored(fresh_db):
+    chat_id = _new_user_chat('owner')
+    history_manager.register_user('intruder', 'X', 'x@example.com')
+    history_manager.queue_chat_message('intruder', chat_id, 'hi', role='user')
+    assert history_manager.get_chat_history('owner', chat_id) == []
+    assert history_manager.flush_pending_writes()
+    assert history_manager.get_chat_history('owner', chat_id) == []
+
+
+def test_chat_counters_follow_inserts(fresh_db):
+    chat_id = _new_user_chat()
+    history_manager.add_to_chat_history('d1', chat_id, 'how do magnets work', role='user')
+    history_manager.add_to_chat_history('d1', chat_id, 'x' * 500, role='assistant')
+
+    latest = history_manager.get_chat_sessions('d1')[0]
+    assert latest['id'] == chat_id
+    assert latest['title'] == 'how do magnets work'
+    assert latest['message_count'] == 2
+    assert latest['last_message_preview'] == 'x' * history_manager.PREVIEW_CHARS
+
+    with history_manager.get_db_connection() as conn:
+        plan = _plan(conn, "SELECT id FROM chats WHERE user_id = ? ORDER BY COALESCE(last_message_at, created) DESC", ('d1',))
+    assert 'idx_chats_user_activity' in plan and 'TEMP B-TREE' not in plan
+
+
+def test_counter_backfill_migration(tmp_path):
+    from vyom.core import migrations
+    pool = database.ConnectionPool(str(tmp_path / 'backfill.db'))
+    with pool.connection() as conn:
+        migrations.apply_migrations(conn, target=2)
+        conn.execute("INSERT INTO users (device_id, name, email, created) VALUES ('d1', 'A', 'a@b.co', 0)")
+        conn.execute("INSERT INTO chats (id, user_id, title, created) VALUES ('c1', 'd1', 't', 0)")
+        conn.execute("INSERT INTO chats (id, user_id, title, created) VALUES ('c2', 'd1', 't', 0)")
+        conn.executemany("INSERT INTO messages (chat_id, role, content, timestamp) VALUES ('c1', 'user', ?, ?)",
+                         [('first', 1.0), ('second', 2.0)])
+        conn.commit()
+
+        migrations.apply_migrations(conn)
+        rows = {r['id']: tuple(r)[1:] for r in conn.execute(
+            "SELECT id, message_count, last_message_at, last_message_preview FROM chats")}
+    assert rows == {'c1': (2, 2.0, 'second'), 'c2': (0, None, None)}
+    pool.close_all()
+
+
+def test_keyset_pagination_and_recent_messages(fresh_db):
+    chat_id = _new_user_chat()
+    for i in range(25):
+        history_manager.add_to_chat_history('d1', chat_id, f'm{i}', role='user')
+
+    pages, before = [], None
+    while True:
+        page = history_manager.get_chat_history_page('d1', chat_id, limit=10, before=before)
+        pages.append([m['content'] for m in page['messages']])
+        if not page['has_more']:
+            break
+        before = page['next_before']
+    assert pages == [[f'm{i}' for i in range(15, 25)], [f'm{i}' for i in range(5, 15)], [f'm{i}' for i in range(5)]]
+
+    history_manager.queue_chat_message('d1', chat_id, 'queued', role='assistant')
+    recent = history_manager.get_recent_messages('d1', chat_id, 3)
+    assert [m['content'] for m in recent] == ['m23', 'm24', 'queued']
+    assert [m['content'] for m in history_manager.iter_chat_history('d1', chat_id)][-2:] == ['m24', 'queued']
+    assert history_manager.get_chat_history_page('intruder', chat_id) is None
+
+    with history_manager.get_db_connection() as conn:
+        plan = _plan(conn, "SELECT id FROM messages WHERE chat_id = ? AND (timestamp, id) < "
+                           "(SELECT timestamp, id FROM messages WHERE id = ? AND chat_id = ?) "
+                           "ORDER BY timestamp DESC, id DESC LIMIT 10", (chat_id, 5, chat_id))
+    assert 'idx_messages_chat_time' in plan and 'TEMP B-TREE' not in plan
+    history_manager.flush_pending_writes()
+
+
+def test_search_is_ranked_highlighted_and_scoped(fresh_db):
+    chat_id = _new_user_chat('d1')
+    other_chat = _new_user_chat('d2')
+    history_manager.add_to_chat_history('d1', chat_id, 'How do I reverse a list in Python?', role='user')
+    history_manager.add_to_chat_history('d1', chat_id, 'Use <b>reversed()</b> or list slicing with python [::-1].', role='assistant')
+    history_manager.add_to_chat_history('d2', other_chat, 'python secrets of another user', role='user')
+
+    found = history_manager.search_messages('d1', 'pyth')
+    assert [r['chat_id'] for r in found['results']] == [chat_id, chat_id]
+    assert all('<mark>' in r['snippet'] for r in found['results'])
+    assert '&lt;b&gt;' in found['results'][1]['snippet'] or '&lt;b&gt;' in found['results'][0]['snippet']
+
+    page = history_manager.search_messages('d1', 'python', limit=1)
+    assert len(page['results']) == 1 and page['has_more']
+    assert history_manager.search_messages('d1', 'secrets')['results'] == []
+    assert history_manager.search_messages('d1', '") * (')['results'] == []
+
+    # Deleting the chat removes it from the index
+    history_manager.delete_chat('d1', chat_id)
+    assert history_manager.search_messages('d1', 'python')['results'] == []
+
+
+def test_profile_cache_hits_and_invalidates(fresh_db):
+    history_manager.register_user('d1', 'Tester', 'd1@example.com')
+    before = history_manager.get_profile_cache_stats()
+
+    first = history_manager.get_user('d1')
+    first['api_keys']['leak'] = 'x'  # callers get copies
+    assert history_manager.get_user('d1')['api_keys'] == {}
+    stats = history_manager.get_profile_cache_stats()
+    assert stats['hits'] - before['hits'] >= 1
+
+    history_manager.save_user_preferences('d1', default_engine='coding')
+    assert history_manager.get_user('d1')['default_engine'] == 'coding'
+    history_manager.save_user_api_keys('d1', {'gemini': 'k'})
+    assert history_manager.get_user('d1')['api_keys'] == {'gemini': 'k'}
+    history_manager.update_user('d1', {'name': 'Renamed'})
+    assert history_manager.get_user('d1')['name'] == 'Renamed'
+
+    # Unknown devices are cached as None until they register
+    assert history_manager.get_user('d2') is None
+    history_manager.register_user('d2', 'New', 'd2@example.com')
+    assert history_manager.get_user('d2')['name'] == 'New'
+
+
+def test_device_links_made_by_another_worker_apply_at_once(fresh_db):
+    history_manager.register_user('laptop', 'Asha', 'asha@x.co')
+    history_manager.register_user('phone', 'Guest', 'guest@x.co')
+    assert history_manager.get_user('phone')['name'] == 'Guest'
+
+    # Another worker links the phone to the laptop's account; this one's profile cache isn't told
+    with history_manager.get_db_connection('phone') as conn:
+        conn.execute("INSERT OR REPLACE INTO devices (device_id, account_id, linked_at) VALUES (?, ?, ?)",
+                     ('phone', 'laptop', time.time()))
+        conn.commit()
+    assert history_manager.resolve_account('phone') == 'laptop'
+    assert history_manager.get_user('phone')['name'] == 'Asha'
+
+
+def test_idle_chat_archive_and_rehydrate(fresh_db):
+    chat_id = _new_user_chat()
+    for i in range(30):
+        history_manager.add_to_chat_history('d1', chat_id, f'long answer {i} ' + 'lorem ipsum ' * 50, role='assistant')
+    original = history_manager.get_chat_history('d1', chat_id)
+    with history_manager.get_db_connection() as conn:
+        conn.execute("UPDATE chats SET last_message_at = last_message_at - 90 * 86400 WHERE id = ?", (chat_id,))
+        conn.commit()
+
+    report = history_manager.archive_idle_chats(idle_days=30)
+    assert report['chats'] == 1 and report['messages'] == 30
+    assert report['reclaimed_bytes'] > 0
+    assert history_manager.get_archive_stats()['chats'] == 1
+    with history_manager.get_db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()[0] == 0
+
+    # First touch brings it back exactly as it was
+    assert history_manager.get_chat_history('d1', chat_id) == original
+    assert history_manager.get_archive_stats()['chats'] == 0
+    assert history_manager.search_messages('d1', 'lorem')['results']
+
+    # Writing to an archived chat rehydrates it inside the insert transaction
+    history_manager.archive_idle_chats(idle_days=30)
+    history_manager.add_to_chat_history('d1', chat_id, 'new question', role='user')
+    messages = history_manager.get_chat_history('d1', chat_id)
+    assert len(messages) == 31 and messages[-1]['content'] == 'new question'
+
+
+@pytest.fixture
+def sharded_db(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'sharded.db')
+    monkeypatch.setattr(history_manager, 'DB_FILE', db_file)
+    monkeypatch.setattr(history_manager, 'DB_SHARDS', 4)
+    history_manager._invalidate_user()
+    history_manager._initialize_database()
+    yield db_file
+    database.close_all_pools()
+
+
+def test_sharded_storage_routes_and_merges(sharded_db):
+    from vyom.core import storage
+
+    storage_ = history_manager.get_storage()
+    assert len(storage_.files) == 4
+
+    ids = [f"dev-{i}" for i in range(40)]
+    for device_id in ids:
+        history_manager.register_user(device_id, 'N', f'{device_id}@x.co')
+    # Rows land only in the owning shard
+    for device_id in ids:
+        for index in range(4):
+            with storage_.shard_connection(index) as conn:
+                found = conn.execute("SELECT 1 FROM users WHERE device_id = ?", (device_id,)).fetchone()
+            assert bool(found) == (index == storage_.shard_for(device_id))
+    assert len(history_manager.get_all_users()) == 40
+
+    old_id = ids[0]
+    new_id = next(d for d in ids if storage_.shard_for(d) != storage_.shard_for(old_id))
+    chat_id = history_manager.get_chat_sessions(old_id)[0]['id']
+    history_manager.add_to_chat_history(old_id, chat_id, 'user: ported over')
+    assert history_manager.find_user_by_email(f'{old_id}@x.co')['device_id'] == old_id
+
+    history_manager.link_device_to_user(old_id, new_id)
+    # new_id was an account of its own: its chats are adopted and it now resolves to old_id
+    assert history_manager.resolve_account(new_id) == old_id
+    assert history_manager.get_user(new_id)['email'] == f'{old_id}@x.co'
+    assert len(history_manager.get_chat_sessions(new_id)) == 2
+    assert [m['content'] for m in history_manager.get_chat_history(new_id, chat_id)] == ['ported over']
+    assert history_manager.search_messages(new_id, 'ported')['results']
+
+    report = storage.reshard(sharded_db, 4, 2)
+    assert report['users'] == 39
+    resharded = storage.ShardedSQLiteStorage(sharded_db, 2)
+    with resharded.connection(old_id) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()[0] == 1
+    with resharded.connection(new_id) as conn:
+        assert conn.execute("SELECT account_id FROM devices WHERE device_id = ?", (new_id,)).fetchone()[0] == old_id
+
+
+def test_login_links_device_without_moving_chats(fresh_db):
+    history_manager.register_user('laptop', 'Asha', 'asha@x.co')
+    chat_id = history_manager.get_chat_sessions('laptop')[0]['id']
+    history_manager.add_to_chat_history('laptop', chat_id, 'user: first message')
+
+    with history_manager.get_db_connection() as conn:
+        before = conn.total_changes
+        history_manager.link_device_to_user('laptop', 'phone')
+        assert conn.total_changes - before == 1  # one devices row, chats untouched
+        assert conn.execute("SELECT user_id FROM chats WHERE id = ?", (chat_id,)).fetchone()[0] == 'laptop'
+
+    # Everything on the new device goes through the account
+    assert history_manager.get_user('phone')['email'] == 'asha@x.co'
+    history_manager.queue_chat_message('phone', chat_id, 'from the phone', role='user')
+    history_manager.flush_pending_writes()
+    assert [m['content'] for m in history_manager.get_chat_history('laptop', chat_id)] == ['first message', 'from the phone']
+    history_manager.save_user_preferences('phone', default_model='gemini-2.5-pro')
+    assert history_manager.get_user('laptop')['default_model'] == 'gemini-2.5-pro'
+
+    # Logging in again is a no-op; the original device keeps working
+    history_manager.link_device_to_user('laptop', 'phone')
+    assert history_manager.resolve_account('laptop') == 'laptop'
+    assert len(history_manager.get_all_users()) == 1
+
+
+def test_batch_retry_does_not_rewrite_shards_that_already_committed(sharded_db, monkeypatch):
+    storage_ = history_manager.get_storage()
+    first = next(f"dev-{i}" for i in range(40) if storage_.shard_for(f"dev-{i}") == 0)
+    later = next(f"dev-{i}" for i in range(40) if storage_.shard_for(f"dev-{i}") > 0)
+    chats = {d: _new_user_chat(d) for d in (first, later)}
+
+    real_insert = history_manager._insert_message
+    failures = []
+    def flaky_insert(conn, device_id, *args):
+        if device_id == later and not failures:
+            failures.append(device_id)
+            raise sqlite3.OperationalError("database is locked")
+        return real_insert(conn, device_id, *args)
+    monkeypatch.setattr(history_manager, '_insert_message', flaky_insert)
+
+    writer = history_manager.HistoryWriter(history_manager._write_batch)
+    for d in (first, later):
+        writer.submit({"device_id": d, "chat_id": chats[d], "role": "user", "content": f"hi from {d}", "timestamp": time.time()})
+    assert writer.flush()
+
+    assert failures and writer.records_dropped == 0
+    for d in (first, later):
+        assert [m['content'] for m in history_manager.get_chat_history(d, chats[d])] == [f"hi from {d}"]
+        assert history_manager.get_chat_sessions(d)[0]['message_count'] == 1
+
+
+def test_a_failed_batch_only_counts_uncommitted_records_as_dropped(sharded_db, monkeypatch):
+    storage_ = history_manager.get_storage()
+    first = next(f"dev-{i}" for i in range(40) if storage_.shard_for(f"dev-{i}") == 0)
+    later = next(f"dev-{i}" for i in range(40) if storage_.shard_for(f"dev-{i}") > 0)
+    chats = {d: _new_user_chat(d) for d in (first, later)}
+
+    real_insert = history_manager._insert_message
+    def broken_insert(conn, device_id, *args):
+        if device_id == later:
+            raise sqlite3.OperationalError("disk I/O error")
+        return real_insert(conn, device_id, *args)
+    monkeypatch.setattr(history_manager, '_insert_message', broken_insert)
+
+    writer = history_manager.HistoryWriter(history_manager._write_batch, retries=2)
+    for d in (first, later):
+        writer.submit({"device_id": d, "chat_id": chats[d], "role": "user", "content": f"hi from {d}", "timestamp": time.time()})
+    writer.flush()
+
+    assert (writer.records_written, writer.records_dropped) == (1, 1)
@@ -0,0 +1,136 @@
+from contextlib import nullcontext
+
+import pytest
+from google.genai.errors import APIError
+
+from vyom.core.key_scheduler import KeyModelScheduler, classify_error
+
+MODELS = ["flash", "pro"]
+
+
+def api_error(code, status, reason=None, message="error"):
+    """What the SDK raises for an error response."""
+    body = {"error": {"code": code, "status": status, "message": message}}
+    if reason:
+        body["error"]["details"] = [{"@type": "type.googleapis.com/google.rpc.ErrorInfo", "reason": reason}]
+    return APIError(code, body)
+
+
+QUOTA = api_error(429, "RESOURCE_EXHAUSTED")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def scheduler(clock):
+    return KeyModelScheduler(clock=clock)
+
+
+def test_quota_errors_cool_the_pair_down_exponentially(scheduler, clock):
+    scheduler.record_failure("k1", "flash", QUOTA)
+    assert ("k1", "flash") not in scheduler.plan(["k1", "k2"], MODELS)
+    assert scheduler.plan(["k1", "k2"], MODELS)[0] == ("k2", "flash")
+
+    clock.now += 6
+    assert ("k1", "flash") in scheduler.plan(["k1"], MODELS)
+    scheduler.record_failure("k1", "flash", QUOTA)
+    scheduler.record_failure("k1", "flash", QUOTA)
+    clock.now += 15 # second strike was 10s, third is 20s
+    assert ("k1", "flash") not in scheduler.plan(["k1"], MODELS)
+
+
+def test_not_found_blacklists_the_model_and_auth_the_key(scheduler):
+    scheduler.record_failure("k1", "pro", api_error(404, "NOT_FOUND"))
+    scheduler.record_failure("bad", "flash", api_error(400, "INVALID_ARGUMENT", reason="API_KEY_INVALID"))
+    assert scheduler.plan(["k1", "k2", "bad"], MODELS) == [("k1", "flash"), ("k2", "flash")]
+    stats = scheduler.stats()
+    assert stats["blacklisted_models"] == ["pro"]
+    assert all(k.startswith("key#") for k in stats["blacklisted_keys"])
+    assert "bad" not in str(stats)
+
+
+def test_repeated_errors_open_the_breaker(scheduler):
+    for _ in range(3):
+        scheduler.record_failure("k1", "flash", api_error(500, "INTERNAL"))
+    assert scheduler.plan(["k1"], MODELS) == [("k1", "pro")]
+    assert scheduler.stats()["breaker_opened"] == 1
+
+
+def test_spreads_load_across_healthy_keys_and_probes_when_all_are_cooling(scheduler):
+    scheduler.record_success("k1", "flash", 0.5)
+    assert scheduler.plan(["k1", "k2"], MODELS)[0] == ("k2", "flash")
+
+    for key in ("k1", "k2"):
+        for model in MODELS:
+            scheduler.record_failure(key, model, QUOTA)
+    assert len(scheduler.plan(["k1", "k2"], MODELS)) == 4
+
+
+def test_classify_error():
+    assert classify_error(api_error(429, "RESOURCE_EXHAUSTED")) == "quota"
+    assert classify_error(api_error(404, "NOT_FOUND")) == "not_found"
+    assert classify_error(api_error(403, "PERMISSION_DENIED")) == "auth"
+    assert classify_error(api_error(400, "INVALID_ARGUMENT", reason="API_KEY_INVALID")) == "auth"
+    assert classify_error("empty response") == "error"
+    # Only the code and status count, not what the message happens to mention
+    assert classify_error(api_error(400, "INVALID_ARGUMENT", message="quota for 404 users in 2429")) == "error"
+    assert classify_error(Exception("429 RESOURCE_EXHAUSTED")) == "error"
+
+
+def test_trinity_skips_a_rate_limited_key_on_the_next_request(monkeypatch):
+    from vyom.core import key_scheduler
+    from vyom.engines import trinity
+
+    calls = []
+
+    class FakeModels:
+        def __init__(self, key):
+            self.key = key
+
+        def generate_content(self, model, contents, config):
+            calls.append((self.key, model))
+            if self.key == "limited":
+                raise QUOTA
+            return type("Response", (), {"text": f"answer from {self.key}"})()
+
+    monkeypatch.setattr(key_scheduler, "gemini_scheduler", KeyModelScheduler())
+    monkeypatch.setattr(trinity, "gemini_scheduler", key_scheduler.gemini_scheduler)
+    monkeypatch.setattr(trinity, "gemini_checkout",
+                        lambda key, pinned=False: nullcontext(type("Client", (), {"models": FakeModels(key)})()))
+    monkeypatch.setattr(trinity, "api_keys", ["limited", "healthy"])
+
+    assert trinity.generate_response("hi") == "answer from healthy"
+    calls.clear()
+    assert trinity.generate_response("hi again") == "answer from healthy"
+    assert calls == [("healthy", "gemini-2.5-flash")]
+
+
+def test_byok_not_found_only_blocks_that_key_and_expired_blacklists_are_pruned(scheduler, clock):
+    scheduler.record_failure("user-key", "pro", api_error(404, "NOT_FOUND"), system=False)
+    assert scheduler.stats()["blacklisted_models"] == []
+    assert ("k1", "pro") in scheduler.plan(["k1", "user-key"], MODELS)
+    assert ("user-key", "pro") not in scheduler.plan(["k1", "user-key"], MODELS)
+
+    for i in range(5):
+        scheduler.record_failure("k1", f"made-up-{i}", api_error(404, "NOT_FOUND"))
+    clock.now += 3601
+    scheduler.record_failure("k1", "pro", api_error(404, "NOT_FOUND"))
+    assert list(scheduler._blocked_models) == ["pro"]
+
+
+def test_blocked_pairs_are_a_last_resort_instead_of_an_empty_plan(scheduler):
+    scheduler.record_failure("k1", "pro", api_error(404, "NOT_FOUND"))
+    scheduler.record_failure("k1", "flash", QUOTA)
+    # Cooling pairs come back before a blacklisted model
+    assert scheduler.plan(["k1"], MODELS) == [("k1", "flash"), ("k1", "pro")]
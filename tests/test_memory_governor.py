@@ -0,0 +1,93 @@
+import gc
+
+import pytest
+
+from vyom.core.memory_governor import MB, MemoryGovernor
+from vyom.core.response_cache import ResponseCache
+
+
+class FakeRSS:
+    def __init__(self, mb):
+        self.mb = mb
+
+    def __call__(self):
+        return int(self.mb * MB)
+
+
+@pytest.fixture(autouse=True)
+def restore_gc_threshold():
+    threshold = gc.get_threshold()
+    yield
+    gc.set_threshold(*threshold)
+
+
+def _governor(rss, **kw):
+    kw.setdefault("interval", 0)
+    kw.setdefault("cooldown", 0)
+    return MemoryGovernor(high_water_mb=100, critical_mb=200, rss_fn=rss, **kw)
+
+
+def test_below_high_water_does_not_collect_and_relaxes_gc(monkeypatch):
+    collections = []
+    monkeypatch.setattr(gc, "collect", lambda *a: collections.append(a) or 0)
+    governor = _governor(FakeRSS(50))
+
+    assert governor.check() is None
+    assert collections == []
+    assert gc.get_threshold()[0] > governor.default_thresholds[0]
+
+
+def test_high_water_collects_and_records_the_decision():
+    rss = FakeRSS(150)
+    governor = _governor(rss)
+    decision = governor.check()
+
+    assert decision["level"] == "high" and decision["action"] == "collect"
+    assert gc.get_threshold() == governor.default_thresholds
+    stats = governor.stats()
+    assert stats["collections"] == 1
+    assert stats["recent_decisions"] == [decision]
+
+
+def test_critical_shrinks_registered_caches():
+    cache = ResponseCache()
+    for i in range(10):
+        cache.set(f"k{i}", "x" * 100)
+    governor = _governor(FakeRSS(250), shrinkers={"response_cache": cache.shrink})
+    decision = governor.check()
+
+    assert decision["action"] == "collect+shrink"
+    assert decision["entries_dropped"]["response_cache"] == 5
+    assert len(cache) == 5
+
+
+def test_checks_are_rate_limited_and_collections_cool_down():
+    governor = _governor(FakeRSS(150), interval=60)
+    assert governor.check() is not None
+    assert governor.check() is None # inside the check interval
+
+    governor = _governor(FakeRSS(150), cooldown=60)
+    assert governor.check() is not None
+    assert governor.check() is None # above high water, but just collected
+    assert governor.stats()["checks"] == 2
+
+
+def test_critical_cools_down_and_stops_shrinking_once_it_stops_helping():
+    cache = ResponseCache()
+    for i in range(8):
+        cache.set(f"k{i}", "x" * 100)
+    rss = FakeRSS(250)
+    governor = _governor(rss, shrinkers={"response_cache": cache.shrink}, critical_cooldown=60)
+    assert governor.check()["action"] == "collect+shrink"
+    assert governor.check() is None # critical still has a cooldown
+    assert len(cache) == 4
+
+    # RSS didn't fall after that shrink: later critical collections leave the cache alone
+    governor.critical_cooldown = 0
+    assert governor.check()["action"] == "collect"
+    assert len(cache) == 4 and governor.stats()["shrinks_skipped"] == 1
+
+    # ...until memory grows past where shrinking stalled
+    rss.mb = 300
+    assert governor.check()["action"] == "collect+shrink"
+    assert len(cache) == 2
@@ -0,0 +1,82 @@
+import pytest
+
+from vyom.core.metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    registry = Registry()
+    latency = registry.histogram("t_seconds", "test", ("engine",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, engine="coding")
+
+    text = registry.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{engine="coding",le="0.1"} 1' in text
+    assert 't_seconds_bucket{engine="coding",le="1"} 2' in text
+    assert 't_seconds_bucket{engine="coding",le="+Inf"} 3' in text
+    assert 't_seconds_sum{engine="coding"} 5.55' in text
+    assert 't_seconds_count{engine="coding"} 3' in text
+
+
+def test_timer_fills_in_status_and_reraises():
+    registry = Registry()
+    calls = registry.histogram("call_seconds", "test", ("model", "status"))
+    with calls.time(model="gemini-2.5-flash"):
+        pass
+    with pytest.raises(RuntimeError):
+        with calls.time(model="gemini-2.5-flash"):
+            raise RuntimeError("429")
+    assert calls.count(model="gemini-2.5-flash", status="ok") == 1
+    assert calls.count(model="gemini-2.5-flash", status="error") == 1
+
+
+def test_counters_gauges_and_callbacks():
+    registry = Registry()
+    requests = registry.counter("req_total", "test", ("outcome",))
+    requests.inc(outcome="cache")
+    requests.inc(2, outcome="cache")
+    registry.gauge("depth", 'queue "depth"').set_function(lambda: 7)
+    with pytest.raises(ValueError):
+        requests.inc(engine="general")
+
+    text = registry.render()
+    assert 'req_total{outcome="cache"} 3' in text
+    assert 'depth 7' in text
+    assert registry.counter("req_total", "test", ("outcome",)) is requests
+
+
+def test_metrics_endpoint_reports_requests():
+    from app import app
+    client = app.test_client()
+    client.get('/models')
+    res = client.get('/metrics')
+    assert res.status_code == 200
+    assert res.mimetype == 'text/plain'
+    body = res.get_data(as_text=True)
+    assert 'vyom_http_server_seconds_count{endpoint="/models",method="GET",status="200"}' in body
+    assert 'vyom_background_queue_depth{queue="default"}' in body
+    assert 'vyom_background_tasks_total{queue="summaries",result="completed"}' in body
+
+
+def test_metrics_endpoint_is_operator_only(monkeypatch):
+    from app import app
+    client = app.test_client()
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.9'}).status_code == 403
+    assert client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.9'}).status_code == 403
+
+    monkeypatch.setenv('VYOM_ADMIN_TOKEN', 's3cret')
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_client_supplied_engine_and_model_names_are_labelled_other():
+    import app
+    from vyom.core import metrics
+    with app._engine_call(engine='engine-' + 'x' * 40, model='model-' + 'y' * 40):
+        pass
+    with app._engine_call(engine='coding', model='gemini-2.5-flash'):
+        pass
+    body = metrics.registry.render()
+    assert 'x' * 40 not in body and 'y' * 40 not in body
+    assert 'vyom_engine_seconds_count{engine="other",model="other",status="ok"}' in body
+    assert 'vyom_engine_seconds_count{engine="coding",model="gemini-2.5-flash",status="ok"}' in body
@@ -0,0 +1,57 @@
+import time
+
+from vyom.core.query_cache import HashingEmbedder, QueryCache, SemanticIndex, normalize_query
+from vyom.core.response_cache import ResponseCache
+
+
+def test_variants_share_one_canonical_key():
+    variants = ["What is Python?", "what is python", "what is  python ?", "WHAT IS PYTHON!", "whats python"]
+    assert {normalize_query(v) for v in variants} == {"what is python"}
+    assert normalize_query("Python kyaa hae?") == normalize_query("python kya hai")
+    # Math and decimals are part of the question
+    assert normalize_query("what is 3.14 * 2?") == "what is 3.14 * 2"
+    assert normalize_query("2+2") != normalize_query("2-2")
+
+
+def test_english_words_are_not_folded_as_hinglish():
+    for query in ("how to make hay bales", "who was attila the hun", "kia seltos price"):
+        assert normalize_query(query) == query
+    assert normalize_query("hay fever") != normalize_query("hai fever")
+
+
+def test_normalized_lookup_counts_layers():
+    cache = QueryCache(ResponseCache())
+    cache.set("What is Python?", "A language.")
+    assert cache.get("What is Python?") == "A language."
+    assert cache.get("what is python") == "A language."
+    assert cache.get("what is python", engine="coding") is None  # engines stay separate
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["normalized_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_semantic_layer_catches_typos_but_not_different_numbers():
+    cache = QueryCache(ResponseCache(), semantic=SemanticIndex(HashingEmbedder(), threshold=0.8))
+    cache.set("how does photosynthesis work", "Light -> sugar.")
+    cache.set("what is 2 + 2", "4")
+    cache.set("is coffee bad for health", "In moderation, no.")
+
+    assert cache.get("how does photosynthesis wrok") == "Light -> sugar."
+    assert cache.get("what is 2 + 3") is None
+    assert cache.get("is coffee not bad for health") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_semantic_hit_on_expired_entry_is_a_miss():
+    index = SemanticIndex(HashingEmbedder(), threshold=0.8)
+    cache = QueryCache(ResponseCache(), semantic=index)
+    cache.set("tell me about black holes", "Gravity wins.", ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get("tell me about black hole") is None
+    assert len(index) == 0
+
+
+def test_time_sensitive_queries_skip_the_semantic_layer():
+    cache = QueryCache(ResponseCache(), semantic=SemanticIndex(HashingEmbedder(), threshold=0.5))
+    cache.set("india vs australia score", "IND 250/3")
+    assert cache.get("india vs australia scores") is None
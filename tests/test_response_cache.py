@@ -0,0 +1,65 @@
+import threading
+import time
+
+from vyom.core.response_cache import ENTRY_OVERHEAD, ResponseCache
+
+
+def _budget(n_entries, value_len, key='k0'):
+    return n_entries * (value_len + len(key) + ENTRY_OVERHEAD)
+
+
+def test_evicts_least_recently_used_within_byte_budget():
+    cache = ResponseCache(max_bytes=_budget(3, 100))
+    for key in ('k1', 'k2', 'k3'):
+        cache.set(key, 'x' * 100)
+    assert cache.get('k1') == 'x' * 100   # k1 is now the most recently used
+    cache.set('k4', 'y' * 100)
+
+    assert 'k2' not in cache
+    assert all(k in cache for k in ('k1', 'k3', 'k4'))
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] <= stats['max_bytes']
+
+
+def test_large_answers_cost_more_than_small_ones():
+    cache = ResponseCache(max_bytes=_budget(4, 100))
+    for i in range(4):
+        cache.set(f'k{i}', 'x' * 100)
+    cache.set('big', 'z' * 250)  # costs 1.5 small entries: two of them have to go
+    assert len(cache) == 3
+    assert cache.stats()['evictions'] == 2
+    assert not cache.set('huge', 'z' * 10_000)
+    assert cache.stats()['rejected'] == 1
+
+
+def test_entries_expire_after_their_own_ttl():
+    cache = ResponseCache(max_bytes=_budget(10, 10), default_ttl=60)
+    cache.set('live', 'score 1-0', ttl=0.05)
+    cache.set('static', 'Paris')
+    time.sleep(0.1)
+
+    assert cache.get('live') is None
+    assert cache.get('static') == 'Paris'
+    stats = cache.stats()
+    assert stats['expirations'] == 1
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_concurrent_access_keeps_accounting_consistent():
+    cache = ResponseCache(max_bytes=_budget(50, 20))
+
+    def hammer(seed):
+        for i in range(2000):
+            key = f'k{(seed * 7 + i) % 120}'
+            if cache.get(key) is None:
+                cache.set(key, 'v' * 20)
+
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 8 * 2000
+    assert stats['bytes'] <= stats['max_bytes']
+    assert stats['entries'] == len(cache) <= 50
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from vyom.core.single_flight import SingleFlight
+
+
+def _run_concurrently(n, target):
+    results = [None] * n
+    def worker(i):
+        results[i] = target()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return results
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = []
+    def upstream():
+        calls.append(1)
+        time.sleep(0.1)
+        return "answer"
+
+    results = _run_concurrently(10, lambda: flight.do("q", upstream, timeout=5))
+    assert len(calls) == 1
+    assert [r[0] for r in results] == ["answer"] * 10
+    assert sum(shared for _, shared in results) == 9
+    stats = flight.stats()
+    assert (stats["leaders"], stats["calls_saved"], stats["in_flight"]) == (1, 9, 0)
+
+    # Once finished, the next caller starts a new flight
+    flight.do("q", upstream)
+    assert len(calls) == 2
+
+
+def test_follower_falls_back_after_timeout():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("q", lambda: release.wait(5) and "slow"))
+    leader.start()
+    time.sleep(0.02)
+
+    assert flight.do("q", lambda: "own call", timeout=0.05) == ("own call", False)
+    assert flight.stats()["timeouts"] == 1
+    release.set()
+    leader.join()
+
+
+def test_leader_error_is_shared_with_followers():
+    flight = SingleFlight()
+    def failing():
+        time.sleep(0.1)
+        raise RuntimeError("quota exhausted")
+
+    errors = []
+    def call():
+        try:
+            flight.do("q", failing, timeout=5)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    _run_concurrently(4, call)
+    assert errors == ["quota exhausted"] * 4
+    assert flight.stats()["shared_errors"] == 3
+
+
+def test_byok_and_system_key_calls_are_not_shared():
+    from vyom.core.optimizer import performance
+    system_calls = []
+
+    def byok():
+        time.sleep(0.1)
+        return "⚠️ Your personal API key failed. Please check it in settings."
+
+    def system():
+        system_calls.append(1)
+        time.sleep(0.1)
+        return "answer"
+
+    q = "byok burst question"
+    burst = [lambda: performance.coalesce(q, byok, api_key="user-key")] + \
+            [lambda: performance.coalesce(q, system) for _ in range(4)]
+    results = [None] * len(burst)
+    def worker(i):
+        results[i] = burst[i]()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(burst))]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert results[0].startswith("⚠️") and results[1:] == ["answer"] * 4
+    assert len(system_calls) == 1 # System-key callers still share among themselves
+
+    # A failure is never cached for the next asker
+    performance.cache_response(q, results[0])
+    assert performance.get_cached_response(q) is None
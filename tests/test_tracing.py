@@ -0,0 +1,112 @@
+import pytest
+
+from vyom.core import tracing
+from vyom.core.executor import BackgroundExecutor
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(enabled=True, path=str(path))
+    yield path
+    tracing.configure()
+
+
+def test_nested_spans_share_the_trace_and_link_parents(trace_file):
+    root = tracing.start_trace("POST /ask")
+    with tracing.span("cache"):
+        with tracing.span("engine.general", model="gemini-2.5-flash"):
+            pass
+    root.finish()
+    assert tracing.current() is None
+
+    spans = {s["name"]: s for s in tracing.get_trace(root.trace_id)}
+    assert set(spans) == {"POST /ask", "cache", "engine.general"}
+    assert spans["cache"]["parent_id"] == spans["POST /ask"]["span_id"]
+    assert spans["engine.general"]["parent_id"] == spans["cache"]["span_id"]
+    assert spans["engine.general"]["attrs"] == {"model": "gemini-2.5-flash"}
+
+
+def test_spans_outside_a_trace_are_not_recorded(trace_file):
+    with tracing.span("orphan") as span:
+        span.set(ignored=True)
+    assert not trace_file.exists() or trace_file.read_text() == ""
+
+
+def test_background_work_is_traced_under_the_request(trace_file):
+    executor = BackgroundExecutor(workers=1)
+    executor.add_queue("q")
+    root = tracing.start_trace("POST /ask")
+    def refresh():
+        with tracing.span("cache.refresh"):
+            pass
+    executor.submit("q", refresh)
+    root.finish()
+    assert executor.drain(5)
+
+    spans = {s["name"]: s for s in tracing.get_trace(root.trace_id)}
+    assert spans["cache.refresh"]["parent_id"] == spans["POST /ask"]["span_id"]
+    assert spans["cache.refresh"]["thread"] != spans["POST /ask"]["thread"]
+
+
+def test_errors_are_recorded_and_traces_read_back_from_file(trace_file):
+    root = tracing.start_trace("POST /ask", trace_id="client-supplied-id")
+    with pytest.raises(ValueError):
+        with tracing.span("llm"):
+            raise ValueError("quota exceeded")
+    root.finish()
+
+    tracing.configure(enabled=True, path=str(trace_file)) # Drops the in-memory buffer
+    spans = tracing.get_trace("client-supplied-id")
+    assert [s["name"] for s in spans] == ["POST /ask", "llm"]
+    assert spans[1]["status"] == "error" and "quota" in spans[1]["error"]
+
+    rows = tracing.waterfall(spans)
+    assert [r["depth"] for r in rows] == [0, 1]
+    assert rows[0]["offset_pct"] == 0
+
+
+def test_debug_trace_view(trace_file):
+    from app import app
+    client = app.test_client()
+    res = client.get('/models')
+    trace_id = res.headers['X-Trace-Id']
+
+    page = client.get(f'/debug/trace/{trace_id}')
+    assert page.status_code == 200
+    assert 'GET /models' in page.get_data(as_text=True)
+    assert client.get(f'/debug/trace/{trace_id}?format=json').get_json()["spans"][0]["attrs"]["status"] == 200
+    assert client.get('/debug/trace/unknown').status_code == 404
+
+
+def test_debug_trace_is_operator_only_and_ids_come_from_the_server(trace_file, monkeypatch):
+    from app import app
+    client = app.test_client()
+    res = client.get('/models', headers={'X-Trace-Id': 'someone-elses-trace'})
+    trace_id = res.headers['X-Trace-Id']
+    assert trace_id != 'someone-elses-trace'
+    assert tracing.get_trace(trace_id)[0]["attrs"]["client_trace_id"] == 'someone-elses-trace'
+
+    assert client.get(f'/debug/trace/{trace_id}', environ_base={'REMOTE_ADDR': '203.0.113.9'}).status_code == 403
+    monkeypatch.setenv('VYOM_ADMIN_TOKEN', 's3cret')
+    assert client.get(f'/debug/trace/{trace_id}').status_code == 403
+    assert client.get(f'/debug/trace/{trace_id}', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_file_lookups_are_capped_and_misses_remembered(trace_file, monkeypatch):
+    root = tracing.start_trace("GET /models")
+    root.finish()
+    tracing.configure(enabled=True, path=str(trace_file), keep=0) # Memory buffer gone, file kept
+
+    assert tracing.get_trace('"; rm -rf /') == []
+    opened = []
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda *a, **k: opened.append(a[0]) or real_open(*a, **k))
+    assert tracing.get_trace("0000000000000000") == []
+    scanned = len(opened)
+    assert tracing.get_trace("0000000000000000") == [] # Remembered: no second scan
+    assert scanned and len(opened) == scanned
+
+    tracing.configure(enabled=True, path=str(trace_file), keep=0)
+    tracing._config.scan_bytes = 10 # Smaller than one span line
+    assert tracing.get_trace(root.trace_id) == []
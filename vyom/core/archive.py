@@ -0,0 +1,79 @@
+"""
+VYOM CHAT ARCHIVE
+Cold-chat tiering: idle chats move out of `messages` into one compressed blob each.
+
+Features:
+1. Keeps the hot `messages` table (and its indexes) small enough to stay in page cache.
+2. One zlib/lzma blob per chat, original message ids preserved.
+3. Rehydration puts the messages back exactly as they were on first touch.
+
+All functions take an open connection and run inside the caller's transaction.
+"""
+
+import json
+import lzma
+import time
+import zlib
+
+CODECS = {
+    "zlib": (lambda raw: zlib.compress(raw, 9), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+DEFAULT_CODEC = "zlib"
+
+
+def pack(messages, codec=DEFAULT_CODEC):
+    raw = json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return CODECS[codec][0](raw), len(raw)
+
+
+def unpack(blob, codec):
+    return json.loads(CODECS[codec][1](blob).decode('utf-8'))
+
+
+def archive_chat(conn, chat_id, codec=DEFAULT_CODEC):
+    """
+    Moves a chat's messages into chat_archives.
+    Returns {"messages", "raw_bytes", "stored_bytes"} or None if there was nothing to archive.
+    """
+    rows = conn.execute(
+        "SELECT id, role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY timestamp ASC, id ASC",
+        (chat_id,)
+    ).fetchall()
+    if not rows:
+        return None
+    messages = [[r['id'], r['role'], r['content'], r['timestamp']] for r in rows]
+    blob, raw_bytes = pack(messages, codec)
+
+    conn.execute(
+        "INSERT OR REPLACE INTO chat_archives (chat_id, codec, data, message_count, raw_bytes, archived_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (chat_id, codec, blob, len(messages), raw_bytes, time.time())
+    )
+    conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+    conn.execute("UPDATE chats SET archived_at = ? WHERE id = ?", (time.time(), chat_id))
+    return {"messages": len(messages), "raw_bytes": raw_bytes, "stored_bytes": len(blob)}
+
+
+def rehydrate_chat(conn, chat_id):
+    """Restores an archived chat's messages (same ids) and drops the archive. Returns the message count."""
+    row = conn.execute("SELECT codec, data FROM chat_archives WHERE chat_id = ?", (chat_id,)).fetchone()
+    if row is not None:
+        messages = unpack(row['data'], row['codec'])
+        conn.executemany(
+            "INSERT OR IGNORE INTO messages (id, chat_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+            [(m[0], chat_id, m[1], m[2], m[3]) for m in messages]
+        )
+        conn.execute("DELETE FROM chat_archives WHERE chat_id = ?", (chat_id,))
+    conn.execute("UPDATE chats SET archived_at = NULL WHERE id = ?", (chat_id,))
+    return len(messages) if row is not None else 0
+
+
+def find_idle_chats(conn, idle_days, limit):
+    cutoff = time.time() - idle_days * 86400
+    rows = conn.execute(
+        "SELECT id FROM chats WHERE archived_at IS NULL AND message_count > 0 "
+        "AND COALESCE(last_message_at, created) < ? LIMIT ?",
+        (cutoff, limit)
+    ).fetchall()
+    return [r['id'] for r in rows]
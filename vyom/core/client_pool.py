@@ -0,0 +1,225 @@
+"""
+VYOM CLIENT POOL
+Long-lived Gemini clients, one per API key, shared by every engine and thread.
+
+Features:
+1. `gemini_client(key)` returns the same genai.Client for the same key, instead of a new
+   client (and a new HTTP connection + TLS handshake) per attempt.
+2. All Gemini clients share one httpx connection pool: keep-alive connections to the API
+   are reused across keys, requests and threads.
+3. System keys are pinned; BYOK keys are evicted after VYOM_CLIENT_IDLE_SECONDS unused,
+   and the least recently used ones go first past VYOM_CLIENT_MAX_BYOK.
+4. `checkout(key)` holds a client for the length of a request: a client evicted while
+   checked out is closed by its last user, never under a call still in flight.
+5. Created / reused / evicted counters via `stats()` (see benchmarks/client_pool_bench.py).
+
+VYOM_GEMINI_BASE_URL points every client at another endpoint (used by the benchmark's stub server).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class ClientPool:
+    """Thread-safe key -> client map with idle eviction for unpinned keys."""
+
+    def __init__(self, factory, idle_ttl=900.0, max_unpinned=64, close=None):
+        self.factory = factory
+        self.idle_ttl = idle_ttl
+        self.max_unpinned = max_unpinned
+        self.close_fn = close or _close_client
+        self._lock = threading.Lock()
+        self._pinned = {}
+        self._unpinned = OrderedDict() # key -> (client, last_used), least recently used first
+        self._in_use = {}   # id(client) -> open checkouts
+        self._retired = {}  # id(client) -> client evicted while checked out, closed on its last release
+        self._stats = {"created": 0, "reused": 0, "evicted": 0, "deferred_closes": 0}
+
+    def get(self, key, pinned=False):
+        """The client for `key`. For a single request prefer `checkout()`, which eviction waits for."""
+        return self._acquire(key, pinned, hold=False)
+
+    @contextmanager
+    def checkout(self, key, pinned=False):
+        """The client for `key`; if it is evicted meanwhile, it is only closed once the block exits."""
+        client = self._acquire(key, pinned, hold=True)
+        try:
+            yield client
+        finally:
+            self._release(client)
+
+    def _acquire(self, key, pinned, hold):
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict_idle(now)
+            client = self._pinned.get(key)
+            if client is None and key in self._unpinned:
+                client, _ = self._unpinned.pop(key)
+                if pinned:
+                    self._pinned[key] = client
+                else:
+                    self._unpinned[key] = (client, now)
+            if client is not None:
+                self._stats["reused"] += 1
+                if hold:
+                    self._hold(client)
+        if client is not None:
+            self._close(evicted)
+            return client
+
+        # Built outside the lock: client construction can be slow
+        client = self.factory(key)
+        with self._lock:
+            existing = self._pinned.get(key) or (self._unpinned.get(key) or (None,))[0]
+            if existing is not None:
+                # Another thread got there first; use theirs
+                evicted.append(client)
+                client = existing
+                self._stats["reused"] += 1
+            else:
+                self._stats["created"] += 1
+                if pinned:
+                    self._pinned[key] = client
+                else:
+                    self._unpinned[key] = (client, now)
+                    while len(self._unpinned) > self.max_unpinned:
+                        _, (old, _) = self._unpinned.popitem(last=False)
+                        evicted.append(old)
+                        self._stats["evicted"] += 1
+            if hold:
+                self._hold(client)
+        self._close(evicted)
+        return client
+
+    def _hold(self, client):
+        # Lock held
+        self._in_use[id(client)] = self._in_use.get(id(client), 0) + 1
+
+    def _release(self, client):
+        with self._lock:
+            remaining = self._in_use.pop(id(client)) - 1
+            if remaining:
+                self._in_use[id(client)] = remaining
+                return
+            retired = self._retired.pop(id(client), None)
+        if retired is not None:
+            self._close([retired])
+
+    def _evict_idle(self, now):
+        # Lock held. Entries are in last-use order, so stop at the first recent one.
+        evicted = []
+        while self._unpinned:
+            key, (client, last_used) = next(iter(self._unpinned.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            del self._unpinned[key]
+            evicted.append(client)
+            self._stats["evicted"] += 1
+        return evicted
+
+    def _close(self, clients):
+        closable = []
+        with self._lock:
+            for client in clients:
+                if id(client) in self._in_use:
+                    # A request is still using it: the last checkout closes it
+                    self._retired[id(client)] = client
+                    self._stats["deferred_closes"] += 1
+                else:
+                    closable.append(client)
+        for client in closable:
+            try:
+                self.close_fn(client)
+            except Exception as e:
+                print(f"⚠️ Client Pool: closing an evicted client failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            clients = list(self._pinned.values()) + [c for c, _ in self._unpinned.values()]
+            self._pinned.clear()
+            self._unpinned.clear()
+        self._close(clients)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pinned) + len(self._unpinned)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, pinned=len(self._pinned), byok=len(self._unpinned),
+                         in_use=sum(self._in_use.values()), closing=len(self._retired))
+        gets = stats["created"] + stats["reused"]
+        stats["reuse_rate"] = round(stats["reused"] / gets, 3) if gets else 0.0
+        return stats
+
+
+def _close_client(client):
+    close = getattr(client, "close", None)
+    if close is not None:
+        close()
+
+
+# --- GEMINI ---
+
+_gemini_pool = None
+_gemini_lock = threading.Lock()
+_http = None
+
+
+def _shared_http():
+    """One httpx connection pool behind every Gemini client (None if httpx isn't importable)."""
+    global _http
+    if _http is None:
+        try:
+            import httpx
+        except ImportError:
+            return None
+        with _gemini_lock:
+            if _http is None:
+                _http = httpx.Client(
+                    timeout=httpx.Timeout(120.0, connect=10.0),
+                    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=120.0),
+                )
+    return _http
+
+
+def _make_gemini_client(api_key):
+    from google import genai
+    from google.genai import types
+
+    options = {}
+    base_url = os.getenv("VYOM_GEMINI_BASE_URL")
+    if base_url:
+        options["base_url"] = base_url
+    if "httpx_client" in getattr(types.HttpOptions, "model_fields", {}):
+        http = _shared_http()
+        if http is not None:
+            options["httpx_client"] = http
+    # Older SDKs without httpx_client still get one keep-alive client per key
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(**options) if options else None)
+
+
+def gemini_pool():
+    global _gemini_pool
+    if _gemini_pool is None:
+        with _gemini_lock:
+            if _gemini_pool is None:
+                _gemini_pool = ClientPool(
+                    _make_gemini_client,
+                    idle_ttl=float(os.getenv("VYOM_CLIENT_IDLE_SECONDS", "900")),
+                    max_unpinned=int(os.getenv("VYOM_CLIENT_MAX_BYOK", "64")),
+                )
+    return _gemini_pool
+
+
+def gemini_client(api_key, pinned=False):
+    """The shared genai.Client for `api_key`. Pass pinned=True for system keys (never evicted)."""
+    return gemini_pool().get(api_key, pinned=pinned)
+
+
+def gemini_checkout(api_key, pinned=False):
+    """`with gemini_checkout(key) as client:` the shared client, kept open until the block exits."""
+    return gemini_pool().checkout(api_key, pinned=pinned)
@@ -0,0 +1,229 @@
+"""
+VYOM CONTEXT BUILDER
+Decides which part of a conversation goes to the model with each question.
+
+Features:
+1. `count_tokens()`: a fast token estimate, stored with every message when it is written.
+2. Per-engine token budgets (ENGINE_BUDGETS, or VYOM_CONTEXT_TOKENS for all engines;
+   0 turns conversation context off), filled with the most recent turns first.
+   A single very long message (a big code answer) is cut to MAX_MESSAGE_TOKENS.
+3. Turns that no longer fit are folded into a rolling summary per chat, stored on the
+   chat row. Only the newly dropped turns are folded in each time (summary + new turns ->
+   new summary), in the background, so the next question pays nothing for it.
+4. The summarizer is pluggable (Trinity passes an LLM one); without one, or if it fails,
+   an extractive summary (the opening line of each turn) is used.
+5. Summaries are cached in memory; prompt token counts go to vyom_context_tokens.
+"""
+
+import math
+import os
+import threading
+
+from cachetools import TTLCache
+
+ENGINE_BUDGETS = {
+    "general": 1500,
+    "coding": 4000,
+    "math": 1500,
+    "reasoning": 3000,
+    "trinity": 3000,
+}
+DEFAULT_BUDGET = 1500
+WINDOW = 40               # Most recent messages considered for the raw turns
+MAX_MESSAGE_TOKENS = 600  # Longest single turn sent as is
+SUMMARY_TOKENS = 400      # Longest summary kept
+FOLD_MIN = 2              # Dropped turns needed before a summary refresh is worth it
+FOLD_LIMIT = 40           # Most turns folded in one refresh
+
+
+def count_tokens(text):
+    """
+    Approximate model token count without a tokenizer round trip: ~4 ASCII characters
+    per token, ~2 per token for other scripts (Devanagari, emoji...). Errs high.
+    """
+    if not text:
+        return 0
+    text = str(text)
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return max(1, math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2))
+
+
+def budget_for(engine):
+    override = os.getenv("VYOM_CONTEXT_TOKENS")
+    if override is not None:
+        return int(override)
+    return ENGINE_BUDGETS.get(engine, DEFAULT_BUDGET)
+
+
+def clip(text, max_tokens):
+    """`text` cut down to about `max_tokens` tokens."""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = max(0, int(len(text) * max_tokens / tokens) - 2)
+    return text[:keep].rstrip() + " …"
+
+
+def extractive_summary(previous, turns):
+    """Summary from the opening line of each turn, newest kept when it runs over SUMMARY_TOKENS."""
+    lines = previous.split("\n") if previous else []
+    for turn in turns:
+        first = turn['content'].strip().split("\n", 1)[0]
+        lines.append(f"{'User' if turn['role'] == 'user' else 'Vyom'}: {clip(first, 40)}")
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > SUMMARY_TOKENS:
+        lines.pop(0)
+    return clip("\n".join(lines), SUMMARY_TOKENS)
+
+
+class ContextBuilder:
+    def __init__(self, submit=None, cache_size=4096, cache_ttl=900):
+        self._submit = submit
+        self._summaries = TTLCache(maxsize=cache_size, ttl=cache_ttl) # (device, chat) -> (summary, until)
+        self._lock = threading.Lock()
+        self._folding = set() # Chats with a summary refresh in flight
+        self._stats = {"built": 0, "turns_sent": 0, "turns_dropped": 0, "clipped": 0,
+                       "summaries": 0, "summary_fallbacks": 0, "summary_failures": 0}
+
+    def _history(self):
+        from vyom.core import history as history_manager # history imports count_tokens from here
+        return history_manager
+
+    def _submit_fold(self, fn):
+        if self._submit is not None:
+            return self._submit(fn)
+        from vyom.core.optimizer import performance
+        return performance.submit("summaries", fn)
+
+    def _bump(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def summary(self, device_id, chat_id):
+        key = (device_id, chat_id)
+        with self._lock:
+            found = self._summaries.get(key)
+        if found is None:
+            found = self._history().get_chat_summary(device_id, chat_id)
+            with self._lock:
+                self._summaries[key] = found
+        return found
+
+    def build(self, device_id, chat_id, engine="general", summarize=None):
+        """
+        Context for the next question in a chat:
+        {"summary": str or None, "turns": [{"role", "content"}...oldest first], "tokens": int}.
+        Schedules a summary refresh when turns had to be left out.
+        """
+        context = {"summary": None, "turns": [], "tokens": 0}
+        budget = budget_for(engine)
+        if budget <= 0 or not (device_id and chat_id):
+            return context
+        recent = self._history().get_recent_messages(device_id, chat_id, WINDOW) or []
+        summary, until = self.summary(device_id, chat_id)
+        # Turns already in the summary are never sent twice
+        messages = [m for m in recent if until is None or m['timestamp'] > until]
+
+        remaining = budget
+        if summary:
+            summary = clip(summary, min(SUMMARY_TOKENS, budget // 2))
+            remaining -= count_tokens(summary)
+        kept = []
+        for msg in reversed(messages):
+            cost = min(msg['tokens'], MAX_MESSAGE_TOKENS)
+            if cost > remaining and kept:
+                break
+            content = msg['content']
+            if msg['tokens'] > min(MAX_MESSAGE_TOKENS, remaining):
+                content = clip(content, max(1, min(MAX_MESSAGE_TOKENS, remaining)))
+                self._bump("clipped")
+            kept.append({"role": msg['role'], "content": content})
+            remaining -= min(cost, remaining)
+        kept.reverse()
+        dropped = len(messages) - len(kept)
+
+        context.update(summary=summary or None, turns=kept, tokens=budget - remaining)
+        with self._lock:
+            self._stats["built"] += 1
+            self._stats["turns_sent"] += len(kept)
+            self._stats["turns_dropped"] += dropped
+        _observe_tokens(engine, context["tokens"])
+
+        # A full window the summary doesn't reach into may have never-folded turns behind it
+        if dropped >= FOLD_MIN or len(messages) == WINDOW:
+            oldest_kept = messages[dropped]['timestamp'] if kept else None
+            self._schedule_fold(device_id, chat_id, until, oldest_kept, summarize)
+        return context
+
+    def _schedule_fold(self, device_id, chat_id, after, before, summarize):
+        key = (device_id, chat_id)
+        with self._lock:
+            if key in self._folding:
+                return
+            self._folding.add(key)
+        try:
+            future = self._submit_fold(lambda: self._fold(device_id, chat_id, after, before, summarize))
+        except Exception:
+            self._release(key)
+            raise
+        if future is not None:
+            # Pushed out of the queue (DROP_OLDEST): the next question schedules it again
+            future.add_done_callback(lambda f: f.cancelled() and self._release(key))
+
+    def _release(self, key):
+        with self._lock:
+            self._folding.discard(key)
+
+    def _fold(self, device_id, chat_id, after, before, summarize):
+        """Folds the turns between the current summary and the oldest turn still sent into the summary."""
+        key = (device_id, chat_id)
+        try:
+            turns = self._history().get_messages_between(device_id, chat_id, after=after, before=before, limit=FOLD_LIMIT)
+            if not turns:
+                return
+            previous, _ = self.summary(device_id, chat_id)
+            clipped = [{"role": t['role'], "content": clip(t['content'], MAX_MESSAGE_TOKENS)} for t in turns]
+            new_summary = None
+            if summarize is not None:
+                try:
+                    new_summary = summarize(previous, clipped)
+                except Exception as e:
+                    print(f"⚠️ Context Builder: summarizer failed, using extractive summary: {e}")
+            if not new_summary:
+                new_summary = extractive_summary(previous, clipped)
+                self._bump("summary_fallbacks")
+            new_summary = clip(new_summary.strip(), SUMMARY_TOKENS)
+            until = turns[-1]['timestamp']
+            self._history().save_chat_summary(device_id, chat_id, new_summary, until)
+            with self._lock:
+                self._summaries.pop(key, None) # Re-read: a concurrent fold may have saved a newer one
+            self._bump("summaries")
+        except Exception as e:
+            self._bump("summary_failures")
+            print(f"⚠️ Context Builder: summary refresh for chat {chat_id} failed: {e}")
+        finally:
+            self._release(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, cached_summaries=len(self._summaries), folding=len(self._folding))
+        stats["avg_turns_sent"] = round(stats["turns_sent"] / stats["built"], 2) if stats["built"] else 0.0
+        return stats
+
+
+# One per process: the summary cache is shared by every request
+context_builder = ContextBuilder()
+
+
+def _observe_tokens(engine, tokens):
+    from vyom.core.metrics import CONTEXT_TOKENS, bounded
+    CONTEXT_TOKENS.observe(tokens, engine=bounded(engine, ENGINE_BUDGETS))
+
+
+def _register_metrics():
+    from vyom.core.metrics import registry
+    events = registry.counter("vyom_context_events_total", "Conversation context building", ("event",))
+    for event in ("built", "turns_sent", "turns_dropped", "clipped", "summaries", "summary_fallbacks", "summary_failures"):
+        events.set_function(lambda e=event: context_builder._stats[e], event=event)
+
+
+_register_metrics()
@@ -0,0 +1,117 @@
+"""
+VYOM DATABASE LAYER
+Persistent SQLite connections for the chat store.
+
+Features:
+1. One long-lived connection per thread (no reconnect on every query).
+2. WAL journal so readers never block behind a writer.
+3. Connection PRAGMAs applied once, when the connection is opened.
+4. Time each connection is held is recorded in vyom_sqlite_seconds (per database file).
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from vyom.core.metrics import SQLITE_CALLS
+
+# Applied once per connection. WAL + NORMAL is durable across app crashes,
+# only an OS crash can lose the last few commits.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA cache_size = -16000",     # ~16 MB page cache per connection
+    "PRAGMA mmap_size = 134217728",   # 128 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 30000",
+)
+
+
+class ConnectionPool:
+    """Hands out one persistent connection per thread for a single database file."""
+
+    def __init__(self, db_file, timeout=30.0):
+        self.db_file = db_file
+        self.timeout = timeout
+        self._label = os.path.basename(db_file)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields this thread's connection.
+        Anything left uncommitted when the block exits is rolled back,
+        the same outcome the old open/close-per-call pattern had.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield conn
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            SQLITE_CALLS.observe(time.perf_counter() - started, db=self._label, status=status)
+
+    def close_all(self):
+        """Closes every connection opened by this pool (used on shutdown and in tests)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        # Threads will lazily reconnect on their next call
+        self._local = threading.local()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_file):
+    """Returns the shared pool for `db_file`, creating it on first use."""
+    key = os.path.abspath(db_file)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(key)
+                _pools[key] = pool
+    return pool
+
+
+def close_all_pools():
+    """Closes every pooled connection in the process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+# Closing cleanly lets SQLite checkpoint the WAL back into the main file
+atexit.register(close_all_pools)
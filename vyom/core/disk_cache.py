@@ -0,0 +1,218 @@
+"""
+VYOM DISK CACHE
+Node-wide answer cache in SQLite, shared by every gunicorn worker and kept across deploys.
+
+Features:
+1. One WAL database file: workers read concurrently, writes are short single-row upserts.
+2. Per-entry expiry plus a byte cap; least-recently-read entries go first when over the cap.
+3. `TieredCache` puts an in-process ResponseCache (L1) in front, so hot answers never touch disk.
+
+Values are stored as JSON, so anything the answer path caches (strings, tuples) round-trips.
+The file lives at VYOM_CACHE_DB (default: response_cache.db in the working directory).
+"""
+
+import json
+import os
+import threading
+import time
+
+from vyom.core import database
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+PRUNE_INTERVAL = 30.0   # Seconds between expiry/size sweeps (per process)
+TOUCH_INTERVAL = 60.0   # Reads refresh accessed_at at most this often, to keep reads write-free
+
+
+class DiskCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, default_ttl=6 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._pool = database.get_pool(path)
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "errors": 0}
+        with self._pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expiry ON response_cache (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_access ON response_cache (accessed_at)")
+            conn.commit()
+
+    def _bump(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def get_with_expiry(self, key):
+        """Returns (value, expires_at) or None."""
+        now = time.time()
+        try:
+            with self._pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at, accessed_at FROM response_cache WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+                if row is not None and now - row['accessed_at'] > TOUCH_INTERVAL:
+                    conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    conn.commit()
+        except Exception as e:
+            # A cache must never take the request down with it
+            print(f"⚠️ Disk cache read failed: {e}")
+            self._bump("errors")
+            return None
+        if row is None:
+            self._bump("misses")
+            return None
+        self._bump("hits")
+        return _decode(json.loads(row['value'])), row['expires_at']
+
+    def get(self, key, default=None):
+        found = self.get_with_expiry(key)
+        return found[0] if found else default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode('utf-8')) + len(key)
+        if ttl <= 0 or size > self.max_bytes:
+            return False
+        now = time.time()
+        try:
+            with self._pool.connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, size, now + ttl, now)
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️ Disk cache write failed: {e}")
+            self._bump("errors")
+            return False
+        self._bump("sets")
+        if now - self._last_prune > PRUNE_INTERVAL:
+            self.prune()
+        return True
+
+    def delete(self, key):
+        with self._pool.connection() as conn:
+            res = conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            conn.commit()
+        return res.rowcount > 0
+
+    def clear(self):
+        with self._pool.connection() as conn:
+            conn.execute("DELETE FROM response_cache")
+            conn.commit()
+
+    def prune(self):
+        """Drops expired entries, then the least recently read ones until under max_bytes."""
+        self._last_prune = time.time()
+        with self._pool.connection() as conn:
+            expired = conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                # Walk the access index oldest-first until enough bytes are freed
+                excess, cutoff = total - self.max_bytes, None
+                for row in conn.execute("SELECT accessed_at, size FROM response_cache ORDER BY accessed_at"):
+                    excess -= row['size']
+                    if excess <= 0:
+                        cutoff = row['accessed_at']
+                        break
+                if cutoff is not None:
+                    evicted = conn.execute("DELETE FROM response_cache WHERE accessed_at <= ?", (cutoff,)).rowcount
+            conn.commit()
+        self._bump("expirations", expired)
+        self._bump("evictions", evicted)
+        return expired + evicted
+
+    def recent_keys(self, limit):
+        """Most recently read live keys (used to warm in-process indexes after a restart)."""
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT key FROM response_cache WHERE expires_at > ? ORDER BY accessed_at DESC LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+        return [r['key'] for r in rows]
+
+    def __len__(self):
+        with self._pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM response_cache WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+    def stats(self):
+        with self._pool.connection() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        with self._lock:
+            stats = dict(self._stats, entries=entries, bytes=size, max_bytes=self.max_bytes, path=self.path)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+def _decode(value):
+    # JSON turns tuples into lists; callers unpack them either way
+    return tuple(value) if isinstance(value, list) else value
+
+
+class TieredCache:
+    """In-process L1 (ResponseCache) over a shared DiskCache L2, with the same get/set interface."""
+
+    def __init__(self, l1, l2):
+        self.l1 = l1
+        self.l2 = l2
+
+    def get(self, key, default=None):
+        value = self.l1.get(key)
+        if value is not None:
+            return value
+        found = self.l2.get_with_expiry(key)
+        if found is None:
+            return default
+        value, expires_at = found
+        # Promote with whatever lifetime the entry has left
+        self.l1.set(key, value, ttl=expires_at - time.time())
+        return value
+
+    def set(self, key, value, ttl=None):
+        stored = self.l1.set(key, value, ttl=ttl)
+        return self.l2.set(key, value, ttl=ttl) or stored
+
+    def delete(self, key):
+        return self.l1.delete(key) | self.l2.delete(key)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def recent_keys(self, limit):
+        return self.l2.recent_keys(limit)
+
+    def shrink(self, fraction=0.5):
+        # Only the in-process tier costs this worker RAM
+        return self.l1.shrink(fraction)
+
+    def stats(self):
+        # Same shape as a plain ResponseCache's stats, with the disk tier under "disk"
+        return dict(self.l1.stats(), disk=self.l2.stats())
+
+
+def from_env(l1):
+    """Wraps `l1` with the node-wide disk tier unless VYOM_CACHE_DISK=0."""
+    if os.getenv("VYOM_CACHE_DISK", "1") == "0":
+        return l1
+    path = os.getenv("VYOM_CACHE_DB", os.path.join(os.getcwd(), "response_cache.db"))
+    max_bytes = int(float(os.getenv("VYOM_CACHE_DISK_MB", "256")) * 1024 * 1024)
+    try:
+        return TieredCache(l1, DiskCache(path, max_bytes=max_bytes, default_ttl=l1.default_ttl))
+    except Exception as e:
+        print(f"⚠️ Disk cache unavailable ({e}), using in-memory cache only.")
+        return l1
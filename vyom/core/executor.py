@@ -0,0 +1,233 @@
+"""
+VYOM BACKGROUND EXECUTOR
+Bounded, prioritised worker pool for fire-and-forget work.
+
+Features:
+1. Named queues, each with a priority (lower runs first) and a maximum depth.
+2. Explicit overflow policy per queue when it is full:
+   - "block":       the caller waits for room (backpressure)
+   - "drop_oldest": the oldest queued task is cancelled to make room
+   - "run_inline":  the caller runs the task itself
+3. Exceptions are logged with a traceback and counted, never silently lost.
+4. Per-queue depth, wait latency and run time metrics via `stats()`.
+5. `shutdown()` stops intake and drains what is queued (registered at exit).
+6. Tasks run in the submitter's contextvars context, so a request's trace follows its background work.
+"""
+
+import contextvars
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+RUN_INLINE = "run_inline"
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, RUN_INLINE)
+
+LATENCY_SAMPLES = 512 # Recent samples kept per queue for percentiles
+
+
+class QueueFull(Exception):
+    """A "block" queue stayed full for longer than the submit timeout."""
+
+
+class _Task:
+    __slots__ = ("fn", "args", "kwargs", "context", "future", "enqueued_at")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.context = contextvars.copy_context()
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class _Queue:
+    def __init__(self, name, priority, max_depth, overflow):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}'. Choose from: {', '.join(OVERFLOW_POLICIES)}")
+        self.name = name
+        self.priority = priority
+        self.max_depth = max_depth
+        self.overflow = overflow
+        self.tasks = deque()
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0, "inline": 0, "blocked": 0}
+        self.high_water = 0
+        self.wait_ms = deque(maxlen=LATENCY_SAMPLES)
+        self.run_ms = deque(maxlen=LATENCY_SAMPLES)
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 2)
+
+
+class BackgroundExecutor:
+    def __init__(self, workers=8, name="VyomWorker"):
+        self.workers = workers
+        self.name = name
+        self._queues = {}
+        self._ordered = []   # queues sorted by priority
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0    # tasks currently executing
+        self._accepting = True
+
+    def add_queue(self, name, priority=10, max_depth=1000, overflow=BLOCK):
+        with self._cond:
+            queue = _Queue(name, priority, max_depth, overflow)
+            self._queues[name] = queue
+            self._ordered = sorted(self._queues.values(), key=lambda q: q.priority)
+        return queue
+
+    def submit(self, queue_name, fn, *args, timeout=None, **kwargs):
+        """
+        Queues fn(*args, **kwargs) and returns a Future.
+        `timeout` only applies to "block" queues: raises QueueFull if no room frees up in time.
+        """
+        task = _Task(fn, args, kwargs)
+        with self._cond:
+            queue = self._queues[queue_name]
+            queue.counts["submitted"] += 1
+            if not self._accepting:
+                # Shutting down: nobody will pick it up, so do it now
+                queue.counts["inline"] += 1
+                inline = True
+            else:
+                inline = self._make_room(queue, timeout)
+                if not inline:
+                    queue.tasks.append(task)
+                    queue.high_water = max(queue.high_water, len(queue.tasks))
+                    self._ensure_workers()
+                    self._cond.notify()
+        if inline:
+            self._execute(queue, task, inline=True)
+        return task.future
+
+    def _make_room(self, queue, timeout):
+        """Applies the overflow policy (lock held). Returns True if the caller should run the task."""
+        if len(queue.tasks) < queue.max_depth:
+            return False
+        if queue.overflow == RUN_INLINE:
+            queue.counts["inline"] += 1
+            return True
+        if queue.overflow == DROP_OLDEST:
+            dropped = queue.tasks.popleft()
+            dropped.future.cancel()
+            queue.counts["dropped"] += 1
+            return False
+        queue.counts["blocked"] += 1
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(queue.tasks) >= queue.max_depth and self._accepting:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise QueueFull(f"Queue '{queue.name}' is full ({queue.max_depth} tasks)")
+            self._cond.wait(remaining)
+        return not self._accepting
+
+    def _ensure_workers(self):
+        # Started lazily so forked (gunicorn) workers get their own threads
+        self._threads = [t for t in self._threads if t.is_alive()]
+        for i in range(len(self._threads), self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_task(self):
+        for queue in self._ordered:
+            if queue.tasks:
+                return queue, queue.tasks.popleft()
+        return None, None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                queue, task = self._next_task()
+                while task is None:
+                    if not self._accepting:
+                        return
+                    self._cond.wait()
+                    queue, task = self._next_task()
+                self._running += 1
+                # A blocked submitter may now have room
+                self._cond.notify_all()
+            try:
+                self._execute(queue, task)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def _execute(self, queue, task, inline=False):
+        if not task.future.set_running_or_notify_cancel():
+            return
+        started = time.perf_counter()
+        try:
+            result = task.context.run(task.fn, *task.args, **task.kwargs)
+        except Exception as e:
+            task.future.set_exception(e)
+            counter = "failed"
+            name = getattr(task.fn, "__qualname__", repr(task.fn))
+            print(f"⚠️ Background task {name} on '{queue.name}' failed: {e}\n{traceback.format_exc()}")
+        else:
+            task.future.set_result(result)
+            counter = "completed"
+        finished = time.perf_counter()
+        with self._cond:
+            queue.counts[counter] += 1
+            if not inline:
+                queue.wait_ms.append((started - task.enqueued_at) * 1000)
+            queue.run_ms.append((finished - started) * 1000)
+
+    def depth(self, queue_name=None):
+        with self._cond:
+            if queue_name is not None:
+                return len(self._queues[queue_name].tasks)
+            return sum(len(q.tasks) for q in self._queues.values())
+
+    def drain(self, timeout=None):
+        """Waits until every queue is empty and no task is running. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._running or any(q.tasks for q in self._queues.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=10.0):
+        """
+        Stops taking new work into the queues (later submits run inline), finishes
+        what's queued, and lets the workers exit. Returns False if the drain timed out.
+        """
+        with self._cond:
+            self._accepting = False
+            self._cond.notify_all()
+        drained = self.drain(timeout)
+        if not drained:
+            print(f"⚠️ Background executor stopped with {self.depth()} tasks still queued.")
+        return drained
+
+    def stats(self):
+        with self._cond:
+            queues = {}
+            for q in self._ordered:
+                queues[q.name] = dict(
+                    q.counts,
+                    priority=q.priority,
+                    overflow=q.overflow,
+                    depth=len(q.tasks),
+                    max_depth=q.max_depth,
+                    high_water=q.high_water,
+                    wait_ms_p50=_percentile(q.wait_ms, 0.5),
+                    wait_ms_p95=_percentile(q.wait_ms, 0.95),
+                    run_ms_p50=_percentile(q.run_ms, 0.5),
+                    run_ms_p95=_percentile(q.run_ms, 0.95),
+                )
+            return {"workers": len([t for t in self._threads if t.is_alive()]), "running": self._running, "queues": queues}
@@ -0,0 +1,180 @@
+"""
+VYOM HEDGING
+Hedged LLM calls: if the first key/model is slow, race a second one against it.
+
+Features:
+1. `run(attempts)` tries (model, fn) attempts in order. A failed attempt moves straight on
+   to the next one, exactly like the plain fallback loop.
+2. Opt-in (VYOM_HEDGE=1): if the running attempt hasn't answered within the model's recent
+   latency percentile (VYOM_HEDGE_PERCENTILE, default p95), the next attempt is started too.
+   The first answer wins.
+3. At most VYOM_HEDGE_BUDGET extra requests per call, so quota use stays bounded.
+4. Losers still queued are cancelled; ones already in flight can't be interrupted mid-HTTP
+   call, so their answer is discarded (their outcome still reaches the key scheduler).
+5. Counters for hedges sent, hedge wins and discarded answers via `stats()`.
+
+See benchmarks/hedge_bench.py for p50/p99 against a stub that injects slow responses.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+LATENCY_WINDOW = 200   # Recent successful call durations kept per model
+MIN_SAMPLES = 20       # Below this, DEFAULT_DELAY is used
+DEFAULT_DELAY = 2.0    # Seconds
+
+
+class Hedger:
+    def __init__(self, enabled=False, percentile=0.95, budget=1, min_delay=0.3, max_delay=8.0, workers=32):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._latencies = {}  # model -> deque of seconds
+        self._stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "primary_wins": 0, "fallbacks": 0,
+                       "discarded": 0, "cancelled": 0, "failed": 0}
+
+    def _executor(self):
+        # Created lazily so forked (gunicorn) workers get their own threads
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="VyomHedge")
+        return self._pool
+
+    def _bump(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def observe(self, model, seconds):
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def delay(self, model):
+        """Seconds to wait on `model` before hedging: its recent latency percentile, clamped."""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < MIN_SAMPLES:
+            value = DEFAULT_DELAY
+        else:
+            value = samples[min(len(samples) - 1, int(len(samples) * self.percentile))]
+        return min(max(value, self.min_delay), self.max_delay)
+
+    def run(self, attempts, budget=None):
+        """
+        attempts: iterable of (model, fn); fn() returns the answer, or None/raises on failure.
+        Returns the first answer, or None if every attempt failed.
+        """
+        self._bump("calls")
+        if not self.enabled:
+            for _, fn in attempts:
+                try:
+                    result = fn()
+                except Exception:
+                    result = None
+                if result:
+                    return result
+            self._bump("failed")
+            return None
+        return self._run_hedged(iter(attempts), self.budget if budget is None else budget)
+
+    def _run_hedged(self, attempts, budget):
+        pending = {}  # future -> (model, kind)
+        hedges = 0
+        last_launch = [0.0, None]  # when, model
+
+        def launch(kind):
+            nxt = next(attempts, None)
+            if nxt is None:
+                return False
+            model, fn = nxt
+            started = time.perf_counter()
+            # Carry the request's trace into the worker thread
+            future = self._executor().submit(contextvars.copy_context().run, fn)
+            future.add_done_callback(lambda f, m=model: self._finished(f, m, started))
+            pending[future] = (model, kind)
+            last_launch[:] = [started, model]
+            return True
+
+        if not launch("primary"):
+            self._bump("failed")
+            return None
+        while pending:
+            timeout = None
+            if hedges < budget:
+                timeout = max(0.0, last_launch[0] + self.delay(last_launch[1]) - time.perf_counter())
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slow: race the next attempt against it
+                if launch("hedge"):
+                    hedges += 1
+                    self._bump("hedges")
+                else:
+                    hedges = budget # Nothing left to hedge with; just wait
+                continue
+            for future in done:
+                model, kind = pending.pop(future)
+                result = None if future.cancelled() or future.exception() else future.result()
+                if result:
+                    self._bump("hedge_wins" if kind == "hedge" else "primary_wins")
+                    self._abandon(pending)
+                    return result
+            if not pending and launch("fallback"):
+                self._bump("fallbacks")
+        self._bump("failed")
+        return None
+
+    def _finished(self, future, model, started):
+        # Runs for winners and losers alike, so slow answers still shape the percentile
+        if not future.cancelled() and future.exception() is None and future.result():
+            self.observe(model, time.perf_counter() - started)
+
+    def _abandon(self, pending):
+        for future in list(pending):
+            if future.cancel():
+                self._bump("cancelled")
+            else:
+                self._bump("discarded")
+        pending.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            models = list(self._latencies)
+        stats["enabled"] = self.enabled
+        stats["hedge_rate"] = round(stats["hedges"] / stats["calls"], 3) if stats["calls"] else 0.0
+        stats["delay_s"] = {model: round(self.delay(model), 3) for model in models}
+        return stats
+
+
+def from_env():
+    """Hedger configured from VYOM_HEDGE / VYOM_HEDGE_PERCENTILE / VYOM_HEDGE_BUDGET / VYOM_HEDGE_MIN_MS / VYOM_HEDGE_MAX_MS."""
+    return Hedger(
+        enabled=os.getenv("VYOM_HEDGE", "0") == "1",
+        percentile=float(os.getenv("VYOM_HEDGE_PERCENTILE", "0.95")),
+        budget=int(os.getenv("VYOM_HEDGE_BUDGET", "1")),
+        min_delay=float(os.getenv("VYOM_HEDGE_MIN_MS", "300")) / 1000,
+        max_delay=float(os.getenv("VYOM_HEDGE_MAX_MS", "8000")) / 1000,
+    )
+
+
+# Shared by every LLM call path
+llm_hedger = from_env()
+
+
+def _register_metrics():
+    from vyom.core.metrics import registry
+    events = registry.counter("vyom_llm_hedge_events_total", "Hedged LLM call outcomes", ("event",))
+    for event in ("calls", "hedges", "hedge_wins", "primary_wins", "fallbacks", "discarded", "cancelled", "failed"):
+        events.set_function(lambda e=event: llm_hedger._stats[e], event=event)
+
+
+_register_metrics()
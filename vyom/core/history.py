@@ -1,112 +1,61 @@
 # d:/ai/history.py
+import atexit
+import html
 import os
+import re
 import sqlite3
 import time
 import uuid
 import json
+import math
+import threading
 from contextlib import contextmanager
 
+from cachetools import TTLCache
+
+from vyom.core import archive
+from vyom.core import database
+from vyom.core.context_builder import count_tokens
+from vyom.core import migrations
+from vyom.core import storage as storage_layer
+from vyom.core import tracing
+from vyom.core.history_writer import HistoryWriter
+
 # --- CONSTANTS ---
 DB_FILE = os.path.join(os.getcwd(), 'ai_database.db')
 LEGACY_USERS_FILE = os.path.join(os.getcwd(), 'users', 'users.json')
+PREVIEW_CHARS = 120 # Length of chats.last_message_preview
+# Number of SQLite files user data is spread over (see vyom.core.storage).
+# Changing it on an existing install needs `python admin.py reshard OLD NEW` first.
+DB_SHARDS = int(os.getenv("VYOM_DB_SHARDS", "1"))
 
 # --- DATABASE SETUP ---
 
+_storages = {}
+
+def get_storage():
+    """The storage layout for the current DB_FILE / DB_SHARDS."""
+    key = (DB_FILE, DB_SHARDS)
+    storage = _storages.get(key)
+    if storage is None:
+        storage = _storages.setdefault(key, storage_layer.ShardedSQLiteStorage(DB_FILE, DB_SHARDS))
+    return storage
+
 @contextmanager
-def get_db_connection():
-    """Context manager for database connections."""
-    conn = sqlite3.connect(DB_FILE, timeout=30.0)
-    conn.row_factory = sqlite3.Row
-    try:
+def get_db_connection(device_id=None):
+    """Context manager for database connections (persistent, one per thread) on the shard owning `device_id`."""
+    with get_storage().connection(device_id) as conn:
         yield conn
-    finally:
-        conn.close()
 
 def _initialize_database():
-    """Initializes the database tables if they don't exist."""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        # User table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                device_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL,
-                created REAL NOT NULL,
-                api_key TEXT
-            )
-        ''')
-        # Chats table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chats (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                title TEXT NOT NULL,
-                created REAL NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (device_id) ON DELETE CASCADE
-            )
-        ''')
-        # Messages table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp REAL NOT NULL,
-                FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # --- MIGRATION: Add api_key column if missing ---
-        try:
-            cursor.execute("SELECT api_key FROM users LIMIT 1")
-        except sqlite3.OperationalError:
-            # Column doesn't exist, add it
-            print("Migrating Database: Adding api_key column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN api_key TEXT")
+    """Brings every shard's schema up to date (see vyom.core.migrations)."""
+    get_storage().initialize()
+    # Check if migration is needed
+    if os.path.exists(LEGACY_USERS_FILE):
+        _migrate_legacy_data()
 
-        # --- MIGRATION: Add gender column if missing ---
-        try:
-            cursor.execute("SELECT gender FROM users LIMIT 1")
-        except sqlite3.OperationalError:
-            print("Migrating Database: Adding gender column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN gender TEXT")
 
-        # --- MIGRATION: Add default_engine and default_model columns if missing ---
-        try:
-            cursor.execute("SELECT default_engine FROM users LIMIT 1")
-        except sqlite3.OperationalError:
-            print("Migrating Database: Adding default_engine column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN default_engine TEXT")
-        try:
-            cursor.execute("SELECT default_model FROM users LIMIT 1")
-        except sqlite3.OperationalError:
-            print("Migrating Database: Adding default_model column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN default_model TEXT")
-
-        # --- MIGRATION: Add api_keys column (JSON) if missing ---
-        try:
-            cursor.execute("SELECT api_keys FROM users LIMIT 1")
-        except sqlite3.OperationalError:
-            print("Migrating Database: Adding api_keys column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN api_keys TEXT")
-
-        # --- MIGRATION: Add device info columns if missing ---
-        for col in ["last_device", "last_os", "last_seen_platform", "last_location", "lat", "lon"]:
-            try:
-                cursor.execute(f"SELECT {col} FROM users LIMIT 1")
-            except sqlite3.OperationalError:
-                print(f"Migrating Database: Adding {col} column to users table...")
-                cursor.execute(f"ALTER TABLE users ADD COLUMN {col} TEXT")
-        
-        conn.commit()
-        # Check if migration is needed
-        if os.path.exists(LEGACY_USERS_FILE):
-            _migrate_legacy_data(conn)
-
-
-def _migrate_legacy_data(conn):
+def _migrate_legacy_data():
     """
     Migrates data from the old JSON file to the new SQLite database.
     This is designed to be idempotent.
@@ -121,44 +70,44 @@ def _migrate_legacy_data(conn):
         os.rename(LEGACY_USERS_FILE, LEGACY_USERS_FILE + '.migrated')
         return
 
-    cursor = conn.cursor()
     for user_id, user_data in legacy_users.items():
-        try:
-            # 1. Migrate User
-            cursor.execute(
-                "INSERT OR IGNORE INTO users (device_id, name, email, created) VALUES (?, ?, ?, ?)",
-                (user_id, user_data.get('name', ''), user_data.get('email', ''), user_data.get('created', time.time()))
-            )
-
-            # 2. Migrate Chats and Messages
-            for chat_data in user_data.get('chats', []):
-                chat_id = chat_data.get('id')
-                if not chat_id: continue
-
+        with get_db_connection(user_id) as conn:
+            cursor = conn.cursor()
+            try:
+                # 1. Migrate User
                 cursor.execute(
-                    "INSERT OR IGNORE INTO chats (id, user_id, title, created) VALUES (?, ?, ?, ?)",
-                    (chat_id, user_id, chat_data.get('title', 'Imported Chat'), time.time())
+                    "INSERT OR IGNORE INTO users (device_id, name, email, created) VALUES (?, ?, ?, ?)",
+                    (user_id, user_data.get('name', ''), user_data.get('email', ''), user_data.get('created', time.time()))
                 )
 
-                for msg_entry in chat_data.get('messages', []):
-                    # Simple parsing for "role: content" format
-                    role, content = "assistant", msg_entry
-                    if isinstance(msg_entry, str) and ': ' in msg_entry:
-                        parts = msg_entry.split(': ', 1)
-                        if len(parts) == 2 and parts[0].lower() in ['user', 'assistant', 'system']:
-                            role, content = parts
-                    
+                # 2. Migrate Chats and Messages
+                for chat_data in user_data.get('chats', []):
+                    chat_id = chat_data.get('id')
+                    if not chat_id: continue
+
                     cursor.execute(
-                        "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-                        (chat_id, role, content, time.time())
+                        "INSERT OR IGNORE INTO chats (id, user_id, title, created) VALUES (?, ?, ?, ?)",
+                        (chat_id, user_id, chat_data.get('title', 'Imported Chat'), time.time())
                     )
-        except sqlite3.IntegrityError as e:
-            print(f"Skipping duplicate entry for user {user_id}: {e}")
-        except Exception as e:
-            print(f"An error occurred during migration for user {user_id}: {e}")
 
+                    for msg_entry in chat_data.get('messages', []):
+                        # Simple parsing for "role: content" format
+                        role, content = "assistant", msg_entry
+                        if isinstance(msg_entry, str) and ': ' in msg_entry:
+                            parts = msg_entry.split(': ', 1)
+                            if len(parts) == 2 and parts[0].lower() in ['user', 'assistant', 'system']:
+                                role, content = parts
+                    
+                        cursor.execute(
+                            "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                            (chat_id, role, content, time.time())
+                        )
+            except sqlite3.IntegrityError as e:
+                print(f"Skipping duplicate entry for user {user_id}: {e}")
+            except Exception as e:
+                print(f"An error occurred during migration for user {user_id}: {e}")
+            conn.commit()
 
-    conn.commit()
     print("Data migration completed.")
     # Rename the old file to prevent this from running again
     try:
@@ -168,18 +117,91 @@ def _migrate_legacy_data(conn):
         print(f"Could not rename legacy user file: {e}")
 
 
+# --- PROFILE CACHE ---
+# get_user runs on every /ask, /user/check and preference call. Profiles are cached
+# per process and dropped by every write below; the TTL bounds how stale another
+# gunicorn worker's copy can get.
+PROFILE_CACHE_TTL = 30
+_profile_cache = TTLCache(maxsize=4096, ttl=PROFILE_CACHE_TTL)
+_profile_cache_lock = threading.Lock()
+_profile_generation = 0 # Bumped on every invalidation
+_profile_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+PROFILE_FIELDS = ("device_id", "name", "email", "created", "api_key", "api_keys", "gender", "default_engine", "default_model")
+
+
+def _copy_user(user):
+    # Callers may mutate what they get back; never hand out the cached dict
+    if user is None:
+        return None
+    return dict(user, api_keys=dict(user.get('api_keys') or {}))
+
+
+def _invalidate_user(*device_ids):
+    """Drops the given profiles from the cache (all of them when called without ids)."""
+    global _profile_generation
+    with _profile_cache_lock:
+        _profile_generation += 1
+        _profile_stats["invalidations"] += 1
+        if not device_ids:
+            _profile_cache.clear()
+        for device_id in device_ids:
+            _profile_cache.pop(device_id, None)
+
+
+def get_profile_cache_stats():
+    """Hit/miss counters for the profile cache."""
+    with _profile_cache_lock:
+        stats = dict(_profile_stats, size=len(_profile_cache), ttl=PROFILE_CACHE_TTL)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    return stats
+
+
+# --- DEVICES ---
+# A browser's device_id maps to the account (users row) it is logged in to through
+# the `devices` table; chats and profile hang off the account. Devices that were never
+# linked are their own account. Not cached: it's a primary-key lookup, and a stale
+# mapping in another worker would send writes to the wrong account after a re-login.
+
+def resolve_account(device_id):
+    """Returns the account id `device_id` is linked to (the device itself if it isn't linked)."""
+    if not device_id:
+        return device_id
+    with get_db_connection(device_id) as conn:
+        row = conn.execute("SELECT account_id FROM devices WHERE device_id = ?", (device_id,)).fetchone()
+    return row[0] if row else device_id
+
+
 # --- PUBLIC API ---
 
 def get_user(device_id):
     """Retrieves a single user's data, excluding their chats.
 
     Returns parsed `api_keys` (dict) if present and maintains backwards compatibility with `api_key`.
+    Served from the profile cache when possible (unknown devices are cached as None too).
     """
     if not device_id:
         return None
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with _profile_cache_lock:
+        if device_id in _profile_cache:
+            _profile_stats["hits"] += 1
+            return _copy_user(_profile_cache[device_id])
+        _profile_stats["misses"] += 1
+        generation = _profile_generation
+
+    user = _load_user(device_id)
+    with _profile_cache_lock:
+        # Skip the fill if a write landed while we were reading
+        if generation == _profile_generation:
+            _profile_cache[device_id] = user
+    return _copy_user(user)
+
+
+def _load_user(device_id):
+    with get_db_connection(device_id) as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT device_id, name, email, created, api_key, api_keys, gender, default_engine, default_model FROM users WHERE device_id = ?", (device_id,))
+        cursor.execute(f"SELECT {', '.join(PROFILE_FIELDS)} FROM users WHERE device_id = ?", (device_id,))
         row = cursor.fetchone()
         if not row:
             return None
@@ -187,7 +209,6 @@ def get_user(device_id):
         # Parse api_keys JSON if present
         api_keys_raw = user.get('api_keys')
         try:
-            import json
             user['api_keys'] = json.loads(api_keys_raw) if api_keys_raw else {}
         except Exception:
             user['api_keys'] = {}
@@ -196,12 +217,14 @@ def get_user(device_id):
 def save_user_api_key(device_id, api_key):
     """Updates the user's personal API Key (legacy single key)."""
     if not device_id: return False
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         res = conn.execute(
             "UPDATE users SET api_key = ? WHERE device_id = ?",
             (api_key, device_id)
         )
         conn.commit()
+        _invalidate_user(device_id)
         return res.rowcount > 0
 
 
@@ -211,19 +234,22 @@ def save_user_api_keys(device_id, keys: dict):
         return False
     import json
     keys_json = json.dumps(keys)
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         res = conn.execute(
             "UPDATE users SET api_keys = ? WHERE device_id = ?",
             (keys_json, device_id)
         )
         conn.commit()
+        _invalidate_user(device_id)
         return res.rowcount > 0
 
 
 def save_user_preferences(device_id, default_engine=None, default_model=None):
     """Saves user's default engine/model preferences."""
     if not device_id: return False
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         # Build dynamic update
         updates = []
         params = []
@@ -239,6 +265,7 @@ def save_user_preferences(device_id, default_engine=None, default_model=None):
         query = f"UPDATE users SET {', '.join(updates)} WHERE device_id = ?"
         res = conn.execute(query, params)
         conn.commit()
+        _invalidate_user(device_id)
         return res.rowcount > 0
 
 def register_user(device_id, name, email, gender=None):
@@ -251,16 +278,23 @@ def register_user(device_id, name, email, gender=None):
     if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
         return None, "Invalid email address format"
 
-    with get_db_connection() as conn:
+    # A device that is logged in updates its account
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT device_id FROM users WHERE device_id = ?", (device_id,))
         exists = cursor.fetchone()
 
         if not exists:
-            # Create new user
+            # Create new user (the registering device is the account's first device)
+            now = time.time()
             conn.execute(
                 "INSERT INTO users (device_id, name, email, created, gender) VALUES (?, ?, ?, ?, ?)",
-                (device_id, name, email, time.time(), gender)
+                (device_id, name, email, now, gender)
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO devices (device_id, account_id, linked_at) VALUES (?, ?, ?)",
+                (device_id, device_id, now)
             )
             # Create a default chat for the new user
             new_chat_id = "chat-" + str(uuid.uuid4())
@@ -281,18 +315,21 @@ def register_user(device_id, name, email, gender=None):
                     (name, email, device_id)
                 )
         conn.commit()
+    _invalidate_user(device_id)
 
     return get_user(device_id), None
 
 
 def get_chat_sessions(device_id):
-    """Returns a list of all chat sessions for a user (id and title)."""
+    """Returns a list of all chat sessions for a user, most recently active first."""
     if not device_id:
         return []
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT id, title FROM chats WHERE user_id = ? ORDER BY created DESC",
+            "SELECT id, title, message_count, last_message_at, last_message_preview FROM chats "
+            "WHERE user_id = ? ORDER BY COALESCE(last_message_at, created) DESC",
             (device_id,)
         )
         chats = cursor.fetchall()
@@ -303,7 +340,8 @@ def start_new_chat(device_id):
     if not device_id:
         return None
     
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT device_id FROM users WHERE device_id = ?", (device_id,))
         if not cursor.fetchone():
@@ -328,29 +366,190 @@ def get_chat_history(device_id, chat_id):
     """Gets the messages for a specific chat session."""
     if not all([device_id, chat_id]):
         return None
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         cursor = conn.cursor()
         # Ensure the chat belongs to the user
-        cursor.execute(
-            "SELECT 1 FROM chats WHERE id = ? AND user_id = ?",
-            (chat_id, device_id)
-        )
-        if not cursor.fetchone():
+        if not _open_chat(conn, device_id, chat_id):
             return None # Chat doesn't exist or doesn't belong to the user
             
         cursor.execute(
-            "SELECT role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY timestamp ASC",
+            "SELECT role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY timestamp ASC, id ASC",
             (chat_id,)
         )
-        # Return structured data
-        return [dict(row) for row in cursor.fetchall()]
+        # Return structured data (plus anything still waiting in the write queue)
+        rows = [dict(row) for row in cursor.fetchall()]
+        for p in _unwritten(device_id, chat_id, rows):
+            rows.append({"role": p['role'], "content": p['content'], "timestamp": p['timestamp']})
+        return rows
 
 
-def add_to_chat_history(device_id, chat_id, entry, role=None):
-    """Adds a message to a specific chat session."""
+def _open_chat(conn, device_id, chat_id):
+    """Checks the chat belongs to the user, rehydrating it first if it was archived."""
+    row = conn.execute("SELECT archived_at FROM chats WHERE id = ? AND user_id = ?", (chat_id, device_id)).fetchone()
+    if row is None:
+        return False
+    if row['archived_at'] is not None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            restored = archive.rehydrate_chat(conn, chat_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"🗄️ Rehydrated archived chat {chat_id} ({restored} messages)")
+    return True
+
+
+def get_chat_history_page(device_id, chat_id, limit=50, before=None):
+    """
+    Keyset-paginated history, newest page first.
+
+    `before` is the id of the oldest message from the previous page (None for the newest page).
+    Returns {"messages": [...oldest to newest], "next_before": id or None, "has_more": bool},
+    or None if the chat doesn't belong to the user. The newest page also carries any
+    queued-but-unwritten messages (with id None), so it may be slightly longer than `limit`.
+    """
+    if not all([device_id, chat_id]):
+        return None
+    limit = max(1, int(limit))
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
+        if not _open_chat(conn, device_id, chat_id):
+            return None
+
+        if before is None:
+            cursor = conn.execute(
+                "SELECT id, role, content, timestamp, tokens FROM messages WHERE chat_id = ? "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (chat_id, limit + 1)
+            )
+        else:
+            # Seek straight to the cursor row through idx_messages_chat_time
+            cursor = conn.execute(
+                "SELECT id, role, content, timestamp, tokens FROM messages WHERE chat_id = ? "
+                "AND (timestamp, id) < (SELECT timestamp, id FROM messages WHERE id = ? AND chat_id = ?) "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (chat_id, before, chat_id, limit + 1)
+            )
+        rows = [dict(row) for row in cursor.fetchall()]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    next_before = rows[0]['id'] if has_more else None
+    if before is None:
+        rows.extend(_unwritten(device_id, chat_id, rows))
+    return {"messages": rows, "next_before": next_before, "has_more": has_more}
+
+
+def get_recent_messages(device_id, chat_id, n=15):
+    """The last `n` messages of a chat (oldest to newest, with token counts), with the LIMIT pushed into SQLite."""
+    page = get_chat_history_page(device_id, chat_id, limit=n)
+    if page is None:
+        return None
+    return [
+        {"role": m['role'], "content": m['content'], "timestamp": m['timestamp'], "tokens": _tokens_of(m)}
+        for m in page['messages'][-n:]
+    ]
+
+
+def _tokens_of(msg):
+    # Counted at write time; rows from before that (or restored/resharded ones) are counted here
+    tokens = msg.get('tokens')
+    return tokens if tokens is not None else count_tokens(msg['content'])
+
+
+def get_messages_between(device_id, chat_id, after=None, before=None, limit=40):
+    """
+    The newest `limit` committed messages with after < timestamp < before (oldest to newest).
+    Used to fold older turns into a chat's rolling summary.
+    """
+    if not all([device_id, chat_id]):
+        return []
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
+        if not _open_chat(conn, device_id, chat_id):
+            return []
+        rows = conn.execute(
+            "SELECT role, content, timestamp, tokens FROM messages WHERE chat_id = ? AND timestamp > ? AND timestamp < ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (chat_id, after if after is not None else float('-inf'), before if before is not None else float('inf'), limit)
+        ).fetchall()
+    messages = [dict(row) for row in reversed(rows)]
+    for msg in messages:
+        msg['tokens'] = _tokens_of(msg)
+    return messages
+
+
+def get_chat_summary(device_id, chat_id):
+    """(summary, summary_until) for the chat's folded older turns, or (None, None)."""
+    if not all([device_id, chat_id]):
+        return None, None
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
+        row = conn.execute("SELECT summary, summary_until FROM chats WHERE id = ? AND user_id = ?", (chat_id, device_id)).fetchone()
+    return (row['summary'], row['summary_until']) if row else (None, None)
+
+
+def save_chat_summary(device_id, chat_id, summary, until):
+    """Stores a rolling summary covering messages up to `until`, unless a newer one is already saved."""
     if not all([device_id, chat_id]):
         return False
-        
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
+        cursor = conn.execute(
+            "UPDATE chats SET summary = ?, summary_until = ? WHERE id = ? AND user_id = ? "
+            "AND (summary_until IS NULL OR summary_until < ?)",
+            (summary, until, chat_id, device_id, until)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+
+def iter_chat_history(device_id, chat_id, chunk_size=200):
+    """
+    Streams a whole chat (oldest to newest) in `chunk_size` batches, so memory stays
+    flat however long the chat is. Returns None if the chat doesn't belong to the user.
+    """
+    if not all([device_id, chat_id]):
+        return None
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
+        if not _open_chat(conn, device_id, chat_id):
+            return None
+
+    def _stream():
+        # Anything still queued when we finish is at least this new,
+        # so only rows past this point need remembering for de-duplication
+        pending = _writer.pending_for(chat_id)
+        threshold = min([p['timestamp'] for p in pending] + [time.time()])
+        tail = []
+        with get_db_connection(device_id) as conn:
+            cursor = conn.execute(
+                "SELECT role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY timestamp ASC, id ASC",
+                (chat_id,)
+            )
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                for row in chunk:
+                    msg = dict(row)
+                    if msg['timestamp'] >= threshold:
+                        tail.append(msg)
+                    yield msg
+        for p in _unwritten(device_id, chat_id, tail):
+            yield {"role": p['role'], "content": p['content'], "timestamp": p['timestamp']}
+
+    return _stream()
+
+
+
+
+
+def _parse_entry(entry, role=None):
+    """Splits legacy "Role: content" strings and defaults the role to assistant."""
     content = entry
     # If role is not provided, try to parse it from the entry string for backward compatibility
     if not role and isinstance(entry, str) and ': ' in entry:
@@ -359,44 +558,350 @@ def add_to_chat_history(device_id, chat_id, entry, role=None):
             parsed_role = parts[0].lower()
             if parsed_role == 'vyom ai': parsed_role = 'assistant'
             role, content = parsed_role, parts[1]
-    
-    if not role: 
+
+    if not role:
         role = 'assistant'
+    return role, content
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        # 1. Verify chat exists and belongs to the user
-        cursor.execute("SELECT title, (SELECT COUNT(*) FROM messages WHERE chat_id=?) FROM chats WHERE id = ? AND user_id = ?", (chat_id, chat_id, device_id))
-        result = cursor.fetchone()
 
-        if not result:
-            return False # Chat not found or access denied
+def _insert_message(conn, device_id, chat_id, role, content, timestamp):
+    """Inserts one message inside the caller's transaction. Returns False if the chat isn't the user's."""
+    cursor = conn.cursor()
+    # 1. Verify chat exists and belongs to the user (O(1): counters live on the chat row)
+    cursor.execute("SELECT title, message_count, archived_at FROM chats WHERE id = ? AND user_id = ?", (chat_id, device_id))
+    result = cursor.fetchone()
 
-        chat_title, message_count = result
+    if not result:
+        return False # Chat not found or access denied
 
-        # 2. Insert the new message
-        conn.execute(
-            "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-            (chat_id, role, content, time.time())
-        )
+    chat_title, message_count, archived_at = result
+    if archived_at is not None:
+        # New activity on a cold chat: bring its messages back first
+        archive.rehydrate_chat(conn, chat_id)
 
-        # 3. If this is the first user message, generate a title
-        if message_count == 0 and role == 'user':
-            # Simple title generation from the first few words of the content
-            title = ' '.join(str(content).split()[:5])
-            if len(str(content).split()) > 5:
-                title += "..."
-            conn.execute("UPDATE chats SET title = ? WHERE id = ?", (title, chat_id))
-            
+    # 2. Insert the new message (token count stored now so context building never re-counts it)
+    conn.execute(
+        "INSERT INTO messages (chat_id, role, content, timestamp, tokens) VALUES (?, ?, ?, ?, ?)",
+        (chat_id, role, content, timestamp, count_tokens(content))
+    )
+
+    # 3. If this is the first user message, generate a title
+    if message_count == 0 and role == 'user':
+        # Simple title generation from the first few words of the content
+        chat_title = ' '.join(str(content).split()[:5])
+        if len(str(content).split()) > 5:
+            chat_title += "..."
+
+    # 4. Keep the sidebar counters in the same transaction as the insert
+    conn.execute(
+        "UPDATE chats SET title = ?, message_count = message_count + 1, last_message_at = ?, last_message_preview = ? WHERE id = ?",
+        (chat_title, timestamp, str(content)[:PREVIEW_CHARS], chat_id)
+    )
+    return True
+
+
+def add_to_chat_history(device_id, chat_id, entry, role=None):
+    """Adds a message to a specific chat session (synchronously)."""
+    if not all([device_id, chat_id]):
+        return False
+
+    role, content = _parse_entry(entry, role)
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
+        if not _insert_message(conn, device_id, chat_id, role, content, time.time()):
+            return False
         conn.commit()
         return True
 
 
+def _write_batch(batch):
+    """
+    HistoryWriter callback: commits a whole batch of queued messages in one transaction per shard.
+    Records are marked once their shard commits, so a retry after a later shard failed only
+    writes what is still missing (no duplicate messages or double-counted chat counters).
+    """
+    storage = get_storage()
+    by_shard = {}
+    for rec in batch:
+        if not rec.get('committed'):
+            by_shard.setdefault(storage.shard_for(rec['device_id']), []).append(rec)
+    for index, records in by_shard.items():
+        start, started = time.time(), time.perf_counter()
+        with storage.shard_connection(index) as conn:
+            for rec in records:
+                _insert_message(conn, rec['device_id'], rec['chat_id'], rec['role'], rec['content'], rec['timestamp'])
+            conn.commit()
+        for rec in records:
+            rec['committed'] = True
+        # One span per request that had messages in this transaction
+        duration_ms = (time.perf_counter() - started) * 1000
+        for trace in {rec.get('trace') for rec in records} - {None}:
+            queued_ms = (start - min(r['timestamp'] for r in records if r.get('trace') == trace)) * 1000
+            tracing.record(trace, "history.write", start, duration_ms, shard=index, batch=len(records), queued_ms=round(queued_ms, 2))
+
+
+_writer = HistoryWriter(_write_batch)
+
+
+def _register_metrics():
+    from vyom.core.metrics import registry
+    records = registry.counter("vyom_history_records_total", "Chat messages from the write-behind queue", ("result",))
+    records.set_function(lambda: _writer.records_written, result="written")
+    records.set_function(lambda: _writer.records_dropped, result="dropped")
+
+
+_register_metrics()
+
+
+def queue_chat_message(device_id, chat_id, entry, role=None):
+    """
+    Queues a message for the background history writer and returns immediately.
+    Messages are written in queue order and are visible to get_chat_history right away.
+    """
+    if not all([device_id, chat_id]):
+        return False
+    role, content = _parse_entry(entry, role)
+    _writer.submit({
+        "device_id": resolve_account(device_id),
+        "chat_id": chat_id,
+        "role": role,
+        "content": content,
+        "timestamp": time.time(),
+        "trace": tracing.current(),
+    })
+    return True
+
+
+def flush_pending_writes(timeout=10.0):
+    """Waits until every queued message is committed."""
+    return _writer.flush(timeout)
+
+
+def _unwritten(device_id, chat_id, rows):
+    """Queued-but-unwritten messages for the chat that are not already in `rows`."""
+    pending = [p for p in _writer.pending_for(chat_id) if p['device_id'] == device_id]
+    if not pending:
+        return []
+    # A record may have been committed between our SELECT and this snapshot
+    committed = {(r['timestamp'], r['role'], r['content']) for r in rows}
+    return [
+        {"id": None, "role": p['role'], "content": p['content'], "timestamp": p['timestamp']}
+        for p in pending
+        if (p['timestamp'], p['role'], p['content']) not in committed
+    ]
+
+
+# Private-use sentinels survive html.escape, then become <mark> tags
+_HL_START, _HL_END = '\ue000', '\ue001'
+SEARCH_CANDIDATES = 200 # Most recent matches that get ranked per query
+_PREFIX_CHARS = 4       # Longest prefix covered by the FTS prefix index
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _fts_query(device_id, words):
+    """
+    Builds an FTS5 expression: every word must match, the last one as a prefix.
+    Prefixes are capped at the indexed length (longer ones are re-checked in Python),
+    because an unindexed prefix has to merge every matching term's doclist.
+    """
+    terms = [_fts_phrase(w) for w in words[:-1]]
+    terms.append(_fts_phrase(words[-1][:_PREFIX_CHARS]) + "*")
+    # The owner prefilter keeps the match set to this user's messages; the SQL join is authoritative
+    owner = _fts_phrase(device_id.replace('-', ''))
+    return f"owner : ^{owner} AND content : ({' '.join(terms)})"
+
+
+def _score_candidates(rows, words):
+    """
+    BM25-style ranking over the candidate set: term-frequency saturation and length
+    normalization, with IDF taken from the candidates themselves. FTS5's own bm25()
+    scans the full doclist of every term for global stats, which is what makes
+    common words slow on large databases.
+    """
+    patterns = [re.compile(r"\b" + re.escape(w.lower()) + r"\b") for w in words[:-1]]
+    patterns.append(re.compile(r"\b" + re.escape(words[-1].lower())))
+    docs = []
+    for row in rows:
+        text = row['content'].lower()
+        tfs = [len(p.findall(text)) for p in patterns]
+        if tfs[-1] == 0:
+            continue # Only matched the truncated prefix
+        docs.append((row, tfs, text.count(' ') + 1))
+    if not docs:
+        return []
+
+    n = len(docs)
+    avg_len = sum(length for _, _, length in docs) / n
+    idf = [math.log(1 + n / max(1, sum(1 for _, tfs, _ in docs if tfs[i]))) for i in range(len(words))]
+    scored = []
+    for row, tfs, length in docs:
+        norm = 1.2 * (0.25 + 0.75 * length / avg_len)
+        score = sum(idf[i] * tf * 2.2 / (tf + norm) for i, tf in enumerate(tfs))
+        scored.append((score, row['rowid'], row))
+    # Ties go to the newer message
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return [row for _, _, row in scored]
+
+
+def search_messages(device_id, query, limit=20, offset=0):
+    """
+    Full-text search across the user's own chats, best matches first.
+    Ranks the SEARCH_CANDIDATES most recent matching messages.
+    Returns {"results": [...], "has_more": bool}; each result carries the chat id/title,
+    role, timestamp and an HTML-safe snippet with matches wrapped in <mark>.
+    """
+    empty = {"results": [], "has_more": False}
+    words = re.findall(r"\w+", query or "")[:8]
+    if not device_id or not words:
+        return empty
+    device_id = resolve_account(device_id)
+    match = _fts_query(device_id, words)
+    limit = max(1, min(int(limit), 100))
+    offset = max(0, int(offset))
+
+    with get_db_connection(device_id) as conn:
+        try:
+            candidates = conn.execute('''
+                SELECT messages_fts.rowid AS rowid, messages_fts.content AS content
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                JOIN chats c ON c.id = m.chat_id
+                WHERE messages_fts MATCH ? AND c.user_id = ?
+                ORDER BY messages_fts.rowid DESC
+                LIMIT ?
+            ''', (match, device_id, SEARCH_CANDIDATES)).fetchall()
+            ranked = _score_candidates(candidates, words)
+            page = [row['rowid'] for row in ranked[offset:offset + limit]]
+            if not page:
+                return empty
+
+            placeholders = ", ".join("?" * len(page))
+            rows = conn.execute(f'''
+                SELECT m.id, m.chat_id, c.title, m.role, m.timestamp,
+                       snippet(messages_fts, 0, ?, ?, '…', 16) AS snippet
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                JOIN chats c ON c.id = m.chat_id
+                WHERE messages_fts MATCH ? AND messages_fts.rowid IN ({placeholders})
+            ''', (_HL_START, _HL_END, match, *page)).fetchall()
+        except sqlite3.OperationalError as e:
+            # FTS5 missing or an unparsable query
+            print(f"Search failed: {e}")
+            return empty
+
+    by_id = {row['id']: row for row in rows}
+    results = []
+    for message_id in page:
+        row = by_id.get(message_id)
+        if row is None:
+            continue
+        snippet = html.escape(row['snippet']).replace(_HL_START, '<mark>').replace(_HL_END, '</mark>')
+        results.append({
+            "message_id": row['id'],
+            "chat_id": row['chat_id'],
+            "chat_title": row['title'],
+            "role": row['role'],
+            "timestamp": row['timestamp'],
+            "snippet": snippet,
+        })
+    return {"results": results, "has_more": len(ranked) > offset + limit}
+
+
+# --- COLD-CHAT ARCHIVE ---
+ARCHIVE_IDLE_DAYS = 30
+ARCHIVE_INTERVAL = 6 * 3600 # Seconds between background archiver runs
+_archiver_thread = None
+
+
+def archive_idle_chats(idle_days=ARCHIVE_IDLE_DAYS, limit=200, codec=archive.DEFAULT_CODEC):
+    """
+    Moves chats with no activity for `idle_days` into compressed blobs.
+    Each chat is archived in its own short transaction.
+    Returns a report with chat/message counts and bytes reclaimed from the hot table.
+    """
+    report = {"chats": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+    cutoff = time.time() - idle_days * 86400
+    for shard in get_storage().all_connections():
+        with shard as conn:
+            for chat_id in archive.find_idle_chats(conn, idle_days, limit):
+                if _writer.pending_for(chat_id):
+                    continue # About to get new messages
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Re-check under the write lock: another worker may have got here first
+                    still_idle = conn.execute(
+                        "SELECT 1 FROM chats WHERE id = ? AND archived_at IS NULL AND COALESCE(last_message_at, created) < ?",
+                        (chat_id, cutoff)
+                    ).fetchone()
+                    result = archive.archive_chat(conn, chat_id, codec) if still_idle else None
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                if result:
+                    report["chats"] += 1
+                    report["messages"] += result["messages"]
+                    report["raw_bytes"] += result["raw_bytes"]
+                    report["stored_bytes"] += result["stored_bytes"]
+    report["reclaimed_bytes"] = report["raw_bytes"] - report["stored_bytes"]
+    if report["chats"]:
+        print(f"🗄️ Archived {report['chats']} idle chats ({report['messages']} messages), "
+              f"reclaimed {report['reclaimed_bytes'] / 1024:.1f} KB")
+    return report
+
+
+def get_archive_stats():
+    """Totals for everything currently in cold storage (all shards)."""
+    chats = messages = raw_bytes = stored_bytes = 0
+    for shard in get_storage().all_connections():
+        with shard as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(raw_bytes), 0), "
+                "COALESCE(SUM(length(data)), 0) FROM chat_archives"
+            ).fetchone()
+        chats += row[0]
+        messages += row[1]
+        raw_bytes += row[2]
+        stored_bytes += row[3]
+    return {
+        "chats": chats,
+        "messages": messages,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "reclaimed_bytes": raw_bytes - stored_bytes,
+    }
+
+
+def start_archiver(idle_days=ARCHIVE_IDLE_DAYS, interval=ARCHIVE_INTERVAL):
+    """Starts the background archiver thread (once per process)."""
+    global _archiver_thread
+    if _archiver_thread is not None and _archiver_thread.is_alive():
+        return _archiver_thread
+
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                # Keep going in batches until nothing idle is left
+                while archive_idle_chats(idle_days)["chats"]:
+                    pass
+            except Exception as e:
+                print(f"⚠️ Archiver Error: {e}")
+
+    _archiver_thread = threading.Thread(target=_loop, name="VyomArchiver", daemon=True)
+    _archiver_thread.start()
+    return _archiver_thread
+
+
 def rename_chat(device_id, chat_id, new_title):
     """Renames a specific chat session."""
     if not all([device_id, chat_id, new_title]):
         return False
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         res = conn.execute(
             "UPDATE chats SET title = ? WHERE id = ? AND user_id = ?",
             (new_title, chat_id, device_id)
@@ -410,7 +915,8 @@ def delete_chat(device_id, chat_id):
     if not all([device_id, chat_id]):
         return False
         
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         cursor = conn.cursor()
         
         # Check how many chats the user has
@@ -421,7 +927,12 @@ def delete_chat(device_id, chat_id):
         if chat_count <= 1:
             # Instead of deleting, just clear its messages
             conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
-            conn.execute("UPDATE chats SET title = 'New Chat' WHERE id = ?", (chat_id,))
+            conn.execute("DELETE FROM chat_archives WHERE chat_id = ?", (chat_id,))
+            conn.execute(
+                "UPDATE chats SET title = 'New Chat', message_count = 0, last_message_at = NULL, "
+                "last_message_preview = NULL, archived_at = NULL WHERE id = ?",
+                (chat_id,)
+            )
             conn.commit()
             return True # Indicate an operation was performed
 
@@ -437,7 +948,8 @@ def delete_chat(device_id, chat_id):
 def delete_all_chats(device_id):
     """Deletes ALL chat history for a specific device ID."""
     if not device_id: return False
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         # We'll just delete all chats and create one new one.
         # The CASCADE foreign key will handle deleting all messages.
         conn.execute("DELETE FROM chats WHERE user_id = ?", (device_id,))
@@ -452,76 +964,67 @@ def delete_all_chats(device_id):
     return True
 
 def find_user_by_email(email):
-    """Finds a user by their email address."""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-        row = cursor.fetchone()
-        if row:
-            return dict(row)
+    """Finds a user by their email address (checks every shard)."""
+    for shard in get_storage().all_connections():
+        with shard as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
+            row = cursor.fetchone()
+            if row:
+                return dict(row)
     return None
 
 def link_device_to_user(old_id, new_id):
     """
-    Merges an existing user account (old_id) into the current device session (new_id).
-    Preserves the new_id so the browser session stays valid.
+    Logs the current device (new_id) in to the account that old_id belongs to.
+    A normal login is one insert into `devices`; the account's chats never move.
+    If new_id was an account of its own (e.g. registered on this browser), its chats
+    are adopted by the account being logged in to, as before.
     """
-    if not old_id or not new_id or old_id == new_id:
+    if not old_id or not new_id:
+        return
+    account_id = resolve_account(old_id)
+    previous = resolve_account(new_id)
+    if previous == account_id:
         return
 
-    with get_db_connection() as conn:
-        # 1. Get Old User Data
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE device_id = ?", (old_id,))
-        old_user = cursor.fetchone()
-        
-        if not old_user: return # Should not happen
-
-        # 2. Check if New Device ID exists (e.g. Guest session)
-        cursor.execute("SELECT * FROM users WHERE device_id = ?", (new_id,))
-        new_user = cursor.fetchone()
-
-        # 3. Migrate User Data
-        if new_user:
-            # Overwrite guest data with the logged-in user's data
-            # We keep 'created' from the old user to show account age
-            conn.execute('''
-                UPDATE users 
-                SET name=?, email=?, api_key=?, api_keys=?, gender=?, default_engine=?, default_model=?, created=?
-                WHERE device_id=?
-            ''', (
-                old_user['name'], old_user['email'], old_user['api_key'], 
-                old_user['api_keys'], old_user['gender'], old_user['default_engine'], 
-                old_user['default_model'], old_user['created'],
-                new_id
-            ))
-        else:
-            # Create new record for new_id with old data
-            conn.execute('''
-                INSERT INTO users (device_id, name, email, created, api_key, api_keys, gender, default_engine, default_model)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                new_id, old_user['name'], old_user['email'], old_user['created'],
-                old_user['api_key'], old_user['api_keys'], old_user['gender'],
-                old_user['default_engine'], old_user['default_model']
-            ))
-
-        # 4. Migrate Chats
-        # Move all chats from old_id to new_id
-        conn.execute("UPDATE chats SET user_id = ? WHERE user_id = ?", (new_id, old_id))
-
-        # 5. Delete Old User Record
-        # (Chats are already moved, so we can safely delete the user)
-        conn.execute("DELETE FROM users WHERE device_id = ?", (old_id,))
-        
+    if previous == new_id:
+        _adopt_account(new_id, account_id)
+
+    with get_db_connection(new_id) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO devices (device_id, account_id, linked_at) VALUES (?, ?, ?)",
+            (new_id, account_id, time.time())
+        )
+        conn.commit()
+    _invalidate_user(new_id, account_id)
+
+
+def _adopt_account(source_id, account_id):
+    """Moves a standalone account's chats into `account_id` and retires it (no-op if it has no user row)."""
+    with get_db_connection(source_id) as conn:
+        if conn.execute("SELECT 1 FROM users WHERE device_id = ?", (source_id,)).fetchone() is None:
+            return
+    # Bring the source account into account_id's shard first; the merge below is then local
+    storage_layer.move_user(get_storage(), source_id, account_id)
+    with get_db_connection(account_id) as conn:
+        conn.execute("UPDATE chats SET user_id = ? WHERE user_id = ?", (account_id, source_id))
+        conn.execute("DELETE FROM users WHERE device_id = ?", (source_id,))
         conn.commit()
+    # Devices that were logged in to the retired account follow its chats
+    for shard in get_storage().all_connections():
+        with shard as conn:
+            conn.execute("UPDATE devices SET account_id = ? WHERE account_id = ?", (account_id, source_id))
+            conn.commit()
+    _invalidate_user(source_id)
 
 def update_user(device_id, data):
     """Updates a user's record with provided data dictionary."""
     if not device_id or not data:
         return False
     
-    with get_db_connection() as conn:
+    device_id = resolve_account(device_id)
+    with get_db_connection(device_id) as conn:
         # Build dynamic update query
         keys = data.keys()
         set_clause = ", ".join([f"{key} = ?" for key in keys])
@@ -532,17 +1035,23 @@ def update_user(device_id, data):
         try:
             res = conn.execute(query, values)
             conn.commit()
+            # Device/location bookkeeping isn't part of the cached profile
+            if set(PROFILE_FIELDS).intersection(keys):
+                _invalidate_user(device_id)
             return res.rowcount > 0
         except sqlite3.OperationalError as e:
             print(f"Error updating user: {e}")
             return False
 
 def get_all_users():
-    """Returns a list of all registered users."""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users")
-        return [dict(row) for row in cursor.fetchall()]
+    """Returns a list of all registered users (across all shards)."""
+    users = []
+    for shard in get_storage().all_connections():
+        with shard as conn:
+            users.extend(dict(row) for row in conn.execute("SELECT * FROM users"))
+    return users
 
 # --- INITIALIZATION ---
 _initialize_database()
+# Drain queued messages before the pooled connections are closed
+atexit.register(_writer.stop)
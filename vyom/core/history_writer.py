@@ -0,0 +1,124 @@
+"""
+VYOM HISTORY WRITER
+Write-behind queue for chat messages.
+
+Features:
+1. One writer thread, so messages land in the order they were queued.
+2. Everything queued within a few milliseconds is committed in one transaction.
+3. Queued-but-unwritten messages stay visible through `pending_for()`.
+4. `flush()` / `stop()` drain the queue (called automatically at exit).
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class HistoryWriter:
+    def __init__(self, flush_fn, interval=0.005, max_batch=500, retries=3):
+        """
+        flush_fn(batch) must persist a list of records in a single transaction.
+        Each record is a dict with at least a 'chat_id' key.
+        """
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_batch = max_batch
+        self.retries = retries
+
+        self._queue = deque()
+        self._pending = {}  # chat_id -> records not yet committed
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._in_flight = 0
+
+        self.batches_written = 0
+        self.records_written = 0
+        self.records_dropped = 0
+
+    def submit(self, record):
+        with self._cond:
+            self._queue.append(record)
+            self._pending.setdefault(record['chat_id'], []).append(record)
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def pending_for(self, chat_id):
+        """Records for `chat_id` that are queued or currently being written."""
+        with self._cond:
+            return list(self._pending.get(chat_id, ()))
+
+    def flush(self, timeout=10.0):
+        """Blocks until everything queued so far has been written. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=10.0):
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        return flushed
+
+    def _ensure_thread(self):
+        # Started lazily so forked (gunicorn) workers get their own thread
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="VyomHistoryWriter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping and not self._queue:
+                    return
+
+            # Give concurrent requests a moment to join this batch
+            time.sleep(self.interval)
+
+            with self._cond:
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+                self._in_flight = len(batch)
+
+            written = self._write(batch)
+
+            with self._cond:
+                for record in batch:
+                    records = self._pending.get(record['chat_id'])
+                    if records:
+                        records.remove(record)
+                        if not records:
+                            del self._pending[record['chat_id']]
+                self._in_flight = 0
+                if written:
+                    self.batches_written += 1
+                    self.records_written += len(batch)
+                else:
+                    # Shards that committed before the failure kept their records
+                    dropped = sum(1 for record in batch if not record.get('committed'))
+                    self.records_written += len(batch) - dropped
+                    self.records_dropped += dropped
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.flush_fn(batch)
+                return True
+            except Exception as e:
+                print(f"⚠️ History Writer: batch of {len(batch)} failed (attempt {attempt}/{self.retries}): {e}")
+                time.sleep(0.05 * attempt)
+        lost = [record for record in batch if not record.get('committed')]
+        chats = sorted({record['chat_id'] for record in lost})
+        print(f"❌ History Writer: dropped {len(lost)} messages (chats {', '.join(map(str, chats[:5]))}"
+              f"{'...' if len(chats) > 5 else ''}) after {self.retries} attempts.")
+        return False
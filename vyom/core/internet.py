@@ -3,6 +3,8 @@ VYOM AI INTERNET MODULE (No-API Version)
 Uses DuckDuckGo to fetch live search results.
 """
 from duckduckgo_search import DDGS
+from vyom.core.metrics import UPSTREAM_CALLS
+from vyom.core import tracing
 
 def search_google(query):
     """
@@ -24,9 +26,11 @@ def search_google(query):
             # If news related, use news search for recency
             news_keywords = ['news', 'score', 'weather', 'stock', 'today', 'latest']
             if any(k in clean_query.lower() for k in news_keywords):
-                results = list(ddgs.news(clean_query, max_results=4))
+                with UPSTREAM_CALLS.time(service="duckduckgo_news"), tracing.span("search.duckduckgo", kind="news"):
+                    results = list(ddgs.news(clean_query, max_results=4))
             else:
-                results = list(ddgs.text(clean_query, max_results=4))
+                with UPSTREAM_CALLS.time(service="duckduckgo"), tracing.span("search.duckduckgo", kind="text"):
+                    results = list(ddgs.text(clean_query, max_results=4))
             
             if not results:
                 return None
@@ -0,0 +1,221 @@
+"""
+VYOM KEY SCHEDULER
+Picks which API key x model pair to try first, from how each pair has been doing.
+
+Features:
+1. Per key x model: EWMA success rate and latency, consecutive failures, last use.
+2. Errors are classified from the SDK's HTTP code / status only, never from message text.
+   Quota errors (429 / RESOURCE_EXHAUSTED) put the pair on an exponential cooldown.
+3. 404 / NOT_FOUND on a system key blacklists the model (for every key); on a user's own key
+   it only blocks that pair. Invalid-key errors blacklist the key.
+   Blacklists expire after an hour in case a model comes back or a key is fixed.
+4. Other repeated failures open a circuit breaker on the pair for a short while.
+5. `plan()` orders the usable pairs healthiest first, spreading load across equally
+   healthy keys. Thread-safe: one lock, no shared rotation index.
+
+Keys are held as short fingerprints, never in full, so stats() is safe to expose.
+"""
+
+import hashlib
+import threading
+import time
+
+from cachetools import LRUCache
+
+BASE_COOLDOWN = 5.0         # Seconds after the first 429; doubles per consecutive 429
+MAX_COOLDOWN = 300.0
+BLACKLIST_SECONDS = 3600.0  # 404 models / invalid keys
+BREAKER_THRESHOLD = 3       # Consecutive non-quota failures that open the breaker
+BREAKER_SECONDS = 30.0
+EWMA_ALPHA = 0.3
+SCORE_BUCKET = 0.05         # Pairs scoring within one bucket count as equally healthy
+MODEL_RANK_PENALTY = 0.02   # Keeps the declared model order as the tie-breaker
+LATENCY_PENALTY = 0.01      # Per second of average latency (capped at 30 s)
+
+QUOTA, NOT_FOUND, AUTH, ERROR = "quota", "not_found", "auth", "error"
+
+
+def classify_error(error):
+    """
+    'quota', 'not_found', 'auth' or 'error' for an exception from the Gemini SDK (genai APIError),
+    from its HTTP code and status only: message text can quote anything, a prompt or a model name.
+    """
+    code = getattr(error, "code", None)
+    status = getattr(error, "status", None)
+    if code == 429 or status == "RESOURCE_EXHAUSTED":
+        return QUOTA
+    if code == 404 or status == "NOT_FOUND":
+        return NOT_FOUND
+    if code in (401, 403) or status in ("UNAUTHENTICATED", "PERMISSION_DENIED") or "API_KEY_INVALID" in _reasons(error):
+        return AUTH
+    return ERROR
+
+
+def _reasons(error):
+    """ErrorInfo reasons from an APIError's JSON body (a bad key is a 400 with reason API_KEY_INVALID)."""
+    body = getattr(error, "details", None)
+    body = body.get("error", body) if isinstance(body, dict) else {}
+    details = body.get("details") if isinstance(body, dict) else None
+    return {d.get("reason") for d in details if isinstance(d, dict)} if isinstance(details, list) else set()
+
+
+def fingerprint(key):
+    return "key#" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+
+
+class _PairHealth:
+    __slots__ = ("success", "latency", "failures", "quota_strikes", "blocked_until", "reason", "last_used", "calls")
+
+    def __init__(self):
+        self.success = 1.0  # Optimistic until proven otherwise
+        self.latency = 0.0
+        self.failures = 0
+        self.quota_strikes = 0
+        self.blocked_until = 0.0
+        self.reason = None
+        self.last_used = 0.0
+        self.calls = 0
+
+
+class KeyModelScheduler:
+    def __init__(self, clock=time.monotonic, max_pairs=4096):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pairs = LRUCache(maxsize=max_pairs)   # (fingerprint, model) -> _PairHealth
+        self._blocked_models = LRUCache(maxsize=256) # model -> until (names can come from clients)
+        self._blocked_keys = LRUCache(maxsize=1024) # fingerprint -> until
+        self._stats = {"planned": 0, "first_try_success": 0, "successes": 0, "failures": 0,
+                       "quota": 0, "not_found": 0, "auth": 0, "breaker_opened": 0}
+
+    def _pair(self, fp, model):
+        health = self._pairs.get((fp, model))
+        if health is None:
+            health = self._pairs[(fp, model)] = _PairHealth()
+        return health
+
+    def _score(self, health, rank):
+        return health.success - MODEL_RANK_PENALTY * rank - LATENCY_PENALTY * min(health.latency, 30.0)
+
+    def plan(self, keys, models):
+        """
+        (key, model) pairs to try, best first. Pairs cooling down, or with a blacklisted
+        model/key, are left out. If that leaves nothing, those pairs are returned instead,
+        soonest-available first, so a request still gets a chance instead of failing outright.
+        """
+        now = self.clock()
+        ready, cooling = [], []
+        with self._lock:
+            self._stats["planned"] += 1
+            for rank, model in enumerate(models):
+                model_until = self._blocked_models.get(model, 0)
+                for key in keys:
+                    fp = fingerprint(key)
+                    health = self._pair(fp, model)
+                    until = max(model_until, self._blocked_keys.get(fp, 0), health.blocked_until)
+                    if until > now:
+                        cooling.append((until, key, model))
+                        continue
+                    bucket = round(self._score(health, rank) / SCORE_BUCKET)
+                    # Higher bucket first, then the preferred model, then the least recently used key
+                    ready.append((-bucket, rank, health.last_used, key, model))
+        if ready:
+            return [(key, model) for *_, key, model in sorted(ready, key=lambda r: r[:3])]
+        return [(key, model) for _, key, model in sorted(cooling, key=lambda c: c[0])]
+
+    def record_success(self, key, model, latency, attempt=1):
+        fp = fingerprint(key)
+        with self._lock:
+            health = self._pair(fp, model)
+            health.calls += 1
+            health.last_used = self.clock()
+            health.success += EWMA_ALPHA * (1.0 - health.success)
+            health.latency = latency if health.calls == 1 else health.latency + EWMA_ALPHA * (latency - health.latency)
+            health.failures = health.quota_strikes = 0
+            health.blocked_until = 0.0
+            health.reason = None
+            self._stats["successes"] += 1
+            if attempt == 1:
+                self._stats["first_try_success"] += 1
+
+    def record_failure(self, key, model, error, system=True):
+        """
+        Updates the pair's health for `error`. Returns the error class.
+        `system=False` (a user's own key): a missing model is only blocked for that key.
+        """
+        kind = classify_error(error)
+        fp = fingerprint(key)
+        now = self.clock()
+        with self._lock:
+            health = self._pair(fp, model)
+            health.calls += 1
+            health.last_used = now
+            health.success += EWMA_ALPHA * (0.0 - health.success)
+            health.failures += 1
+            health.reason = kind
+            self._stats["failures"] += 1
+            if kind == QUOTA:
+                health.quota_strikes += 1
+                cooldown = min(BASE_COOLDOWN * 2 ** (health.quota_strikes - 1), MAX_COOLDOWN)
+                health.blocked_until = now + cooldown
+                self._stats["quota"] += 1
+            elif kind == NOT_FOUND:
+                if system:
+                    self._prune_blocked_models(now)
+                    self._blocked_models[model] = now + BLACKLIST_SECONDS
+                else:
+                    health.blocked_until = now + BLACKLIST_SECONDS
+                self._stats["not_found"] += 1
+            elif kind == AUTH:
+                self._blocked_keys[fp] = now + BLACKLIST_SECONDS
+                self._stats["auth"] += 1
+            elif health.failures >= BREAKER_THRESHOLD:
+                health.blocked_until = now + BREAKER_SECONDS
+                self._stats["breaker_opened"] += 1
+        return kind
+
+    def _prune_blocked_models(self, now):
+        # Lock held
+        for model in [m for m, until in self._blocked_models.items() if until <= now]:
+            del self._blocked_models[model]
+
+    def reset(self):
+        with self._lock:
+            self._pairs.clear()
+            self._blocked_models.clear()
+            self._blocked_keys.clear()
+
+    def stats(self):
+        now = self.clock()
+        with self._lock:
+            pairs = {
+                f"{fp}/{model}": {
+                    "success": round(h.success, 3),
+                    "latency_s": round(h.latency, 3),
+                    "calls": h.calls,
+                    "cooling_for_s": round(max(0.0, h.blocked_until - now), 1),
+                    "last_error": h.reason,
+                }
+                for (fp, model), h in self._pairs.items()
+            }
+            stats = dict(
+                self._stats,
+                blacklisted_models=sorted(m for m, until in self._blocked_models.items() if until > now),
+                blacklisted_keys=sorted(k for k, until in self._blocked_keys.items() if until > now),
+                pairs=pairs,
+            )
+        stats["first_try_rate"] = round(stats["first_try_success"] / stats["successes"], 3) if stats["successes"] else 0.0
+        return stats
+
+
+# Shared by every engine that draws on the same Gemini keys and quotas
+gemini_scheduler = KeyModelScheduler()
+
+
+def _register_metrics():
+    from vyom.core.metrics import registry
+    events = registry.counter("vyom_llm_scheduler_events_total", "Key x model scheduler outcomes", ("event",))
+    for event in ("successes", "first_try_success", "failures", "quota", "not_found", "auth", "breaker_opened"):
+        events.set_function(lambda e=event: gemini_scheduler._stats[e], event=event)
+
+
+_register_metrics()
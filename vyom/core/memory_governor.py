@@ -0,0 +1,206 @@
+"""
+VYOM MEMORY GOVERNOR
+Decides when garbage collection and cache shrinking are actually worth their cost.
+
+Features:
+1. Samples process RSS (psutil, /proc, or getrusage) and allocator counters, at most every few seconds.
+2. Tunes gc generation thresholds: relaxed while memory is comfortable (fewer young
+   collections on the request path), back to the interpreter defaults near the high-water mark.
+3. Above the high-water mark: one full collection (plus the CUDA cache in heavy mode), with a cooldown.
+   Above the critical mark: also shrinks the registered caches, with a shorter cooldown. Shrinking
+   pauses once it stops helping (nothing left to drop, or RSS didn't fall) until RSS grows again.
+4. Every decision and the memory it reclaimed is recorded and available via `stats()`.
+
+Configured with VYOM_MEM_HIGH_MB, VYOM_MEM_CRITICAL_MB and VYOM_MEM_CHECK_SECONDS.
+"""
+
+import gc
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024 * 1024
+RELAXED_GEN0_FACTOR = 5 # gen0 threshold multiplier while memory is comfortable
+COMFORT_RATIO = 0.75    # "comfortable" = below this fraction of the high-water mark
+DECISION_LOG = 50       # Recent decisions kept for stats()
+CRITICAL_COOLDOWN_RATIO = 1 / 6 # Critical-level cooldown as a fraction of the normal one
+
+OK, HIGH, CRITICAL = "ok", "high", "critical"
+
+
+def rss_bytes():
+    """Resident set size of this process, or 0 if the platform can't tell us."""
+    if psutil is not None:
+        try:
+            return psutil.Process().memory_info().rss
+        except Exception:
+            pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak, not current; better than nothing. KB on Linux, bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return 0
+
+
+def _release_accelerator_cache():
+    # Only if torch is already loaded: importing it here would cost more than it frees
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    try:
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:
+        pass
+
+
+class MemoryGovernor:
+    def __init__(self, high_water_mb=1024, critical_mb=1536, interval=5.0, cooldown=30.0,
+                 shrinkers=None, release_accelerator=False, rss_fn=rss_bytes, critical_cooldown=None):
+        self.high_water = int(high_water_mb * MB)
+        self.critical = int(critical_mb * MB)
+        self.interval = interval
+        self.cooldown = cooldown
+        self.critical_cooldown = cooldown * CRITICAL_COOLDOWN_RATIO if critical_cooldown is None else critical_cooldown
+        self.shrinkers = dict(shrinkers or {}) # name -> callable returning entries dropped
+        self.release_accelerator = release_accelerator
+        self.rss_fn = rss_fn
+        self.default_thresholds = gc.get_threshold()
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._last_collect = 0.0
+        self._level = None
+        self._last_rss = 0
+        self._shrink_stalled_at = None # RSS after a shrink that didn't help; no more shrinking until above it
+        self._decisions = deque(maxlen=DECISION_LOG)
+        self._stats = {"checks": 0, "collections": 0, "shrinks": 0, "reclaimed_bytes": 0,
+                       "threshold_changes": 0, "shrinks_skipped": 0}
+
+    def add_shrinker(self, name, fn):
+        self.shrinkers[name] = fn
+
+    def level_for(self, rss):
+        if rss >= self.critical:
+            return CRITICAL
+        if rss >= self.high_water:
+            return HIGH
+        return OK
+
+    def check(self, force=False):
+        """
+        Samples memory and acts if a mark is crossed. Cheap when nothing is due, so it
+        can be called after every request. Returns the decision dict, or None if it did nothing.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_check < self.interval:
+                return None
+            self._last_check = now
+            self._stats["checks"] += 1
+
+        rss = self.rss_fn()
+        level = self.level_for(rss)
+        self._tune(rss, level)
+        with self._lock:
+            self._last_rss = rss
+            # Above the high mark a collection that freed little won't free more a second later
+            cooldown = self.critical_cooldown if level == CRITICAL else self.cooldown
+            due = level != OK and now - self._last_collect >= cooldown
+            if not (force or due):
+                return None
+            self._last_collect = now
+        return self._reclaim(rss, level)
+
+    def _tune(self, rss, level):
+        gen0, gen1, gen2 = self.default_thresholds
+        if level == OK and rss < self.high_water * COMFORT_RATIO:
+            wanted = (gen0 * RELAXED_GEN0_FACTOR, gen1, gen2)
+        else:
+            wanted = self.default_thresholds
+        with self._lock:
+            self._level = level
+            if gc.get_threshold() != wanted:
+                gc.set_threshold(*wanted)
+                self._stats["threshold_changes"] += 1
+
+    def _reclaim(self, rss_before, level):
+        started = time.perf_counter()
+        collected = gc.collect()
+        if self.release_accelerator:
+            _release_accelerator_cache()
+        dropped = {}
+        with self._lock:
+            stalled = self._shrink_stalled_at is not None and rss_before <= self._shrink_stalled_at
+            if level == CRITICAL and stalled:
+                self._stats["shrinks_skipped"] += 1
+        if level == CRITICAL and not stalled:
+            for name, shrink in self.shrinkers.items():
+                try:
+                    dropped[name] = shrink()
+                except Exception as e:
+                    print(f"⚠️ Memory governor could not shrink {name}: {e}")
+        rss_after = self.rss_fn()
+        reclaimed = max(0, rss_before - rss_after)
+        decision = {
+            "time": time.time(),
+            "level": level,
+            "action": "collect+shrink" if dropped else "collect",
+            "rss_before_mb": round(rss_before / MB, 1),
+            "rss_after_mb": round(rss_after / MB, 1),
+            "reclaimed_mb": round(reclaimed / MB, 1),
+            "objects_collected": collected,
+            "entries_dropped": dropped,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        with self._lock:
+            self._last_rss = rss_after
+            if dropped:
+                # Emptied caches, or memory that isn't theirs: halving again would only cost hit rate
+                helped = any(dropped.values()) and rss_after < rss_before
+                self._shrink_stalled_at = None if helped else rss_after
+            self._stats["collections"] += 1
+            self._stats["shrinks"] += 1 if dropped else 0
+            self._stats["reclaimed_bytes"] += reclaimed
+            self._decisions.append(decision)
+        print(f"🧹 Memory {level}: {decision['rss_before_mb']} MB -> {decision['rss_after_mb']} MB "
+              f"({collected} objects, {decision['action']}, {decision['duration_ms']} ms)")
+        return decision
+
+    def stats(self):
+        with self._lock:
+            stats = dict(
+                self._stats,
+                level=self._level,
+                rss_mb=round(self._last_rss / MB, 1),
+                high_water_mb=round(self.high_water / MB, 1),
+                critical_mb=round(self.critical / MB, 1),
+                recent_decisions=list(self._decisions),
+            )
+        stats["gc_threshold"] = gc.get_threshold()
+        stats["gc_count"] = gc.get_count()
+        stats["gc_collections"] = [gen["collections"] for gen in gc.get_stats()]
+        stats["allocated_blocks"] = sys.getallocatedblocks()
+        return stats
+
+
+def from_env(shrinkers=None, release_accelerator=False):
+    """MemoryGovernor configured from VYOM_MEM_HIGH_MB / VYOM_MEM_CRITICAL_MB / VYOM_MEM_CHECK_SECONDS."""
+    high = float(os.getenv("VYOM_MEM_HIGH_MB", "1024"))
+    critical = float(os.getenv("VYOM_MEM_CRITICAL_MB", str(high * 1.5)))
+    interval = float(os.getenv("VYOM_MEM_CHECK_SECONDS", "5"))
+    return MemoryGovernor(high_water_mb=high, critical_mb=critical, interval=interval,
+                          shrinkers=shrinkers, release_accelerator=release_accelerator)
@@ -0,0 +1,235 @@
+"""
+VYOM METRICS
+Low-overhead in-process metrics, exposed at /metrics in Prometheus text format.
+
+Features:
+1. Counters, gauges and fixed-bucket histograms with labels (one small lock per metric).
+2. `Histogram.time(...)` context manager; a `status` label is filled in as "ok"/"error" automatically.
+3. Callback-backed values (`set_function`) for numbers other modules already keep
+   (queue depth, cache entries, RSS), read only when /metrics is scraped.
+4. The instruments the app records into are defined here, so every module shares them.
+5. `bounded()` folds unknown label values into "other", so clients can't grow the series count.
+
+Each gunicorn worker keeps its own registry; a scrape sees the worker that served it.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds. Covers a cache hit (sub-millisecond) up to a slow multi-model fallback.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def bounded(value, known, other="other"):
+    """`value` if it is one of `known`, else `other`: client-supplied values must not mint new label series."""
+    return value if value in known else other
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._functions = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames) or any(n not in labels for n in self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def set_function(self, fn, **labels):
+        """Reports fn() for these labels at scrape time instead of a stored value."""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = float(fn())
+            except Exception:
+                pass # A broken callback shouldn't take the whole scrape down
+        return sorted(values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, the +Inf slot last, then sum
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the block's duration. If the histogram has a `status` label it is set for you."""
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if "status" in self.labelnames:
+                labels.setdefault("status", status)
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_by_key = {k: list(v) for k, v in self._values.items()}
+        for key, series in sorted(series_by_key.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += n
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Everything in Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- SHARED INSTRUMENTS ---
+
+HTTP_REQUESTS = registry.histogram(
+    "vyom_http_server_seconds", "Time to handle an HTTP request", ("endpoint", "method", "status"))
+ASK_REQUESTS = registry.counter(
+    "vyom_ask_requests_total", "/ask requests by engine and how they were answered", ("engine", "outcome"))
+ASK_TTFB = registry.histogram(
+    "vyom_ask_ttfb_seconds", "Time from an /ask/stream request to its first answer chunk", ("engine",))
+CONTEXT_TOKENS = registry.histogram(
+    "vyom_context_tokens", "Conversation context tokens sent with a question", ("engine",),
+    buckets=(0, 50, 100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000))
+ASK_STAGE = registry.histogram(
+    "vyom_ask_stage_seconds", "Time /ask spends in each stage", ("stage", "engine"))
+ENGINE_CALLS = registry.histogram(
+    "vyom_engine_seconds", "Time to get an answer from an engine", ("engine", "model", "status"))
+LLM_CALLS = registry.histogram(
+    "vyom_llm_request_seconds", "Single Gemini generate_content call", ("model", "key", "status"))
+UPSTREAM_CALLS = registry.histogram(
+    "vyom_upstream_request_seconds", "Outbound HTTP calls (search, TTS, geocoding)", ("service", "status"))
+SQLITE_CALLS = registry.histogram(
+    "vyom_sqlite_seconds", "Time a pooled SQLite connection is held per block", ("db", "status"))
+FUNCTION_CALLS = registry.histogram(
+    "vyom_function_seconds", "Functions wrapped with performance.measure_performance", ("function", "status"))
@@ -0,0 +1,232 @@
+"""
+VYOM SCHEMA MIGRATIONS
+Versioned upgrades for the chat database, tracked in `PRAGMA user_version`.
+
+Each migration runs exactly once, in order, inside its own transaction.
+Once a database is current, startup costs a single PRAGMA read.
+To change the schema, append a new function to MIGRATIONS (never edit old ones).
+"""
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_columns(conn, table, columns):
+    existing = _columns(conn, table)
+    for name, col_type in columns:
+        if name not in existing:
+            print(f"Migrating Database: Adding {name} column to {table} table...")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
+
+def _v1_base_schema(conn):
+    """Core tables plus every column the old startup probes used to add."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            device_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            created REAL NOT NULL,
+            api_key TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chats (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            created REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (device_id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp REAL NOT NULL,
+            FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
+        )
+    ''')
+    # Databases created before versioning may already have some of these
+    _add_columns(conn, "users", [
+        ("api_key", "TEXT"),
+        ("gender", "TEXT"),
+        ("default_engine", "TEXT"),
+        ("default_model", "TEXT"),
+        ("api_keys", "TEXT"),
+        ("last_device", "TEXT"),
+        ("last_os", "TEXT"),
+        ("last_seen_platform", "TEXT"),
+        ("last_location", "TEXT"),
+        ("lat", "TEXT"),
+        ("lon", "TEXT"),
+    ])
+
+
+def _v2_hot_path_indexes(conn):
+    """Indexes for the sidebar, history load, login lookup and chat deletion."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat_time ON messages (chat_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_user_created ON chats (user_id, created DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)")
+    conn.execute("ANALYZE")
+
+
+def _v3_chat_activity_counters(conn):
+    """Denormalized per-chat counters, kept up to date by history._insert_message."""
+    _add_columns(conn, "chats", [
+        ("message_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("last_message_at", "REAL"),
+        ("last_message_preview", "TEXT"),
+    ])
+    # Backfill existing chats (one pass, served by idx_messages_chat_time)
+    conn.execute('''
+        UPDATE chats SET
+            message_count = (SELECT COUNT(*) FROM messages WHERE chat_id = chats.id),
+            last_message_at = (SELECT MAX(timestamp) FROM messages WHERE chat_id = chats.id),
+            last_message_preview = (
+                SELECT substr(content, 1, 120) FROM messages WHERE chat_id = chats.id
+                ORDER BY timestamp DESC, id DESC LIMIT 1
+            )
+    ''')
+    # Sidebar order: most recent activity first, falling back to creation time
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chats_user_activity "
+        "ON chats (user_id, COALESCE(last_message_at, created) DESC)"
+    )
+
+
+def _v4_message_search(conn):
+    """
+    FTS5 index over message content, tagged with the chat owner for per-user scoping.
+    Owner ids are stored without dashes so a UUID indexes as one token.
+    The prefix index covers the 2-4 character prefixes search-as-you-type relies on.
+    """
+    if not conn.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0]:
+        print("Migrating Database: SQLite built without FTS5, message search disabled.")
+        return
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts "
+        "USING fts5(content, owner, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+    )
+    conn.execute('''
+        INSERT INTO messages_fts (rowid, content, owner)
+        SELECT m.id, m.content, replace(c.user_id, '-', '') FROM messages m JOIN chats c ON c.id = m.chat_id
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content, owner)
+            VALUES (NEW.id, NEW.content, (SELECT replace(user_id, '-', '') FROM chats WHERE id = NEW.chat_id));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            DELETE FROM messages_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            UPDATE messages_fts SET content = NEW.content WHERE rowid = NEW.id;
+        END
+    ''')
+    # link_device_to_user moves chats between users
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chats_fts_owner AFTER UPDATE OF user_id ON chats BEGIN
+            UPDATE messages_fts SET owner = replace(NEW.user_id, '-', '')
+            WHERE rowid IN (SELECT id FROM messages WHERE chat_id = NEW.id);
+        END
+    ''')
+
+
+def _v5_chat_archives(conn):
+    """Compressed cold storage for idle chats (see vyom.core.archive)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_archives (
+            chat_id TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            message_count INTEGER NOT NULL,
+            raw_bytes INTEGER NOT NULL,
+            archived_at REAL NOT NULL,
+            FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
+        )
+    ''')
+    _add_columns(conn, "chats", [("archived_at", "REAL")])
+
+
+def _v6_devices(conn):
+    """
+    Device -> account mapping, so logging in from a new browser is one insert instead of
+    moving every chat. Each existing user row becomes an account with itself as its device.
+    No foreign key on account_id: with sharding the account row may live in another file.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            device_id TEXT PRIMARY KEY,
+            account_id TEXT NOT NULL,
+            linked_at REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_account ON devices (account_id)")
+    conn.execute("INSERT OR IGNORE INTO devices (device_id, account_id, linked_at) SELECT device_id, device_id, created FROM users")
+
+
+def _v7_conversation_context(conn):
+    """
+    Per-message token counts (filled at write time; NULL rows are counted on read) and the
+    rolling summary of each chat's older turns (see vyom.core.context_builder).
+    """
+    _add_columns(conn, "messages", [("tokens", "INTEGER")])
+    _add_columns(conn, "chats", [
+        ("summary", "TEXT"),
+        ("summary_until", "REAL"), # Timestamp of the newest message folded into the summary
+    ])
+
+
+# Index + 1 == the user_version the database has after that migration ran
+MIGRATIONS = [
+    _v1_base_schema,
+    _v2_hot_path_indexes,
+    _v3_chat_activity_counters,
+    _v4_message_search,
+    _v5_chat_archives,
+    _v6_devices,
+    _v7_conversation_context,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn, target=None):
+    """
+    Brings the database up to `target` (default: latest).
+    Safe to call from several processes at once: each step takes the write
+    lock and re-checks the version before running.
+    Returns the number of migrations applied.
+    """
+    target = LATEST_VERSION if target is None else target
+    if get_version(conn) >= target:
+        return 0
+
+    applied = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = get_version(conn)
+            if version >= target:
+                conn.rollback()
+                break
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+            applied += 1
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
@@ -3,17 +3,31 @@ VYOM CORE OPTIMIZER
 "iPhone-Level" Performance Manager.
 
 Features:
-1. Thread Pool for non-blocking I/O (Database writes).
-2. LRU Caching for repeated queries.
-3. Aggressive RAM Management (Garbage Collection).
+1. Bounded, prioritised Thread Pool for background work (see vyom.core.executor).
+2. LRU + TTL Caching for repeated queries (byte budget, see vyom.core.response_cache),
+   backed by a node-wide SQLite tier shared by all workers (vyom.core.disk_cache).
+   Stale live/daily answers are served instantly and refreshed in the background.
+3. Request Coalescing: identical questions in flight share one upstream call.
+4. Adaptive RAM Management: collection and cache shrinking only past memory
+   high-water marks (see vyom.core.memory_governor).
 """
 
-import gc
+import atexit
 import threading
 import functools
-import time
-from concurrent.futures import ThreadPoolExecutor
 import vyom.config as config
+from vyom.core import executor as executor_lib
+from vyom.core.response_cache import ResponseCache
+from vyom.core import query_cache
+from vyom.core import disk_cache
+from vyom.core import memory_governor
+from vyom.core import metrics
+from vyom.core import tracing
+from vyom.core.key_scheduler import fingerprint
+from vyom.core.single_flight import SingleFlight
+
+# Seconds a coalesced request waits for the leader before making its own call
+COALESCE_TIMEOUT = 60
 
 class SystemOptimizer:
     _instance = None
@@ -30,66 +44,179 @@ class SystemOptimizer:
     def __init__(self):
         if self._initialized: return
         
-        # Worker Pool: Background tasks (like saving history) won't block the UI
-        # Increased workers for maximum speed
-        self.executor = ThreadPoolExecutor(max_workers=20, thread_name_prefix="VyomWorker")
+        # Worker Pool: Background tasks won't block the UI
+        # Queues are bounded so a slow dependency shows up as backpressure, not as memory growth
+        self.executor = executor_lib.BackgroundExecutor(workers=20, name="VyomWorker")
+        self.executor.add_queue("default", priority=5, max_depth=500, overflow=executor_lib.RUN_INLINE)
+        # Stale-answer refreshes: a newer refresh makes an old queued one pointless
+        self.executor.add_queue("refresh", priority=7, max_depth=64, overflow=executor_lib.DROP_OLDEST)
+        # Rolling chat summaries: at most one per chat is queued, and a dropped one is redone next turn
+        self.executor.add_queue("summaries", priority=8, max_depth=32, overflow=executor_lib.DROP_OLDEST)
+        # Housekeeping (memory cleanup): one pending run is as good as many
+        self.executor.add_queue("maintenance", priority=9, max_depth=1, overflow=executor_lib.DROP_OLDEST)
+        atexit.register(self.executor.shutdown)
         
-        # Simple In-Memory Cache for Light Mode responses
-        self.response_cache = {} 
-        self.max_cache_size = 200 # Increased cache size
+        # In-Memory LRU Cache for answers (bounded by bytes), over the shared on-disk tier
+        self.response_cache = disk_cache.from_env(ResponseCache())
+        # Canonical (and optionally similarity) lookups in front of it
+        self.query_cache = query_cache.from_env(self.response_cache)
+        self._refreshing = set() # Cache keys with a background refresh in flight
+        self._refresh_lock = threading.Lock()
+        self._refresh_stats = {"stale_served": 0, "refreshes": 0, "refresh_failures": 0}
+
+        # Identical in-flight questions (normalized query + engine + model) share one call
+        self.inflight = SingleFlight()
+
+        # Collects/shrinks only when RSS crosses VYOM_MEM_HIGH_MB / VYOM_MEM_CRITICAL_MB
+        self.memory = memory_governor.from_env(
+            shrinkers={"response_cache": self.response_cache.shrink},
+            release_accelerator=config.MODE == 'default',
+        )
+        self._register_metrics()
         
         # Log startup in ASCII-safe way to avoid encoding issues
-        print("System Optimizer: TURBO ACTIVE (20 Background Threads Ready)")
+        print("System Optimizer: TURBO ACTIVE (20 Background Threads, 4 Bounded Queues Ready)")
         self._initialized = True
 
     def run_in_background(self, func, *args, **kwargs):
         """
-        Runs a function in a separate thread.
-        Use this for DB writes, Analytics, or Cleanup.
+        Runs a function in a separate thread (on the "default" queue).
+        Use this for DB writes, Analytics, or Cleanup. Returns a Future.
         """
-        self.executor.submit(func, *args, **kwargs)
+        return self.executor.submit("default", func, *args, **kwargs)
 
-    def cache_response(self, query, response, engine='general'):
+    def submit(self, queue, func, *args, **kwargs):
+        """Runs a function on a named background queue ("default", "refresh", "summaries", "maintenance"). Returns a Future."""
+        return self.executor.submit(queue, func, *args, **kwargs)
+
+    def get_executor_stats(self):
+        """Queue depth, drops, failures and wait/run latency per background queue."""
+        return self.executor.stats()
+
+    def cache_response(self, query, response, engine='general', ttl=None, freshness=None):
         """
         Stores response with engine context to speed up repeated questions.
+        `freshness` ('live', 'daily', 'static'; classified from the query when None) sets how
+        long the answer counts as fresh and how long it is kept. `ttl` overrides the latter.
         """
-        cache_key = f"{engine}:{query}"
-        if len(self.response_cache) > self.max_cache_size:
-            # Remove oldest item
-            self.response_cache.pop(next(iter(self.response_cache)))
-        
-        self.response_cache[cache_key] = response
+        if isinstance(response, str) and response.lstrip().startswith("⚠️"):
+            return # Failures are for this request only: never cached, in memory or on disk
+        freshness = freshness or query_cache.classify_freshness(query)
+        fresh_for, keep_for = query_cache.FRESHNESS[freshness]
+        self.query_cache.set(query, response, engine=engine, ttl=ttl or keep_for, fresh_for=fresh_for)
 
-    def get_cached_response(self, query, engine='general'):
-        cache_key = f"{engine}:{query}"
-        return self.response_cache.get(cache_key)
-
-    def optimize_memory(self):
+    def get_cached_response(self, query, engine='general', refresh=None):
         """
-        Forces Garbage Collection. 
-        Critical for Heavy Mode (Torch/CUDA).
+        Returns the cached answer or None.
+        A stale answer is still returned straight away; if `refresh` is given it is called
+        in the background and its result replaces the entry (stale-while-revalidate).
         """
-        gc.collect()
-        
-        # If using GPU/Torch, clear cache
-        if config.MODE == 'default':
+        found = self.query_cache.lookup(query, engine=engine)
+        if found is None:
+            return None
+        response, stale = found
+        if stale:
+            with self._refresh_lock:
+                self._refresh_stats["stale_served"] += 1
+            if refresh is not None:
+                self._revalidate(query, engine, refresh)
+        return response
+
+    def _revalidate(self, query, engine, refresh):
+        key = self.query_cache.key(query, engine)
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return # One refresh per key per process
+            self._refreshing.add(key)
+
+        def _run():
             try:
-                import torch
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-            except:
-                pass
+                with tracing.span("cache.refresh", engine=engine):
+                    fresh = refresh()
+                if fresh:
+                    self.cache_response(query, fresh, engine=engine)
+                    counter = "refreshes"
+                else:
+                    counter = "refresh_failures"
+            except Exception as e:
+                print(f"⚠️ Cache refresh failed for '{query[:40]}': {e}")
+                counter = "refresh_failures"
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+                self._refresh_stats[counter] += 1
+
+        def _release(future):
+            # Dropped from a full refresh queue: let the next stale hit try again
+            if future.cancelled():
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        self.submit("refresh", _run).add_done_callback(_release)
+
+    def coalesce(self, query, fn, engine='general', model=None, timeout=COALESCE_TIMEOUT, scope=None, api_key=None):
+        """
+        Runs fn() for this question unless the same one is already being answered,
+        in which case it waits for that answer instead. Returns fn()'s result.
+        `scope` (e.g. the chat, when the answer depends on its history) narrows who shares.
+        Calls made with a user's own `api_key` are only shared with calls using that same key.
+        """
+        key = (query_cache.normalize_query(query), engine, model, scope, fingerprint(api_key) if api_key else None)
+        with tracing.span("coalesce", engine=engine) as span:
+            result, shared = self.inflight.do(key, fn, timeout=timeout)
+            span.set(shared=shared)
+        return result
+
+    def get_coalescing_stats(self):
+        """Upstream calls made (leaders) and saved (followers) by request coalescing."""
+        return self.inflight.stats()
+
+    def get_cache_stats(self):
+        """Hit/miss/eviction counters and size of each cache tier, plus per-layer lookup hits and refreshes."""
+        with self._refresh_lock:
+            refresh = dict(self._refresh_stats, in_flight=len(self._refreshing))
+        stats = dict(self.response_cache.stats(), lookups=self.query_cache.stats(), revalidation=refresh)
+        stats.setdefault("disk", None) # None when the disk tier is off (VYOM_CACHE_DISK=0)
+        return stats
+
+    def optimize_memory(self, force=False):
+        """
+        Lets the memory governor decide whether a collection (or cache shrink) is due.
+        Cheap when it isn't, so it is safe to schedule after every request.
+        """
+        return self.memory.check(force=force)
+
+    def get_memory_stats(self):
+        """RSS, gc thresholds/counters and the governor's recent decisions."""
+        return self.memory.stats()
 
     def measure_performance(self, func):
-        """Decorator to measure how long a function takes."""
+        """Decorator to measure how long a function takes (recorded in vyom_function_seconds)."""
+        name = f"{func.__module__}.{func.__qualname__}"
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            start = time.time()
-            result = func(*args, **kwargs)
-            end = time.time()
-            # print(f"⏱️ {func.__name__} took {end - start:.4f}s")
-            return result
+            with metrics.FUNCTION_CALLS.time(function=name):
+                return func(*args, **kwargs)
         return wrapper
 
+    def _register_metrics(self):
+        """Exposes the numbers the optimizer already keeps as /metrics gauges and counters."""
+        registry = metrics.registry
+        depth = registry.gauge("vyom_background_queue_depth", "Tasks waiting per background queue", ("queue",))
+        executed = registry.counter("vyom_background_tasks_total", "Background tasks by queue and result", ("queue", "result"))
+        for queue in self.executor.stats()["queues"]: # Every queue added in __init__
+            depth.set_function(lambda q=queue: self.executor.depth(q), queue=queue)
+            for result in ("completed", "failed", "dropped", "inline"):
+                executed.set_function(lambda q=queue, r=result: self.executor.stats()["queues"][q][r], queue=queue, result=result)
+
+        lookups = registry.counter("vyom_cache_lookups_total", "Answer cache lookups by layer", ("result",))
+        for layer in ("exact_hits", "normalized_hits", "semantic_hits", "misses"):
+            lookups.set_function(lambda l=layer: self.query_cache.stats()[l], result=layer)
+        registry.counter("vyom_coalesced_calls_saved_total", "Upstream calls avoided by request coalescing").set_function(
+            lambda: self.inflight.stats()["calls_saved"])
+        registry.gauge("vyom_inflight_calls", "Distinct upstream calls in flight").set_function(self.inflight.in_flight)
+        registry.gauge("vyom_process_rss_bytes", "Resident memory of this worker").set_function(memory_governor.rss_bytes)
+        registry.counter("vyom_gc_governor_collections_total", "Collections triggered by the memory governor").set_function(
+            lambda: self.memory.stats()["collections"])
+
 # Global Instance
 performance = SystemOptimizer()
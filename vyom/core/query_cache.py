@@ -0,0 +1,271 @@
+"""
+VYOM QUERY CACHE
+Lookup front-end for the /ask response cache.
+
+Features:
+1. Canonical keys: "What is Python?", "what is python" and "what is  python ?" share one entry.
+2. Hinglish spelling variants (kya/kyaa, nahi/nhi, kaise/kese...) fold to one spelling.
+3. Optional similarity layer: a NumPy nearest-neighbour index over query embeddings
+   catches rephrasings the canonical key misses (off unless VYOM_SEMANTIC_CACHE=1).
+4. Per-layer hit counters, so hit rate can be measured by replaying a query log
+   (see benchmarks/cache_replay.py).
+5. Freshness classes (live / daily / static): each entry records when it goes stale,
+   separately from when the store drops it, so stale answers can be served while
+   they are refreshed.
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+# --- CANONICALIZATION ---
+
+# Variant -> canonical spelling. Only words that can't be confused with English ones.
+SPELLING_VARIANTS = {
+    "kya": ("kyaa", "kyah"),          # not "kia" (the car maker)
+    "hai": ("hae", "haii"),           # not "hay"
+    "kaise": ("kese", "kaisay", "kaisey", "kaese"),
+    "kyun": ("kyu", "kyon", "kyoon", "kiyon", "kyoun"),
+    "nahi": ("nahin", "nhi", "nai", "nahee"),
+    "kaun": ("kon", "koun", "kaon"),
+    "kahan": ("kaha", "kha", "kahaan"),
+    "batao": ("btao", "bataao", "bataoo", "bta"),
+    "accha": ("acha", "achha", "achcha"),
+    "theek": ("thik", "thek", "theekh"),
+    "mujhe": ("muje", "mujhey", "mujhko"),
+    "karo": ("kro", "karoo"),
+    "hoon": ("hu", "hoo"),            # not "hun"
+    "please": ("plz", "pls", "plzz", "plss"),
+    "what is": ("whats",),
+}
+_VARIANTS = {variant: canonical for canonical, variants in SPELLING_VARIANTS.items() for variant in variants}
+
+# Sentence punctuation carries no meaning for a cache key; math symbols do
+_PUNCTUATION = re.compile(r"[?!,;:\"'`“”‘’¡¿…]+|(?<!\d)\.|\.(?!\d)")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_query(query):
+    """Canonical form of a query: NFKC, casefolded, no sentence punctuation, single spaces, Hinglish folded."""
+    text = unicodedata.normalize("NFKC", str(query or "")).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    words = [_VARIANTS.get(w, w) for w in text.split()]
+    return " ".join(words)
+
+
+# --- FRESHNESS ---
+
+# class -> (seconds fresh, seconds kept). Between the two an entry is stale:
+# still served, but the caller should refresh it. None = never goes stale.
+FRESHNESS = {
+    "live": (60, 15 * 60),                   # scores, prices, weather
+    "daily": (3600, 24 * 3600),              # "today", "latest", rates
+    "static": (None, 7 * 24 * 3600),         # facts, code, explanations
+}
+LIVE_KEYWORDS = ('score', 'cricket', 'weather', 'stock', 'price', 'news', 'headlines', 'who won')
+DAILY_KEYWORDS = ('today', 'aaj', 'tonight', 'tomorrow', 'yesterday', 'this week', 'latest',
+                  'current', 'currently', 'trending', 'exchange rate', 'horoscope')
+_LIVE = re.compile(r"\b(" + "|".join(LIVE_KEYWORDS) + r")(s|es)?\b", re.IGNORECASE)
+_DAILY = re.compile(r"\b(" + "|".join(DAILY_KEYWORDS) + r")\b", re.IGNORECASE)
+
+
+def classify_freshness(query):
+    """'live', 'daily' or 'static' for a user query."""
+    text = str(query or "")
+    if _LIVE.search(text):
+        return "live"
+    if _DAILY.search(text):
+        return "daily"
+    return "static"
+
+
+# --- SIMILARITY LAYER ---
+
+# Tokens that change the answer however similar the rest of the query is
+_NEGATIONS = {"not", "no", "never", "nahi", "mat", "without"}
+
+
+def _guard_tokens(text):
+    words = _WORD.findall(text)
+    return frozenset(w for w in words if any(c.isdigit() for c in w) or w in _NEGATIONS)
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedding: hashed character n-grams, L2-normalised.
+    Catches typos and word-order changes, not true paraphrases; pass a real
+    embedding function (e.g. OllamaEmbeddings.embed_query) for that.
+    """
+
+    def __init__(self, dim=512, ngram=3):
+        self.dim = dim
+        self.ngram = ngram
+
+    def __call__(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.split():
+            padded = f" {word} "
+            for i in range(max(1, len(padded) - self.ngram + 1)):
+                # crc32, not hash(): str hashes are salted per process
+                vec[zlib.crc32(padded[i:i + self.ngram].encode('utf-8')) % self.dim] += 1.0
+        return vec
+
+
+class SemanticIndex:
+    """
+    Fixed-capacity ring of unit vectors; lookup is one matrix-vector product.
+    Once full, the oldest query is overwritten.
+    """
+
+    def __init__(self, embed_fn, threshold=0.9, capacity=5000):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._keys = [None] * capacity
+        self._guards = [None] * capacity
+        self._slots = {}  # key -> slot
+        self._next = 0
+        self._size = 0
+
+    def _embed(self, text):
+        vec = np.asarray(self.embed_fn(text), dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else None
+
+    def add(self, key, text):
+        vec = self._embed(text)
+        if vec is None:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._next
+                self._next = (self._next + 1) % self.capacity
+                self._size = min(self._size + 1, self.capacity)
+                old = self._keys[slot]
+                if old is not None:
+                    self._slots.pop(old, None)
+            self._vectors[slot] = vec
+            self._keys[slot] = key
+            self._guards[slot] = _guard_tokens(text)
+            self._slots[key] = slot
+
+    def remove(self, key):
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is not None:
+                self._vectors[slot] = 0.0
+                self._keys[slot] = None
+
+    def nearest(self, text, prefix=""):
+        """Best stored key starting with `prefix` whose cosine similarity clears the threshold, else None."""
+        if self._vectors is None:
+            return None
+        vec = self._embed(text)
+        if vec is None:
+            return None
+        guards = _guard_tokens(text)
+        with self._lock:
+            scores = self._vectors[:self._size] @ vec
+            # Best few candidates, best first; usually the first one decides
+            top = np.argpartition(scores, -8)[-8:] if len(scores) > 8 else np.arange(len(scores))
+            for slot in top[np.argsort(scores[top])[::-1]]:
+                if scores[slot] < self.threshold:
+                    break
+                key = self._keys[slot]
+                if key is not None and key.startswith(prefix) and self._guards[slot] == guards:
+                    return key
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._slots)
+
+
+# --- FRONT-END ---
+
+class QueryCache:
+    """Canonical-key (and optionally similarity) lookups in front of a ResponseCache."""
+
+    def __init__(self, store, semantic=None):
+        self.store = store
+        self.semantic = semantic
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "normalized_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(query, engine='general'):
+        return f"{engine}:{normalize_query(query)}"
+
+    def get(self, query, engine='general'):
+        found = self.lookup(query, engine)
+        return found[0] if found else None
+
+    def lookup(self, query, engine='general'):
+        """Returns (response, stale) or None. Stale entries are still valid, just due a refresh."""
+        canonical = normalize_query(query)
+        key = f"{engine}:{canonical}"
+        entry = self.store.get(key)
+        layer = None
+        if entry is not None:
+            layer = "exact_hits" if entry[0] == query else "normalized_hits"
+        # Time-sensitive questions only ever match their own wording
+        elif self.semantic is not None and canonical and classify_freshness(canonical) == "static":
+            similar = self.semantic.nearest(canonical, prefix=f"{engine}:")
+            if similar is not None:
+                entry = self.store.get(similar)
+                if entry is None:
+                    self.semantic.remove(similar) # Expired or evicted underneath us
+                else:
+                    layer = "semantic_hits"
+        with self._lock:
+            self._stats[layer or "misses"] += 1
+        if entry is None:
+            return None
+        fresh_until = entry[2] if len(entry) > 2 else None
+        return entry[1], fresh_until is not None and time.time() >= fresh_until
+
+    def set(self, query, response, engine='general', ttl=None, fresh_for=None):
+        """Caches for `ttl` seconds; after `fresh_for` seconds (None = never) lookups report it stale."""
+        canonical = normalize_query(query)
+        key = f"{engine}:{canonical}"
+        # Keep the original wording so stats can tell exact from normalized hits.
+        # Wall-clock expiry so every worker sharing the disk tier agrees on it.
+        fresh_until = time.time() + fresh_for if fresh_for is not None else None
+        stored = self.store.set(key, (query, response, fresh_until), ttl=ttl)
+        if stored and self.semantic is not None and canonical:
+            self.semantic.add(key, canonical)
+        return stored
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        hits = lookups - stats["misses"]
+        stats["lookups"] = lookups
+        stats["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        if self.semantic is not None:
+            stats["semantic_entries"] = len(self.semantic)
+        return stats
+
+
+def from_env(store):
+    """QueryCache configured from VYOM_SEMANTIC_CACHE / VYOM_SEMANTIC_THRESHOLD."""
+    semantic = None
+    if os.getenv("VYOM_SEMANTIC_CACHE", "0") == "1":
+        threshold = float(os.getenv("VYOM_SEMANTIC_THRESHOLD", "0.9"))
+        semantic = SemanticIndex(HashingEmbedder(), threshold=threshold)
+        # A shared disk tier outlives this process: index what it already holds
+        if hasattr(store, "recent_keys"):
+            for key in store.recent_keys(semantic.capacity):
+                semantic.add(key, key.split(":", 1)[1])
+    return QueryCache(store, semantic=semantic)
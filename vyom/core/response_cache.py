@@ -0,0 +1,132 @@
+"""
+VYOM RESPONSE CACHE
+In-process cache for finished /ask answers.
+
+Features:
+1. LRU eviction against a byte budget (a long essay costs more than "Hi!").
+2. Per-entry TTL, so live answers can expire in minutes and static ones in hours.
+3. One lock around every operation: safe from Flask and background threads.
+4. Hit/miss/eviction/expiry counters via `stats()`.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from cachetools import TLRUCache
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024 # 32 MB of answer text
+DEFAULT_TTL = 6 * 3600               # Seconds an answer stays valid unless told otherwise
+ENTRY_OVERHEAD = 200                 # Rough per-entry bookkeeping (dict slot, tuple, floats)
+
+_Entry = namedtuple("_Entry", "value ttl size")
+
+
+def _text_size(value):
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(_text_size(v) for v in value)
+    return len(str(value).encode('utf-8'))
+
+
+class _Store(TLRUCache):
+    """TLRUCache that reports what it throws away."""
+
+    def __init__(self, maxsize, on_evict, on_expire):
+        super().__init__(
+            maxsize=maxsize,
+            ttu=lambda key, entry, now: now + entry.ttl,
+            timer=time.monotonic,
+            getsizeof=lambda entry: entry.size,
+        )
+        self._on_evict = on_evict
+        self._on_expire = on_expire
+
+    def popitem(self):
+        # Only called by cachetools to make room, i.e. a budget eviction
+        key, entry = super().popitem()
+        self._on_evict(entry)
+        return key, entry
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, entry in expired:
+            self._on_expire(entry)
+        return expired
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, default_ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+        self._store = _Store(max_bytes, self._count("evictions"), self._count("expirations"))
+
+    def _count(self, name):
+        def bump(entry):
+            self._stats[name] += 1
+        return bump
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            self._stats["hits"] += 1
+            return entry.value
+
+    def set(self, key, value, ttl=None):
+        """Stores `value` for `ttl` seconds (default_ttl when None). Returns False if it can't fit."""
+        ttl = self.default_ttl if ttl is None else ttl
+        size = _text_size(value) + _text_size(key) + ENTRY_OVERHEAD
+        with self._lock:
+            if ttl <= 0 or size > self.max_bytes:
+                self._stats["rejected"] += 1
+                self._store.pop(key, None)
+                return False
+            self._store[key] = _Entry(value, ttl, size)
+            self._stats["sets"] += 1
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._store.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+
+    def shrink(self, fraction=0.5):
+        """Evicts least recently used entries until at most `fraction` of the current bytes remain. Returns entries dropped."""
+        with self._lock:
+            self._store.expire()
+            target = self._store.currsize * fraction
+            dropped = 0
+            while self._store and self._store.currsize > target:
+                self._store.popitem()
+                dropped += 1
+            return dropped
+
+    def __len__(self):
+        with self._lock:
+            return len(self._store)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._store
+
+    def stats(self):
+        with self._lock:
+            self._store.expire()
+            stats = dict(
+                self._stats,
+                entries=len(self._store),
+                bytes=self._store.currsize,
+                max_bytes=self.max_bytes,
+            )
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,74 @@
+"""
+VYOM SINGLE FLIGHT
+Coalesces identical calls that are in flight at the same time.
+
+Features:
+1. The first caller for a key (the leader) runs the call; concurrent callers wait for its result.
+2. Followers give up waiting after a timeout and make their own call instead.
+3. A failure is shared too, so a failing upstream isn't hit once per waiting request.
+4. Counters for calls made vs. calls saved.
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "followers": 0, "timeouts": 0, "shared_errors": 0}
+
+    def do(self, key, fn, timeout=None):
+        """
+        Runs fn() once for every caller that arrives with `key` while it is running.
+        Returns (result, shared) where shared is True for followers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+            return call.result, False
+
+        if not call.done.wait(timeout):
+            # The leader is taking too long: stop waiting and pay for our own call
+            with self._lock:
+                self._stats["timeouts"] += 1
+            return fn(), False
+        with self._lock:
+            self._stats["shared_errors" if call.error is not None else "followers"] += 1
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, in_flight=len(self._calls))
+        # Every follower is an upstream call that didn't happen
+        stats["calls_saved"] = stats["followers"] + stats["shared_errors"]
+        return stats
@@ -0,0 +1,196 @@
+"""
+VYOM HISTORY STORAGE
+Where chat data lives on disk: one SQLite file, or N shard files keyed by user.
+
+Features:
+1. Each user (device_id) hashes to one shard, so a request only touches that file.
+2. Writers for different users no longer queue on the same SQLite write lock.
+3. `reshard()` copies an existing layout into a new shard count.
+
+With one shard the layout is exactly the old single `ai_database.db`.
+"""
+
+import os
+import sqlite3
+import time
+import zlib
+
+from vyom.core import archive
+from vyom.core import database
+from vyom.core import migrations
+
+
+def shard_files(db_file, shards):
+    """
+    The database files for a layout: the plain file for one shard, `name.shard<i>of<n>.db` otherwise.
+    The shard count is part of the name so two layouts can sit side by side while resharding.
+    """
+    if shards <= 1:
+        return [db_file]
+    base, ext = os.path.splitext(db_file)
+    return [f"{base}.shard{i}of{shards}{ext}" for i in range(shards)]
+
+
+def shard_index(key, shards):
+    # crc32 is stable across processes and Python versions (unlike hash())
+    if shards <= 1 or not key:
+        return 0
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+class ShardedSQLiteStorage:
+    """Routes each user's rows to one of `shards` SQLite files, each with its own connection pool."""
+
+    def __init__(self, db_file, shards=1):
+        self.db_file = db_file
+        self.shards = max(1, int(shards))
+        self.files = shard_files(db_file, self.shards)
+
+    def shard_for(self, key):
+        return shard_index(key, self.shards)
+
+    def connection(self, key=None):
+        """Pooled connection to the shard that owns `key` (shard 0 when None)."""
+        return database.get_pool(self.files[self.shard_for(key)]).connection()
+
+    def shard_connection(self, index):
+        return database.get_pool(self.files[index]).connection()
+
+    def all_connections(self):
+        """Yields a connection context manager per shard, in shard order."""
+        for index in range(self.shards):
+            yield self.shard_connection(index)
+
+    def initialize(self):
+        """Brings every shard up to the latest schema."""
+        for index in range(self.shards):
+            with self.shard_connection(index) as conn:
+                migrations.apply_migrations(conn)
+
+
+def _copy_rows(src, dst, table, where, params):
+    cursor = src.execute(f"SELECT * FROM {table} WHERE {where}", params)
+    columns = [d[0] for d in cursor.description]
+    placeholders = ", ".join("?" * len(columns))
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        dst.executemany(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+            [tuple(r) for r in rows]
+        )
+
+
+def _copy_user(src, dst, device_id):
+    """
+    Copies one user's rows between open connections (caller commits dst).
+    Message ids are per-file AUTOINCREMENT values, so messages get fresh ids in the
+    destination (inserted in their original order) and archived chats are unpacked
+    on the way; the archiver will re-compress them later if they stay idle.
+    Anything already copied for this user is replaced, so a rerun never duplicates.
+    """
+    dst.execute("DELETE FROM chats WHERE user_id = ?", (device_id,))
+    _copy_rows(src, dst, "users", "device_id = ?", (device_id,))
+    _copy_rows(src, dst, "chats", "user_id = ?", (device_id,))
+
+    cursor = src.execute(
+        "SELECT m.chat_id, m.role, m.content, m.timestamp FROM messages m "
+        "WHERE m.chat_id IN (SELECT id FROM chats WHERE user_id = ?) ORDER BY m.timestamp, m.id",
+        (device_id,)
+    )
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        dst.executemany(
+            "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            [tuple(r) for r in rows]
+        )
+
+    archived = src.execute(
+        "SELECT chat_id, codec, data FROM chat_archives WHERE chat_id IN (SELECT id FROM chats WHERE user_id = ?)",
+        (device_id,)
+    )
+    for row in archived:
+        dst.executemany(
+            "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            [(row[0], m[1], m[2], m[3]) for m in archive.unpack(row[2], row[1])]
+        )
+    dst.execute("UPDATE chats SET archived_at = NULL WHERE user_id = ?", (device_id,))
+
+
+def _copy_devices(src, target):
+    """Device -> account rows live in the device's shard, not the account's."""
+    cursor = src.execute("SELECT device_id, account_id, linked_at FROM devices")
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(target.shard_for(row[0]), []).append(tuple(row))
+        for index, shard_rows in by_shard.items():
+            with target.shard_connection(index) as dst:
+                dst.executemany("INSERT OR REPLACE INTO devices (device_id, account_id, linked_at) VALUES (?, ?, ?)", shard_rows)
+                dst.commit()
+
+
+def move_user(storage, device_id, new_key):
+    """
+    Moves the account `device_id` (profile, chats, messages) into the shard for `new_key`
+    (no-op if it's the same shard). Rows in `devices` stay where they are.
+    The copy commits before the source rows are deleted, so a crash in between leaves a
+    duplicate rather than losing data; rerunning finishes the move.
+    """
+    src_index, dst_index = storage.shard_for(device_id), storage.shard_for(new_key)
+    if src_index == dst_index:
+        return False
+    with storage.shard_connection(src_index) as src, storage.shard_connection(dst_index) as dst:
+        _copy_user(src, dst, device_id)
+        dst.commit()
+        src.execute("DELETE FROM users WHERE device_id = ?", (device_id,))
+        src.execute("DELETE FROM chats WHERE user_id = ?", (device_id,))  # cascades to messages/archives
+        src.commit()
+    return True
+
+
+def reshard(db_file, old_shards, new_shards, batch_users=200):
+    """
+    Copies a layout of `old_shards` files into `new_shards` files next to it.
+    The source files are left untouched; point VYOM_DB_SHARDS at the new count once it finishes.
+    Returns {"users": n, "seconds": t}.
+    """
+    old_files = shard_files(db_file, old_shards)
+    new_files = shard_files(db_file, new_shards)
+    if set(old_files) & set(new_files):
+        raise ValueError("Old and new layouts share files; reshard between different shard counts")
+    for path in new_files:
+        if os.path.exists(path):
+            raise FileExistsError(f"{path} already exists")
+
+    target = ShardedSQLiteStorage(db_file, new_shards)
+    target.initialize()
+    start = time.perf_counter()
+    moved = 0
+    for path in old_files:
+        src = sqlite3.connect(path)
+        src.row_factory = sqlite3.Row
+        try:
+            users = src.execute("SELECT device_id FROM users")
+            while True:
+                batch = [r[0] for r in users.fetchmany(batch_users)]
+                if not batch:
+                    break
+                for device_id in batch:
+                    with target.connection(device_id) as dst:
+                        _copy_user(src, dst, device_id)
+                        dst.commit()
+                moved += len(batch)
+                print(f"   ...{moved} users copied")
+            _copy_devices(src, target)
+        finally:
+            src.close()
+    elapsed = time.perf_counter() - start
+    print(f"✅ Resharded {moved} users from {old_shards} to {new_shards} shards in {elapsed:.1f}s")
+    return {"users": moved, "seconds": elapsed}
@@ -0,0 +1,296 @@
+"""
+VYOM TRACING
+Request-scoped spans, so a slow /ask can be broken down into where the time went.
+
+Features:
+1. One trace per HTTP request (id generated here and echoed in X-Trace-Id), carried in a
+   ContextVar: nested `span()` blocks become children automatically.
+2. `current()` captures the trace context so work handed to another thread (background
+   executor, history writer, voice queue) is recorded under the request that queued it.
+3. Finished spans go to a rotating JSONL file and to a small in-memory buffer of recent traces.
+4. `get_trace()` + `waterfall()` back the /debug/trace/<id> view. Lookups that miss the
+   in-memory buffer read at most VYOM_TRACE_SCAN_MB of the files (newest first), and misses
+   are remembered for a minute, so unknown ids can't keep the disk busy.
+
+Spans carry timings and small attributes (engine, model, sizes), never message text.
+Configured with VYOM_TRACE (0 disables), VYOM_TRACE_FILE, VYOM_TRACE_MAX_MB, VYOM_TRACE_KEEP
+and VYOM_TRACE_SCAN_MB.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+from cachetools import TTLCache
+
+SpanContext = namedtuple("SpanContext", "trace_id span_id")
+
+_TRACE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_current = ContextVar("vyom_trace", default=None)
+
+
+def is_trace_id(value):
+    """True if `value` is shaped like a trace id (safe to look up)."""
+    return bool(value) and bool(_TRACE_ID.match(value))
+
+
+def _new_id():
+    return uuid.uuid4().hex[:16]
+
+
+class _Config:
+    def __init__(self):
+        self.enabled = os.getenv("VYOM_TRACE", "1") != "0"
+        self.path = os.getenv("VYOM_TRACE_FILE", os.path.join(os.getcwd(), "logs", "traces.jsonl"))
+        self.max_bytes = int(float(os.getenv("VYOM_TRACE_MAX_MB", "10")) * 1024 * 1024)
+        self.backups = 3
+        self.keep = int(os.getenv("VYOM_TRACE_KEEP", "500")) # Recent traces held in memory
+        self.scan_bytes = int(float(os.getenv("VYOM_TRACE_SCAN_MB", "16")) * 1024 * 1024) # File bytes read per lookup
+        self.logger = None
+
+
+_config = _Config()
+_lock = threading.Lock()
+_recent = OrderedDict()  # trace_id -> [span dicts]
+_misses = TTLCache(maxsize=1024, ttl=60)  # trace ids the files didn't have
+
+
+def configure(enabled=None, path=None, max_bytes=None, keep=None):
+    """Overrides the environment settings (used by tests and tools)."""
+    global _config
+    with _lock:
+        old = _config
+        _config = _Config()
+        for name, value in (("enabled", enabled), ("path", path), ("max_bytes", max_bytes), ("keep", keep)):
+            if value is not None:
+                setattr(_config, name, value)
+        _recent.clear()
+        _misses.clear()
+    if old.logger is not None:
+        for handler in list(old.logger.handlers):
+            old.logger.removeHandler(handler)
+            handler.close()
+
+
+def _logger():
+    cfg = _config
+    if cfg.logger is None:
+        with _lock:
+            if cfg.logger is None:
+                logger = logging.getLogger(f"vyom.trace.{id(cfg)}")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                try:
+                    os.makedirs(os.path.dirname(cfg.path) or ".", exist_ok=True)
+                    handler = RotatingFileHandler(cfg.path, maxBytes=cfg.max_bytes, backupCount=cfg.backups, encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger.addHandler(handler)
+                except OSError as e:
+                    print(f"⚠️ Trace file unavailable ({e}), keeping traces in memory only.")
+                cfg.logger = logger
+    return cfg.logger
+
+
+def _emit(span):
+    cfg = _config
+    with _lock:
+        spans = _recent.get(span["trace_id"])
+        if spans is None:
+            spans = _recent[span["trace_id"]] = []
+            while len(_recent) > cfg.keep:
+                _recent.popitem(last=False)
+        spans.append(span)
+    _logger().info(json.dumps(span, ensure_ascii=False, default=str))
+
+
+class Span:
+    def __init__(self, name, parent=None, trace_id=None, attrs=None):
+        self.name = name
+        self.trace_id = trace_id or (parent.trace_id if parent else _new_id())
+        self.span_id = _new_id()
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = dict(attrs or {})
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = None
+        self.finished = False
+
+    @property
+    def context(self):
+        return SpanContext(self.trace_id, self.span_id)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def activate(self):
+        """Makes this span the parent of spans opened in the current context."""
+        self._token = _current.set(self.context)
+        return self
+
+    def finish(self, error=None):
+        if self.finished:
+            return
+        self.finished = True
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                _current.set(None) # Finished from a different context
+        _emit({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "status": "error" if error is not None else "ok",
+            "error": str(error)[:200] if error is not None else None,
+            "thread": threading.current_thread().name,
+            "attrs": self.attrs,
+        })
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def current():
+    """The active SpanContext (to hand to another thread), or None outside a trace."""
+    return _current.get()
+
+
+def current_trace_id():
+    ctx = _current.get()
+    return ctx.trace_id if ctx else None
+
+
+def start_trace(name, trace_id=None, **attrs):
+    """Starts and activates a root span. The caller must call `.finish()` on it."""
+    if not _config.enabled:
+        return None
+    if not is_trace_id(trace_id):
+        trace_id = None
+    return Span(name, trace_id=trace_id, attrs=attrs).activate()
+
+
+@contextmanager
+def linked(parent, name, **attrs):
+    """A span under `parent` (a SpanContext from `current()`), e.g. in a worker thread. No-op if parent is None."""
+    if parent is None or not _config.enabled:
+        yield _NOOP
+        return
+    span = Span(name, parent=parent, attrs=attrs).activate()
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(error=e)
+        raise
+    span.finish()
+
+
+def span(name, **attrs):
+    """A child of the current span. Outside a trace it does nothing."""
+    return linked(_current.get(), name, **attrs)
+
+
+def record(parent, name, start, duration_ms, **attrs):
+    """Emits an already-finished span under `parent` (for work that covered several traces at once)."""
+    if parent is None or not _config.enabled:
+        return
+    _emit({
+        "trace_id": parent.trace_id,
+        "span_id": _new_id(),
+        "parent_id": parent.span_id,
+        "name": name,
+        "start": round(start, 6),
+        "duration_ms": round(duration_ms, 3),
+        "status": "ok",
+        "error": None,
+        "thread": threading.current_thread().name,
+        "attrs": attrs,
+    })
+
+
+# --- LOOKUP & WATERFALL ---
+
+def get_trace(trace_id):
+    """
+    Every recorded span of a trace, oldest first. Falls back to the JSONL files (other workers,
+    older traces), reading at most `scan_bytes` of them. Unknown or malformed ids give [].
+    """
+    if not is_trace_id(trace_id):
+        return []
+    with _lock:
+        spans = list(_recent.get(trace_id, ()))
+        missed = trace_id in _misses
+    if not spans and not missed:
+        spans = _read_from_files(trace_id)
+        if not spans:
+            with _lock:
+                _misses[trace_id] = True
+    return sorted(spans, key=lambda s: s["start"])
+
+
+def _read_from_files(trace_id):
+    needle = f'"trace_id": "{trace_id}"'
+    spans = []
+    budget = _config.scan_bytes
+    # Newest file first; a trace's spans are written within seconds of each other
+    paths = [_config.path] + [f"{_config.path}.{i}" for i in range(1, _config.backups + 1)]
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    budget -= len(line)
+                    if budget < 0:
+                        return spans
+                    if needle in line:
+                        try:
+                            spans.append(json.loads(line))
+                        except ValueError:
+                            pass
+        except OSError:
+            continue
+        if spans:
+            break
+    return spans
+
+
+def waterfall(spans):
+    """Rows for the waterfall view: each span with its depth and its offset/width as % of the trace."""
+    if not spans:
+        return []
+    t0 = min(s["start"] for s in spans)
+    total = max(s["start"] + s["duration_ms"] / 1000 for s in spans) - t0 or 1e-9
+    children = {}
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+
+    rows = []
+    def walk(parent, depth):
+        for s in sorted(children.get(parent, ()), key=lambda s: s["start"]):
+            offset = s["start"] - t0
+            rows.append(dict(
+                s,
+                depth=depth,
+                offset_ms=round(offset * 1000, 2),
+                offset_pct=round(offset / total * 100, 2),
+                width_pct=max(round(s["duration_ms"] / 1000 / total * 100, 2), 0.3),
+            ))
+            walk(s["span_id"], depth + 1)
+    walk(None, 0)
+    return rows
@@ -12,7 +12,9 @@ import os
 import time
 from vyom import config
 from dotenv import load_dotenv
-from google import genai  # NEW SDK
+from vyom.core.client_pool import gemini_checkout # Shared google-genai clients
+from vyom.core.key_scheduler import gemini_scheduler # Key x model health
+from vyom.core.hedging import llm_hedger # Hedged calls (opt-in)
 
 # Load env variables (API Keys)
 load_dotenv(override=True)
@@ -53,7 +55,6 @@ class DeepThoughtEngine:
         self.is_ready = False
         self.engine_type = "unknown"
         self.api_keys = []
-        self.current_key_index = 0
         
         # Always init search as backup
         self._init_light()
@@ -86,17 +87,6 @@ class DeepThoughtEngine:
             logger.error(f"Failed to initialize engine: {e}")
             self.is_ready = False
 
-    def _get_active_key(self):
-        """Returns the current active key."""
-        if not self.api_keys: return None
-        return self.api_keys[self.current_key_index % len(self.api_keys)]
-
-    def _rotate_key(self):
-        """Switches to the next available key."""
-        if not self.api_keys: return
-        self.current_key_index += 1
-        logger.info(f"🔄 Switching to API Key #{self.current_key_index % len(self.api_keys) + 1}...")
-
     def _init_heavy(self):
         """Initialize Ollama (Local Heavy)."""
         try:
@@ -132,27 +122,15 @@ class DeepThoughtEngine:
         # --- 1. TRY GEMINI (Cloud Brain) ---
         if self.engine_type == "gemini" or user_api_key:
             
-            # If user provided a specific key, try ONLY that key
-            if user_api_key:
-                for model_id in FALLBACK_MODELS:
-                    final_response, gemini_success = self._try_gemini(query, user_api_key, model_id)
-                    if gemini_success: break
-            else:
-                # Otherwise, try our pool of system keys (Rotation)
-                for _ in range(len(self.api_keys)):
-                    key = self._get_active_key()
-                    for model_id in FALLBACK_MODELS:
-                        response, success = self._try_gemini(query, key, model_id)
-                        if success:
-                            final_response = response
-                            gemini_success = True
-                            break
-                    
-                    if gemini_success:
-                        break
-                    
-                    # If all models failed for this key, rotate and try next key
-                    self._rotate_key()
+            # If user provided a specific key, try ONLY that key;
+            # otherwise our pool of system keys, healthiest key x model first
+            # (slow attempts are raced against the next one when VYOM_HEDGE=1)
+            keys = [user_api_key] if user_api_key else self.api_keys
+            final_response = llm_hedger.run(
+                (model_id, lambda k=key, m=model_id, n=attempt: self._try_gemini(query, k, m, n)[0])
+                for attempt, (key, model_id) in enumerate(gemini_scheduler.plan(keys, FALLBACK_MODELS), start=1)
+            )
+            gemini_success = bool(final_response)
             
             if gemini_success:
                 return final_response, True
@@ -198,30 +176,32 @@ class DeepThoughtEngine:
         
         return "System limits reached. Please wait 60 seconds.", False
 
-    def _try_gemini(self, query, key, model_id):
-        """Helper to try a specific key and model using the NEW Google Gen AI SDK."""
+    def _try_gemini(self, query, key, model_id, attempt=1):
+        """Helper to try a specific key and model using the NEW Google Gen AI SDK (outcome reported to the scheduler)."""
+        started = time.perf_counter()
         try:
-            # Initialize Client
-            client = genai.Client(api_key=key)
-            
             # System Prompt with Automation Instructions
             from vyom.core import formatter
             system_instruction = formatter.get_system_instruction("general")
             
-            # Generate Content
-            response = client.models.generate_content(
-                model=model_id,
-                contents=query,
-                config={'system_instruction': system_instruction}
-            )
+            # Generate Content on the shared client for this key (system keys stay pooled, BYOK ones expire when idle)
+            with gemini_checkout(key, pinned=key in self.api_keys) as client:
+                response = client.models.generate_content(
+                    model=model_id,
+                    contents=query,
+                    config={'system_instruction': system_instruction}
+                )
             if response and response.text:
+                gemini_scheduler.record_success(key, model_id, time.perf_counter() - started, attempt=attempt)
                 return response.text, True
+            gemini_scheduler.record_failure(key, model_id, "empty response", system=key in self.api_keys)
             return None, False
             
         except Exception as e:
-            if "429" in str(e):
+            kind = gemini_scheduler.record_failure(key, model_id, e, system=key in self.api_keys)
+            if kind == "quota":
                 logger.warning(f"Model {model_id} failed (Quota): {e}")
-            elif "404" in str(e):
+            elif kind == "not_found":
                 logger.warning(f"Model {model_id} not found: {e}")
             else:
                 logger.error(f"Gemini SDK Error with {model_id}: {e}")
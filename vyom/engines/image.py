@@ -11,6 +11,7 @@ try:
     from google import genai
     from google.genai import types
     from dotenv import load_dotenv
+    from vyom.core.client_pool import gemini_client
     load_dotenv()
     HAS_GENAI = True
 except ImportError:
@@ -66,7 +67,7 @@ def generate(prompt, style="realistic", negative_prompt="", width=1024, height=7
         if api_key:
             try:
                 print(f"🎨 Generating with Google Imagen 3: {clean_prompt}...")
-                client = genai.Client(api_key=api_key)
+                client = gemini_client(api_key, pinned=True)
                 
                 response = client.models.generate_images(
                     model='imagen-3.0-generate-001',
@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 from langchain_community.vectorstores import Chroma
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain_community.llms import Ollama
-from google import genai
+from vyom.core.client_pool import gemini_client
 
 # Load env vars for Cloud support
 load_dotenv()
@@ -58,7 +58,7 @@ class TarkshaktiEngine:
             api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
             if api_key:
                 try:
-                    self.cloud_client = genai.Client(api_key=api_key)
+                    self.cloud_client = gemini_client(api_key, pinned=True)
                     self.use_cloud = True
                     logger.info("💎 Cloud Brain (Gemini) linked for Ultra Synthesis.")
                 except Exception as e:
@@ -1,9 +1,15 @@
 import os
-from google import genai
+import time
+import functools
 from google.genai import types
 from dotenv import load_dotenv
 from vyom.core import internet # Fallback ke liye
 from vyom.core import formatter # 🎨 New Formatter
+from vyom.core.metrics import LLM_CALLS, bounded # 📊 Per-model latency
+from vyom.core import tracing # 🔍 Per-attempt spans
+from vyom.core.client_pool import gemini_checkout # ♻️ One long-lived client per key
+from vyom.core.key_scheduler import gemini_scheduler, fingerprint # 🩺 Key x model health
+from vyom.core.hedging import llm_hedger # 🏁 Race a slow model against the next one (opt-in)
 
 # Load environment variables
 
@@ -17,10 +23,6 @@ keys_str = os.getenv("GOOGLE_API_KEYS") or os.getenv("GEMINI_API_KEY")
 
 api_keys = [k.strip() for k in keys_str.split(',') if k.strip()] if keys_str else []
 
-current_key_index = 0
-
-
-
 # Fallback models with full path
 
 FALLBACK_MODELS = [
@@ -37,32 +39,161 @@ FALLBACK_MODELS = [
 
 
 
-def get_active_key():
-
-    global current_key_index
-
-    if not api_keys: return None
-
-    return api_keys[current_key_index % len(api_keys)]
-
-
+def _generate_scheduled(keys, models, contents, system_instruction, key_type):
+    """
+    Tries key x model pairs in the scheduler's order (healthiest first, cooling/404 pairs skipped),
+    hedging slow ones when VYOM_HEDGE=1. Returns the answer text or None.
+    """
+    pairs = gemini_scheduler.plan(keys, models)
+    return llm_hedger.run(
+        (model_id, functools.partial(_generate_once, key, model_id, attempt, contents, system_instruction, key_type))
+        for attempt, (key, model_id) in enumerate(pairs, start=1)
+    )
 
-def rotate_key():
-
-    global current_key_index
-
-    if not api_keys: return
-
-    current_key_index += 1
-
-    print(f"🔄 Trinity: Switching to API Key #{current_key_index % len(api_keys) + 1}...")
 
+def _generate_once(key, model_id, attempt, contents, system_instruction, key_type):
+    """One generate_content call; the outcome is reported to the scheduler. Returns the text or None."""
+    started = time.perf_counter()
+    try:
+        with gemini_checkout(key, pinned=key_type == "system") as client, \
+                LLM_CALLS.time(model=bounded(model_id, FALLBACK_MODELS), key=key_type), \
+                tracing.span("gemini.generate", model=model_id, key=fingerprint(key), attempt=attempt):
+            response = client.models.generate_content(
+                model=model_id,
+                contents=contents,
+                config=types.GenerateContentConfig(
+                    system_instruction=system_instruction,
+                    temperature=0.7
+                )
+            )
+    except Exception as e:
+        kind = gemini_scheduler.record_failure(key, model_id, e, system=key_type == "system")
+        print(f"⚠️ Trinity: {model_id} on {fingerprint(key)} failed ({kind}): {e}")
+        return None
+    if response and response.text:
+        gemini_scheduler.record_success(key, model_id, time.perf_counter() - started, attempt=attempt)
+        return response.text
+    gemini_scheduler.record_failure(key, model_id, "empty response", system=key_type == "system")
+    return None
+
+
+
+class StreamInterrupted(Exception):
+    """The model failed after part of a streamed answer was already sent."""
+
+
+def stream_response(prompt, engine_type="general", history=[], user_api_key=None, model=None, summary=None):
+    """
+    Like generate_response, but yields the answer in chunks as Gemini produces them
+    (generate_content_stream). A key/model that fails before its first chunk falls through
+    to the next pair; once text has been sent there is no taking it back, so a failure
+    mid-answer raises StreamInterrupted and the caller decides what to tell the user.
+    Not hedged or coalesced.
+    """
+    models_to_try = [model] if model else FALLBACK_MODELS
+    keys, key_type = ([user_api_key], "user") if user_api_key else (api_keys, "system")
+    if not keys:
+        yield "⚠️ System API Keys missing. Please configure .env file."
+        return
+
+    contents = _conversation(history, [prompt])
+    system_instruction = _instruction(engine_type, summary)
+    parent = tracing.current()
+    for attempt, (key, model_id) in enumerate(gemini_scheduler.plan(keys, models_to_try), start=1):
+        started, start_wall = time.perf_counter(), time.time()
+        first_chunk = None
+        error = None
+        try:
+            # Checked out for the whole stream: eviction mid-answer must not close it
+            with gemini_checkout(key, pinned=key_type == "system") as client:
+                stream = client.models.generate_content_stream(
+                    model=model_id,
+                    contents=contents,
+                    config=types.GenerateContentConfig(
+                        system_instruction=system_instruction,
+                        temperature=0.7
+                    )
+                )
+                for chunk in stream:
+                    text = chunk.text
+                    if text:
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter() - started
+                        yield text
+        except Exception as e:
+            error = e
+
+        # Recorded after the fact: a span left open across yields would leak into the caller
+        elapsed = time.perf_counter() - started
+        LLM_CALLS.observe(elapsed, model=bounded(model_id, FALLBACK_MODELS), key=key_type, status="error" if error else "ok")
+        tracing.record(parent, "gemini.stream", start_wall, elapsed * 1000, model=model_id, key=fingerprint(key),
+                       attempt=attempt, first_chunk_ms=round(first_chunk * 1000, 1) if first_chunk is not None else None,
+                       error=str(error)[:200] if error else None)
+
+        if error is None and first_chunk is not None:
+            gemini_scheduler.record_success(key, model_id, elapsed, attempt=attempt)
+            return
+        kind = gemini_scheduler.record_failure(key, model_id, error or "empty response", system=key_type == "system")
+        print(f"⚠️ Trinity: {model_id} stream on {fingerprint(key)} failed ({kind}): {error}")
+        if first_chunk is not None:
+            raise StreamInterrupted(f"{model_id} stream failed mid-answer ({kind})") from error
+
+    if user_api_key:
+        yield "⚠️ Your personal API key failed. Please check it in settings."
+        return
+    print("🌍 All AI models and keys failed. Using Web Search Fallback...")
+    search_data = internet.search_google(prompt)
+    if search_data:
+        yield f"⚠️ **AI Engines Busy (Rate Limits).** But I found this on the web:\n\n{search_data}"
+    else:
+        yield "⚠️ System is temporarily overloaded. Please try again in a moment."
 
 
 def get_system_instruction(engine_type):
     return formatter.get_system_instruction(engine_type)
 
-def generate_response(prompt, engine_type="general", history=[], user_api_key=None, attachments=[], model=None):
+
+def _instruction(engine_type, summary=None):
+    instruction = get_system_instruction(engine_type)
+    if summary:
+        instruction += f"\n\n### EARLIER IN THIS CONVERSATION (summary):\n{summary}\n"
+    return instruction
+
+
+def _conversation(history, content_parts):
+    """
+    Gemini contents for a question: earlier turns (from vyom.core.context_builder) as
+    user/model messages, then the question itself. Back-to-back turns from one side are merged.
+    """
+    contents = []
+    for turn in history:
+        if not turn.get('content'):
+            continue
+        role = "model" if turn['role'] == 'assistant' else "user"
+        if contents and contents[-1].role == role:
+            contents[-1].parts.append(types.Part(text=turn['content']))
+        else:
+            contents.append(types.Content(role=role, parts=[types.Part(text=turn['content'])]))
+    return contents + content_parts
+
+
+SUMMARY_MODELS = ['gemini-2.0-flash', 'gemini-2.5-flash']
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a chat between a user and Vyom AI. Merge the new turns "
+    "into the current summary. Keep names, facts about the user, decisions, preferences and open "
+    "questions; drop pleasantries and formatting. Plain text, at most 150 words, no preamble."
+)
+
+
+def summarize_turns(previous, turns):
+    """Rolling-summary step for vyom.core.context_builder (system keys only; None if none worked)."""
+    if not api_keys:
+        return None
+    lines = "\n".join(f"{'User' if t['role'] == 'user' else 'Vyom'}: {t['content']}" for t in turns)
+    prompt = f"Current summary:\n{previous or '(none yet)'}\n\nNew turns:\n{lines}"
+    return _generate_scheduled(api_keys, SUMMARY_MODELS, [prompt], SUMMARY_INSTRUCTION, key_type="system")
+
+def generate_response(prompt, engine_type="general", history=[], user_api_key=None, attachments=[], model=None, summary=None):
 
     try:
 
@@ -93,100 +224,29 @@ def generate_response(prompt, engine_type="general", history=[], user_api_key=No
 
 
         # 1. Try with user provided key (BYOK) if exists
+        # If specific model requested, only that model is tried
+        models_to_try = [model] if model else FALLBACK_MODELS
+        # 🧠 Earlier turns and the chat summary (already fitted to the engine's token budget)
+        contents = _conversation(history, content_parts)
+        system_instruction = _instruction(engine_type, summary)
 
         if user_api_key:
-            # If specific model requested, try it first
-            models_to_try = [model] if model else FALLBACK_MODELS
-            
-            for model_id in models_to_try:
-
-                try:
-
-                    client = genai.Client(api_key=user_api_key)
-
-                    response = client.models.generate_content(
-
-                        model=model_id,
-
-                        contents=content_parts,
-
-                        config=types.GenerateContentConfig(
-
-                            system_instruction=get_system_instruction(engine_type),
-
-                            temperature=0.7
-
-                        )
-
-                    )
-
-                    if response and response.text:
-
-                        return response.text
-
-                except Exception as e:
-
-                    print(f"⚠️ User Key + Model {model_id} failed: {e}")
-
+            answer = _generate_scheduled([user_api_key], models_to_try, contents, system_instruction, key_type="user")
+            if answer:
+                return answer
             return "⚠️ Your personal API key failed. Please check it in settings."
 
 
 
-        # 2. Try with system keys pool (Rotation)
+        # 2. Try with system keys pool (healthiest key x model first)
 
         if not api_keys:
 
             return "⚠️ System API Keys missing. Please configure .env file."
 
-
-
-        for _ in range(len(api_keys)):
-
-            eff_key = get_active_key()
-
-            client = genai.Client(api_key=eff_key)
-
-            
-            # If specific model requested, try it first
-            models_to_try = [model] if model else FALLBACK_MODELS
-
-            for model_id in models_to_try:
-
-                try:
-
-                    # ⚡ Try model
-
-                    response = client.models.generate_content(
-
-                        model=model_id,
-
-                        contents=content_parts,
-
-                        config=types.GenerateContentConfig(
-
-                            system_instruction=get_system_instruction(engine_type),
-
-                            temperature=0.7
-
-                        )
-
-                    )
-
-                    if response and response.text:
-
-                        return response.text
-
-                except Exception as e:
-
-                    print(f"⚠️ Model {model_id} failed with current key: {e}")
-
-                    continue # Try next model
-
-            
-
-            # If all models failed for this key, rotate and try next key
-
-            rotate_key()
+        answer = _generate_scheduled(api_keys, models_to_try, contents, system_instruction, key_type="system")
+        if answer:
+            return answer
 
         
 
@@ -1,8 +1,8 @@
 import os
 from PIL import Image, ImageOps, ImageFilter, ImageEnhance
-from google import genai
 from google.genai import types
 from vyom.engines import image as image_gen_engine
+from vyom.core.client_pool import gemini_checkout
 import numpy as np
 
 # Configure API (Reuse the one from trinity or env)
@@ -78,8 +78,6 @@ class VisualStudio:
             if not effective_key:
                 return "⚠️ API Key missing."
 
-            client = genai.Client(api_key=effective_key)
-            
             # Step 1: Analyze all provided images
             model_id = 'gemini-2.5-flash'
             
@@ -92,10 +90,11 @@ class VisualStudio:
             content_list.append(f"\nUSER INSTRUCTION: {instruction}")
             content_list.append("\nTASK: Create a single, cohesive prompt that merges elements from these images according to the instruction. Describe style, lighting, composition, and specific object placements precisely.")
 
-            response = client.models.generate_content(
-                model=model_id,
-                contents=content_list
-            )
+            with gemini_checkout(effective_key, pinned=not user_api_key) as client:
+                response = client.models.generate_content(
+                    model=model_id,
+                    contents=content_list
+                )
             master_prompt = response.text
             
             # Step 2: Generate the final image using the Flux engine
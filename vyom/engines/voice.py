@@ -18,6 +18,8 @@ except ImportError:
     pygame = None
 
 from vyom import config
+from vyom.core.metrics import UPSTREAM_CALLS
+from vyom.core import tracing
 
 # Global Queue
 speech_queue = queue.Queue()
@@ -67,43 +69,49 @@ def worker():
         if data is None:
             break
         
-        text, lang, gender = data
-        success = False
-        
-        # 1. Try ElevenLabs (Premium Cloud Voice) if API Key exists
-        if config.ELEVENLABS_API_KEY:
-            try:
-                _speak_elevenlabs(text, lang, gender)
-                success = True
-            except Exception as e:
-                print(f"⚠️ ElevenLabs Voice Failed: {e}")
+        text, lang, gender, trace, queued_at = data
+        with tracing.linked(trace, "voice.speak", lang=lang, chars=len(text),
+                            queued_ms=round((time.time() - queued_at) * 1000, 2)) as span:
+            engine = _speak_any(text, lang, gender)
+            span.set(engine=engine)
 
-        # 2. Try Coqui TTS (Cloned/Human Voice) if in Default mode
-        if not success and config.MODE == 'default' and coqui_engine:
-            try:
-                _speak_coqui(text, lang)
-                success = True
-            except Exception as e:
-                print(f"⚠️ Coqui Voice Failed: {e}")
+        speech_queue.task_done()
 
-        # 3. Try Optimized Cloud Voice (Edge TTS)
-        if not success:
-            try:
-                _speak_edge(text, lang, gender)
-                success = True
-            except Exception as e:
-                print(f"⚠️ Cloud Voice Failed (Offline?): {e}")
-        
-        # 4. Fallback to System Voice if all else fails
-        if not success and pyttsx3_engine:
-            try:
-                print("   Using System Voice (Fallback)...")
-                pyttsx3_engine.say(text)
-                pyttsx3_engine.runAndWait()
-            except Exception as e:
-                print(f"❌ System Voice Error: {e}")
+def _speak_any(text, lang, gender):
+    """Tries each voice in order of quality. Returns the one that spoke (or None)."""
+    # 1. Try ElevenLabs (Premium Cloud Voice) if API Key exists
+    if config.ELEVENLABS_API_KEY:
+        try:
+            _speak_elevenlabs(text, lang, gender)
+            return "elevenlabs"
+        except Exception as e:
+            print(f"⚠️ ElevenLabs Voice Failed: {e}")
 
-        speech_queue.task_done()
+    # 2. Try Coqui TTS (Cloned/Human Voice) if in Default mode
+    if config.MODE == 'default' and coqui_engine:
+        try:
+            _speak_coqui(text, lang)
+            return "coqui"
+        except Exception as e:
+            print(f"⚠️ Coqui Voice Failed: {e}")
+
+    # 3. Try Optimized Cloud Voice (Edge TTS)
+    try:
+        _speak_edge(text, lang, gender)
+        return "edge"
+    except Exception as e:
+        print(f"⚠️ Cloud Voice Failed (Offline?): {e}")
+    
+    # 4. Fallback to System Voice if all else fails
+    if pyttsx3_engine:
+        try:
+            print("   Using System Voice (Fallback)...")
+            pyttsx3_engine.say(text)
+            pyttsx3_engine.runAndWait()
+            return "system"
+        except Exception as e:
+            print(f"❌ System Voice Error: {e}")
+    return None
 
 def _clean_text(text):
     """Removes markdown and special characters for cleaner speech."""
@@ -145,7 +153,8 @@ def _speak_elevenlabs(text, lang, gender):
     }
 
     print(f"   🎙️ ElevenLabs Voice: {voice_id} (Lang: {lang})")
-    response = requests.post(url, json=data, headers=headers)
+    with UPSTREAM_CALLS.time(service="elevenlabs"):
+        response = requests.post(url, json=data, headers=headers)
     
     if response.status_code == 200:
         output_file = "temp_ai_eleven.mp3"
@@ -291,4 +300,4 @@ def speak_text(text: str, gender: str = None):
     # Use global/user gender if not provided
     # (In a real app, this would come from the current user session)
     
-    speech_queue.put((text, lang, gender))
+    speech_queue.put((text, lang, gender, tracing.current(), time.time()))